@@ -25,4 +25,14 @@ ADD COLUMN quality_status VARCHAR,
 ADD COLUMN quality_confidence FLOAT,
 ADD COLUMN last_digit_color VARCHAR,
 ADD COLUMN color_confidence FLOAT,
-ADD COLUMN processing_time FLOAT; 
\ No newline at end of file
+ADD COLUMN processing_time FLOAT;
+
+-- How the last-digit colour was decided (hsv or cnn) and the HSV comparison's answer
+ALTER TABLE flowvision_extraction_data
+ADD COLUMN color_method VARCHAR,
+ADD COLUMN hsv_last_digit_color VARCHAR,
+ADD COLUMN hsv_color_confidence FLOAT;
+
+-- Pre-screen rule that rejected the image (TOO_SMALL, TOO_DARK, OVEREXPOSED, BLURRY)
+ALTER TABLE flowvision_extraction_data
+ADD COLUMN reason_code VARCHAR;
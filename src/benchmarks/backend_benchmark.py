@@ -0,0 +1,95 @@
+"""
+Throughput of the PyTorch models against their ONNX Runtime exports.
+
+Loads each model from `models.*` and from `inference.onnx.models.*` (written
+by tools.export_onnx) and runs both on the same synthetic meter images in
+batches of --batch-sizes images, the classifiers through predict_batch. ONNX sessions use the thread
+counts of the config unless --intra-op-threads is given, one run per value.
+Reports images/sec (best of --repeat) per model, backend and thread count.
+
+Run from the repository root:
+    PYTHONPATH=src python -m benchmarks.backend_benchmark
+    PYTHONPATH=src python -m benchmarks.backend_benchmark --intra-op-threads 1 2 4 --output backends.json
+"""
+import json
+import argparse
+
+import cv2
+import torch
+
+from conf.config import Config
+from benchmarks.inference_benchmark import measure
+from benchmarks.synthetic import synthetic_meter
+from service.vision.inference_utils import enhance_image, extract_digit_image, predict_batch
+from service.vision.model_registry import ModelRegistry
+
+
+def benchmark_inputs(count: int, seed: int) -> dict:
+    """Inputs in the form each model receives them in the service."""
+    meters = [synthetic_meter(800, 450, seed=seed + i) for i in range(count)]
+    return {
+        "bfm_classification": [cv2.cvtColor(meter.image, cv2.COLOR_BGR2RGB) for meter in meters],
+        "color_classification": [
+            cv2.cvtColor(extract_digit_image(meter.image, meter.digit_boxes[-1]), cv2.COLOR_BGR2RGB)
+            for meter in meters
+        ],
+        "individual_numbers": [enhance_image(meter.image) for meter in meters],
+    }
+
+
+def load(config: Config, name: str, backend: str, intra_op_threads: int | None):
+    if backend == "torch":
+        return ModelRegistry.loaders[name](config.find(f"models.{name}"))
+    return ModelRegistry.onnx_loaders[name](
+        config.find(f"inference.onnx.models.{name}"),
+        intra_op_threads=intra_op_threads if intra_op_threads is not None else config.find("inference.onnx.intra_op_threads", default=0),
+        inter_op_threads=config.find("inference.onnx.inter_op_threads", default=0)
+    )
+
+
+def run_model(model, name: str, backend: str, images: list, batch_size: int):
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+    if name != "individual_numbers":
+        return lambda: [predict_batch(model, batch) for batch in batches]
+    # Ultralytics logs every call unless told otherwise
+    kwargs = {"verbose": False} if backend == "torch" else {}
+    return lambda: [model(batch, **kwargs) for batch in batches]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=list(ModelRegistry.loaders))
+    parser.add_argument("--images", type=int, default=16, help="Images per timed call")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8], help="Images per forward pass")
+    parser.add_argument("--intra-op-threads", type=int, nargs="+", help="ONNX Runtime intra-op threads to try")
+    parser.add_argument("--torch-threads", type=int, help="torch.set_num_threads for the PyTorch runs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    config = Config()
+    if args.torch_threads:
+        torch.set_num_threads(args.torch_threads)
+    inputs = benchmark_inputs(args.images, args.seed)
+
+    runs = [("torch", None)] + [("onnx", threads) for threads in (args.intra_op_threads or [None])]
+    results = {}
+    print(f"{'model':<22} {'backend':<8} {'threads':>7} {'batch':>5} {'images/s':>10} {'ms/image':>9}")
+    for name in args.models:
+        for backend, threads in runs:
+            model = load(config, name, backend, threads)
+            for batch_size in args.batch_sizes:
+                result = measure(run_model(model, name, backend, inputs[name], batch_size), repeat=args.repeat, min_time=0)
+                images_per_sec = result["ops_per_sec"] * args.images
+                label = str((args.torch_threads if backend == "torch" else threads) or "default")
+                results[f"{name}/{backend}/{label}/{batch_size}"] = {"images_per_sec": images_per_sec}
+                print(f"{name:<22} {backend:<8} {label:>7} {batch_size:>5} {images_per_sec:>10.1f} {1000 / images_per_sec:>9.2f}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"images": args.images, "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
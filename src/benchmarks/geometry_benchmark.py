@@ -0,0 +1,93 @@
+"""
+Micro-benchmark of oriented-box IoU and NMS for digit detections.
+
+Compares the raster implementation that inference_utils used before (two
+1000x1000 masks per pair, pairwise loop) with the analytic vectorized version
+in service.vision.geometry, on synthetic meter-digit detections of 10-40 boxes.
+
+Run from the repository root:
+    PYTHONPATH=src python -m benchmarks.geometry_benchmark
+"""
+import argparse
+import timeit
+
+import cv2
+import numpy as np
+
+from service.vision.geometry import greedy_nms
+
+
+def raster_iou(box1, box2):
+    """IoU as previously computed by inference_utils.calculate_iou"""
+    box1_contour = box1.reshape(-1, 1, 2).astype(np.int32)
+    box2_contour = box2.reshape(-1, 1, 2).astype(np.int32)
+    box1_mask = np.zeros((1000, 1000), dtype=np.uint8)
+    box2_mask = np.zeros((1000, 1000), dtype=np.uint8)
+    cv2.fillPoly(box1_mask, [box1_contour], 1)
+    cv2.fillPoly(box2_mask, [box2_contour], 1)
+    intersection = np.logical_and(box1_mask, box2_mask).sum()
+    union = np.logical_or(box1_mask, box2_mask).sum()
+    if union == 0:
+        return 0
+    return intersection / union
+
+
+def raster_nms(boxes, confidences, iou_threshold):
+    """Greedy NMS as previously done by inference_utils.remove_overlapping_boxes"""
+    box_data = sorted(zip(range(len(boxes)), boxes, confidences), key=lambda x: x[2], reverse=True)
+    keep = []
+    while box_data:
+        index, current_box, _ = box_data.pop(0)
+        keep.append(index)
+        box_data = [item for item in box_data if raster_iou(current_box, item[1]) < iou_threshold]
+    return keep
+
+
+def synthetic_detections(num_boxes, rng):
+    """
+    Digit boxes laid out in a row like a meter counter, with jittered duplicate
+    detections of the same digits so that NMS has real work to do
+    """
+    num_digits = max(1, min(8, num_boxes // 2))
+    digit_width, digit_height = 38, 62
+    origin_x, origin_y = rng.uniform(150, 400), rng.uniform(250, 500)
+    angle = rng.uniform(-8, 8)
+
+    boxes = []
+    for i in range(num_boxes):
+        digit = i % num_digits
+        jitter = rng.normal(0, 4 if i >= num_digits else 0.5, size=2)
+        center = (origin_x + digit * (digit_width + 8) + jitter[0], origin_y + jitter[1])
+        size = (digit_width * rng.uniform(0.85, 1.15), digit_height * rng.uniform(0.85, 1.15))
+        points = cv2.boxPoints((center, size, angle + rng.normal(0, 2)))
+        boxes.append(points.astype(np.int32))
+    confidences = rng.uniform(0.3, 1.0, size=num_boxes)
+    return np.stack(boxes), confidences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 20, 30, 40])
+    parser.add_argument("--iou-threshold", type=float, default=0.3)
+    parser.add_argument("--samples", type=int, default=50, help="Random detection sets checked for agreement")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':>5} {'raster ms':>10} {'analytic ms':>12} {'speedup':>8} {'same keep':>10}")
+    for num_boxes in args.sizes:
+        samples = [synthetic_detections(num_boxes, rng) for _ in range(args.samples)]
+        agree = sum(
+            sorted(raster_nms(list(boxes), list(conf), args.iou_threshold)) == sorted(greedy_nms(boxes, conf, args.iou_threshold).tolist())
+            for boxes, conf in samples
+        )
+
+        boxes, conf = samples[0]
+        raster = min(timeit.repeat(lambda: raster_nms(list(boxes), list(conf), args.iou_threshold), number=1, repeat=args.repeat))
+        number = 20
+        analytic = min(timeit.repeat(lambda: greedy_nms(boxes, conf, args.iou_threshold), number=number, repeat=args.repeat)) / number
+        print(f"{num_boxes:>5} {raster * 1000:>10.2f} {analytic * 1000:>12.3f} {raster / analytic:>7.0f}x {agree:>5}/{len(samples)}")
+
+
+if __name__ == "__main__":
+    main()
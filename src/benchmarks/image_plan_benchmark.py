@@ -0,0 +1,127 @@
+"""
+ImagePlan preprocessing against transposing, resizing and cropping the whole image.
+
+`legacy_preprocess_image` below is the previous ImageService.preprocess_image:
+decode, ImageOps.exif_transpose, resize_image, then crop_image. The corpus
+is synthetic photos of every EXIF orientation (none and 1-8), as landscape
+and portrait JPEGs of 3-12 MP, a PNG and a photo already within the resize
+limits. For each the planned output must have the same size, and its pixels
+may differ by at most --max-mean-diff on average and --max-diff at the 99.9th
+percentile (resampling rounding only); the exit status is 1 otherwise. Both
+paths decode JPEGs at the same reduced scale, or both at full scale with
+--full-decode. The speed of both paths is reported per photo size.
+
+Run from the repository root:
+    PYTHONPATH=src python -m benchmarks.image_plan_benchmark
+"""
+import sys
+import argparse
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps, ExifTags
+
+from conf.config import Config
+from benchmarks.inference_benchmark import measure
+from service.api.image_service import preprocessing_service
+from benchmarks.synthetic import PHOTO_SIZES, synthetic_meter, synthetic_photo
+from service.api.image_service import ImageService
+from service.vision.image_frame import ImageFrame
+from service.vision.image_plan import ImagePlan
+
+
+ORIENTATIONS = (None, 1, 2, 3, 4, 5, 6, 7, 8)
+
+
+def legacy_preprocess_image(service: ImageService, image_bytes: bytes) -> ImageFrame:
+    image = Image.open(BytesIO(image_bytes))
+    # Upright size of the source, taken before a reduced-scale decode changes it
+    orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+    source_size = image.size[::-1] if orientation in (5, 6, 7, 8) else image.size
+    if service.reduced_decode:
+        # The reduced scale the plan decodes at
+        ImagePlan.for_image(image, crop=(0, 0, 1, 1), max_width=service.resizing_width, max_height=service.resizing_height).draft(image)
+    image.load()
+    image = ImageOps.exif_transpose(image)
+    resized_image = service.resize_image(image, max_height=service.resizing_height, max_width=service.resizing_width)
+    return ImageFrame.from_pil(service.crop_image(resized_image), source_size=source_size)
+
+
+def corpus(megapixels: list, seed: int) -> list:
+    """(name, image bytes) of every photo and orientation."""
+    photos = []
+    for size in megapixels:
+        photo = synthetic_photo(size, seed=seed)
+        portrait = photo.image.transpose(1, 0, 2).copy()
+        for orientation in ORIENTATIONS:
+            photos.append((f"{size}MP orientation={orientation}", photo.jpeg_bytes(exif_orientation=orientation)))
+            photos.append((f"{size}MP portrait orientation={orientation}", _jpeg(portrait, orientation)))
+
+    small = synthetic_meter(640, 480, seed=seed)
+    for orientation in ORIENTATIONS:
+        photos.append((f"640x480 orientation={orientation}", small.jpeg_bytes(exif_orientation=orientation)))
+    png = BytesIO()
+    Image.fromarray(cv2.cvtColor(synthetic_photo(min(megapixels), seed=seed).image, cv2.COLOR_BGR2RGB)).save(png, format="PNG")
+    photos.append(("PNG", png.getvalue()))
+    return photos
+
+
+def _jpeg(image_bgr: np.ndarray, orientation: int | None) -> bytes:
+    buffer = BytesIO()
+    image = Image.fromarray(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB))
+    if orientation is None:
+        image.save(buffer, format="JPEG", quality=90)
+    else:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        image.save(buffer, format="JPEG", quality=90, exif=exif)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=int, nargs="+", default=sorted(PHOTO_SIZES), choices=sorted(PHOTO_SIZES))
+    parser.add_argument("--full-decode", action="store_true", help="Decode JPEGs at full scale in both paths")
+    parser.add_argument("--max-mean-diff", type=float, default=0.5)
+    parser.add_argument("--max-diff", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timed round")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    service = preprocessing_service(Config())
+    service.reduced_decode = not args.full_decode
+
+    failures = []
+    print(f"{'photo':<30} {'output':>9} {'mean diff':>9} {'p99.9':>6}")
+    for name, image_bytes in corpus(args.megapixels, args.seed):
+        expected = legacy_preprocess_image(service, image_bytes)
+        planned = service.preprocess_image(image_bytes)
+        if planned.size != expected.size or planned.source_size != expected.source_size:
+            failures.append(f"{name}: {planned.size} from {planned.source_size}, expected {expected.size} from {expected.source_size}")
+            continue
+        diff = np.abs(planned.pixels.astype(np.int16) - expected.pixels.astype(np.int16))
+        mean_diff, high_diff = float(diff.mean()), int(np.percentile(diff, 99.9))
+        print(f"{name:<30} {planned.width:>4}x{planned.height:<4} {mean_diff:>9.3f} {high_diff:>6}")
+        if mean_diff > args.max_mean_diff or high_diff > args.max_diff:
+            failures.append(f"{name}: mean difference {mean_diff:.3f}, p99.9 {high_diff}")
+
+    print(f"\n{'photo':<10} {'legacy ms':>10} {'planned ms':>11} {'speedup':>8}")
+    for megapixels in args.megapixels:
+        image_bytes = synthetic_photo(megapixels, seed=args.seed).jpeg_bytes(exif_orientation=6)
+        legacy = measure(lambda: legacy_preprocess_image(service, image_bytes), repeat=args.repeat, min_time=args.min_time)
+        planned = measure(lambda: service.preprocess_image(image_bytes), repeat=args.repeat, min_time=args.min_time)
+        print(
+            f"{megapixels:>2} MP     {1000 / legacy['ops_per_sec']:>10.2f} {1000 / planned['ops_per_sec']:>11.2f} "
+            f"{planned['ops_per_sec'] / legacy['ops_per_sec']:>7.2f}x"
+        )
+
+    if failures:
+        print("\nNOT EQUIVALENT to legacy_preprocess_image:\n" + "\n".join(failures))
+        sys.exit(1)
+    print("\nAll planned outputs equivalent to legacy_preprocess_image")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Micro-benchmarks of the extraction hot path on synthetic meter photos.
+
+Every case runs on synthetic phone photos of 3-12 MP. Photo-level steps
+(preprocess, resize, crop) get the full photo; the steps that run after
+preprocessing in the service get the frame preprocessing produces from it.
+Models are replaced by stand-ins from benchmarks.synthetic, so no weights
+or GPU are needed. The classify cases run the production FastAI path of
+predict_batch (transforms, batching, softmax) around a tiny CNN, so they
+leave out the cost of the trained network itself.
+
+Reports ops/sec (best of --repeat) and the peak memory allocated during one
+call, as traced by tracemalloc (NumPy and OpenCV arrays are traced; PIL's
+internal image buffers are not). Results can be written as JSON and compared
+with a baseline file; the exit status is 1 if any case regressed by more
+than --tolerance, which is what CI checks.
+
+Run from the repository root:
+    PYTHONPATH=src python -m benchmarks.inference_benchmark
+    PYTHONPATH=src python -m benchmarks.inference_benchmark --output bench.json
+    PYTHONPATH=src python -m benchmarks.inference_benchmark --baseline bench.json
+"""
+import sys
+import copy
+import json
+import time
+import timeit
+import argparse
+import platform
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from conf.config import Config
+from benchmarks.synthetic import PHOTO_SIZES, StandInDetector, StandInLearner, synthetic_meter, synthetic_photo
+from service.api.image_service import ImageService, preprocessing_service
+from service.vision.inference_utils import (
+    calculate_iou,
+    classify_bfm_image,
+    classify_color_image,
+    direct_recognize_meter_reading,
+    enhance_image,
+    extract_digit_image,
+    is_last_digit_color_different_hsv,
+    remove_overlapping_boxes,
+    sort_boxes_by_position
+)
+
+
+def build_cases(megapixels: int, service: ImageService, seed: int = 0) -> dict:
+    """Benchmark cases for one photo size as {name: (input description, callable)}."""
+    photo = synthetic_photo(megapixels, seed=seed)
+    photo_bytes = photo.jpeg_bytes()
+    photo_pil = Image.fromarray(cv2.cvtColor(photo.image, cv2.COLOR_BGR2RGB))
+    resized = service.resize_image(photo_pil, max_height=service.resizing_height, max_width=service.resizing_width)
+    full_decode_service = copy.copy(service)
+    full_decode_service.reduced_decode = False
+
+    # What the later steps see in the service, rendered again so the digit boxes are known
+    frame = service.preprocess_image(photo_bytes)
+    meter = synthetic_meter(frame.width, frame.height, seed=seed)
+    frame_bgr = meter.image
+    frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+
+    detector = StandInDetector(meter.digit_boxes, seed=seed)
+    bfm_model = StandInLearner(["bad", "good"])
+    color_model = StandInLearner(["black", "blue", "red"])
+
+    boxes = [box.astype(np.int32) for box in detector.boxes]
+    classes = list(detector.classes)
+    confidences = list(detector.confidences)
+    digit_crops = [extract_digit_image(frame_bgr, box) for box in meter.digit_boxes[-3:]]
+
+    photo_input = f"{photo.image.shape[1]}x{photo.image.shape[0]}"
+    frame_input = f"{frame.width}x{frame.height}"
+    return {
+        "preprocess_image": (photo_input, lambda: service.preprocess_image(photo_bytes)),
+        "preprocess_image_full_decode": (photo_input, lambda: full_decode_service.preprocess_image(photo_bytes)),
+        "resize_image": (photo_input, lambda: service.resize_image(photo_pil, max_height=service.resizing_height, max_width=service.resizing_width)),
+        "crop_image": (f"{resized.width}x{resized.height}", lambda: service.crop_image(resized)),
+        "enhance_image": (frame_input, lambda: enhance_image(frame_bgr)),
+        "calculate_iou": ("2 boxes", lambda: calculate_iou(boxes[0], boxes[len(meter.digit_boxes)])),
+        "remove_overlapping_boxes": (f"{len(boxes)} boxes", lambda: remove_overlapping_boxes(boxes, classes, confidences, iou_threshold=0.3)),
+        "sort_boxes_by_position": (f"{len(boxes)} boxes", lambda: sort_boxes_by_position(boxes, classes)),
+        "extract_digit_image": (frame_input, lambda: extract_digit_image(frame_bgr, meter.digit_boxes[-1])),
+        "is_last_digit_color_different_hsv": ("3 digits", lambda: is_last_digit_color_different_hsv(digit_crops)),
+        "classify_bfm_image": (frame_input, lambda: classify_bfm_image(frame_rgb, bfm_model)),
+        "classify_color_image": ("1 digit", lambda: classify_color_image(digit_crops[-1], color_model)),
+        "direct_recognize_meter_reading": (frame_input, lambda: direct_recognize_meter_reading(frame_bgr, detector)),
+    }
+
+
+def measure(fn, repeat: int, min_time: float) -> dict:
+    """
+    Args:
+        fn: Callable to benchmark
+        repeat: Number of timed rounds; the fastest is reported
+        min_time: Minimum duration of one round in seconds
+
+    Returns:
+        Dictionary with ops_per_sec and peak_alloc_bytes
+    """
+    fn()
+
+    # Calls per round so that one round takes at least min_time
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+    best = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"ops_per_sec": 1.0 / best, "peak_alloc_bytes": peak - baseline}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Cases slower or allocating more than the baseline by more than `tolerance`."""
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        if result["ops_per_sec"] < reference["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{key}: {result['ops_per_sec']:.1f} ops/s vs {reference['ops_per_sec']:.1f} in baseline")
+        if result["peak_alloc_bytes"] > reference["peak_alloc_bytes"] * (1 + tolerance):
+            regressions.append(f"{key}: {result['peak_alloc_bytes'] / 1024:.0f} KiB peak vs {reference['peak_alloc_bytes'] / 1024:.0f} in baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=int, nargs="+", default=sorted(PHOTO_SIZES), choices=sorted(PHOTO_SIZES))
+    parser.add_argument("--cases", nargs="+", help="Only run these cases")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timed round")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression against the baseline")
+    args = parser.parse_args()
+
+    # Keep OpenCV single-threaded so numbers are comparable between machines
+    cv2.setNumThreads(1)
+    service = preprocessing_service(Config())
+
+    results = {}
+    print(f"{'case':<34} {'MP':>3} {'input':>12} {'ops/s':>10} {'ms/op':>9} {'peak KiB':>10}")
+    for megapixels in args.megapixels:
+        for name, (description, fn) in build_cases(megapixels, service, seed=args.seed).items():
+            if args.cases and name not in args.cases:
+                continue
+            result = measure(fn, repeat=args.repeat, min_time=args.min_time)
+            results[f"{name}@{megapixels}MP"] = result
+            print(f"{name:<34} {megapixels:>3} {description:>12} {result['ops_per_sec']:>10.1f} {1000 / result['ops_per_sec']:>9.3f} {result['peak_alloc_bytes'] / 1024:>10.0f}")
+
+    if args.output:
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "numpy": np.__version__,
+                "opencv": cv2.__version__,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+ImagePreprocessor against the enhance_image function it replaced.
+
+`legacy_enhance_image` below is the previous implementation, kept for this
+comparison: it read the config, built a CLAHE object and computed an unused
+adaptive threshold on every call. Both run on the frames the service
+produces from synthetic 3-12 MP photos and on the full-resolution photos.
+Every output of the preprocessor must be pixel-identical to the legacy
+output, also when called from several threads at once; the exit status is 1
+otherwise.
+
+Run from the repository root:
+    PYTHONPATH=src python -m benchmarks.preprocessor_benchmark
+"""
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from conf.config import Config
+from benchmarks.inference_benchmark import measure
+from service.api.image_service import preprocessing_service
+from benchmarks.synthetic import PHOTO_SIZES, synthetic_photo
+from service.vision.image_preprocessor import ImagePreprocessor
+
+
+def legacy_enhance_image(image, config: Config):
+    enhance_config = config.find("image_enhancement")
+    clahe_clip = enhance_config['clahe_clip_limit']
+    clahe_grid = tuple(enhance_config['clahe_tile_grid_size'])
+    sharp_alpha = enhance_config['sharpening_alpha']
+    sharp_beta = enhance_config['sharpening_beta']
+    color_alpha = enhance_config['color_boost_alpha']
+    color_beta = enhance_config['color_boost_beta']
+
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    h, s, v = cv2.split(hsv)
+    cv2.adaptiveThreshold(v, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    gaussian = cv2.GaussianBlur(v, (0, 0), 3.0)
+    sharpened_v = cv2.addWeighted(v, sharp_alpha, gaussian, sharp_beta, 0)
+    clahe = cv2.createCLAHE(clipLimit=clahe_clip, tileGridSize=clahe_grid)
+    enhanced_v = clahe.apply(sharpened_v)
+    enhanced_hsv = cv2.merge([h, s, enhanced_v])
+    enhanced = cv2.cvtColor(enhanced_hsv, cv2.COLOR_HSV2BGR)
+    return cv2.convertScaleAbs(enhanced, alpha=color_alpha, beta=color_beta)
+
+
+def concurrent_outputs(preprocessor: ImagePreprocessor, images: list, threads: int) -> list:
+    """Enhance every image `threads` times from as many threads, interleaving frame sizes."""
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(preprocessor.enhance, images * threads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=int, nargs="+", default=sorted(PHOTO_SIZES), choices=sorted(PHOTO_SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timed round")
+    parser.add_argument("--threads", type=int, default=4, help="Threads for the concurrent identity check")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+    config = Config()
+    service = preprocessing_service(config)
+    preprocessor = ImagePreprocessor(config)
+
+    inputs = []
+    for megapixels in args.megapixels:
+        photo = synthetic_photo(megapixels, seed=args.seed)
+        frame = service.preprocess_image(photo.jpeg_bytes())
+        inputs.append((f"frame@{megapixels}MP", frame.bgr()))
+        inputs.append((f"photo@{megapixels}MP", photo.image))
+
+    mismatches = []
+    print(f"{'input':<14} {'size':>10} {'legacy ms':>10} {'new ms':>9} {'speedup':>8} {'legacy KiB':>11} {'new KiB':>9}")
+    for name, image in inputs:
+        expected = legacy_enhance_image(image, config)
+        if not np.array_equal(preprocessor.enhance(image), expected):
+            mismatches.append(name)
+
+        legacy = measure(lambda: legacy_enhance_image(image, config), repeat=args.repeat, min_time=args.min_time)
+        new = measure(lambda: preprocessor.enhance(image), repeat=args.repeat, min_time=args.min_time)
+        print(
+            f"{name:<14} {image.shape[1]:>5}x{image.shape[0]:<4} {1000 / legacy['ops_per_sec']:>10.3f} {1000 / new['ops_per_sec']:>9.3f} "
+            f"{new['ops_per_sec'] / legacy['ops_per_sec']:>7.2f}x {legacy['peak_alloc_bytes'] / 1024:>11.0f} {new['peak_alloc_bytes'] / 1024:>9.0f}"
+        )
+
+    images = [image for _, image in inputs]
+    expected = [legacy_enhance_image(image, config) for image in images] * args.threads
+    for (name, _), output, reference in zip(inputs * args.threads, concurrent_outputs(preprocessor, images, args.threads), expected):
+        if not np.array_equal(output, reference):
+            mismatches.append(f"{name} ({args.threads} threads)")
+
+    if mismatches:
+        print(f"NOT IDENTICAL to legacy_enhance_image: {', '.join(sorted(set(mismatches)))}")
+        sys.exit(1)
+    print(f"All outputs identical to legacy_enhance_image, including from {args.threads} threads")
+
+
+if __name__ == "__main__":
+    main()
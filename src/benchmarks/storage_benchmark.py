@@ -0,0 +1,118 @@
+"""
+Upload throughput of StorageService against the presigned-URL PUT it replaced.
+
+`legacy_store_image` below is the previous upload: a presigned PUT URL from
+the boto3 client, then an unpooled `requests.put`. Both upload synthetic
+meter photos of 3-12 MP and a --large-mb payload, above the multipart
+threshold, to a local S3StandIn from --concurrency worker threads, as the
+API's upload threads do. Reports uploads/sec and MB/sec per payload and
+concurrency. The stand-in runs in the same process, so with many threads
+both paths also compete with it for the GIL.
+
+The stand-in emulates a remote store with --rtt-ms per request and twice
+that per new connection (TCP and TLS handshakes), since a local server has
+no latency for pooled connections to save. botocore also signs the payload
+(SHA-256) over plain HTTP, which it skips over HTTPS, so the pooled path
+does more hashing here than against S3.
+
+Every object uploaded by StorageService must read back identical through
+the presigned GET URL clients receive, and the large payload must have gone
+through a multipart upload; the exit status is 1 otherwise.
+
+Run from the repository root:
+    PYTHONPATH=src python -m benchmarks.storage_benchmark
+    PYTHONPATH=src python -m benchmarks.storage_benchmark --rtt-ms 0 --concurrency 1 8 32 --uploads 64
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from conf.config import Config
+from benchmarks.synthetic import PHOTO_SIZES, synthetic_photo
+from loadtest.stand_ins import S3StandIn
+
+
+def legacy_store_image(service, image_bytes: bytes, content_type: str, object_key: str):
+    upload_url = service.s3_client.generate_presigned_url(
+        'put_object',
+        Params={'Bucket': service.bucket_name, 'Key': object_key, 'ContentType': content_type},
+        ExpiresIn=service.presigned_url_expiration
+    )
+    response = requests.put(url=upload_url, data=image_bytes, headers={'Content-Type': content_type})
+    if response.status_code != 200:
+        raise RuntimeError(f"Upload failed: {response.status_code} {response.reason}")
+
+
+def run(store, payload: bytes, uploads: int, concurrency: int, prefix: str) -> float:
+    """Seconds taken to upload `payload` `uploads` times from `concurrency` threads."""
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: store(payload, "image/jpeg", f"{prefix}-{i}.jpg"), range(uploads)))
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=int, nargs="+", default=sorted(PHOTO_SIZES), choices=sorted(PHOTO_SIZES))
+    parser.add_argument("--large-mb", type=float, default=24.0, help="Size of the payload above the multipart threshold")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--uploads", type=int, default=32, help="Uploads per payload and concurrency")
+    parser.add_argument("--rtt-ms", type=float, default=20.0, help="Emulated round-trip time to the store")
+    args = parser.parse_args()
+
+    s3 = S3StandIn(round_trip_time=args.rtt_ms / 1000).start()
+    os.environ["S3_ENDPOINT_URL"] = s3.url
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "stand-in")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "stand-in")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    # Imported once the endpoint is set, as the app does at startup
+    from service.api.storage_service import StorageService
+    service = StorageService(Config())
+
+    payloads = {f"{megapixels} MP": synthetic_photo(megapixels).jpeg_bytes() for megapixels in args.megapixels}
+    large_bytes = int(args.large_mb * 1024 * 1024)
+    payloads[f"{args.large_mb:g} MB"] = np.random.default_rng(0).integers(0, 256, large_bytes, dtype=np.uint8).tobytes()
+    stores = {
+        "legacy": lambda payload, content_type, key: legacy_store_image(service, payload, content_type, key),
+        "pooled": lambda payload, content_type, key: service.store_image(payload, content_type, key),
+    }
+
+    failures = []
+    print(f"{'payload':<9} {'size MB':>8} {'threads':>7} {'legacy/s':>9} {'pooled/s':>9} {'legacy MB/s':>12} {'pooled MB/s':>12} {'speedup':>8}")
+    for name, payload in payloads.items():
+        size_mb = len(payload) / (1024 * 1024)
+        for concurrency in args.concurrency:
+            seconds = {}
+            for store_name, store in stores.items():
+                # One warm-up upload so both start with the client and connections set up
+                store(payload, "image/jpeg", f"warmup-{store_name}.jpg")
+                seconds[store_name] = run(store, payload, args.uploads, concurrency, prefix=f"{store_name}-{name}-{concurrency}")
+            legacy_rate, pooled_rate = args.uploads / seconds["legacy"], args.uploads / seconds["pooled"]
+            print(
+                f"{name:<9} {size_mb:>8.2f} {concurrency:>7} {legacy_rate:>9.1f} {pooled_rate:>9.1f} "
+                f"{legacy_rate * size_mb:>12.1f} {pooled_rate * size_mb:>12.1f} {pooled_rate / legacy_rate:>7.2f}x"
+            )
+
+        # Clients read the image back through the presigned GET URL
+        key = f"pooled-{name}-{args.concurrency[-1]}-0.jpg"
+        response = requests.get(service.generate_presigned_download_url(object_key=key))
+        if response.status_code != 200 or response.content != payload:
+            failures.append(f"{name}: presigned GET returned {response.status_code} with {len(response.content)} bytes")
+
+    if s3.multipart_uploads == 0:
+        failures.append(f"no multipart upload for {args.large_mb:g} MB (threshold {service.transfer_config.multipart_threshold} bytes)")
+    s3.stop()
+
+    if failures:
+        print("\nFAILED:\n" + "\n".join(failures))
+        sys.exit(1)
+    print(f"\nAll uploads read back through presigned GET URLs; {s3.multipart_uploads} multipart uploads")
+
+
+if __name__ == "__main__":
+    main()
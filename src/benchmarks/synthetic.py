@@ -0,0 +1,188 @@
+"""
+Synthetic meter photos and lightweight stand-in models for benchmarks.
+
+The stand-ins have the interfaces inference_utils relies on (a FastAI
+learner's data loaders and model, and an Ultralytics OBB model call) but no
+trained weights, so benchmarks run on a CPU-only machine without the
+production models.
+"""
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+# Phone photo sizes in megapixels and their (width, height) at 4:3
+PHOTO_SIZES = {
+    3: (2048, 1536),
+    8: (3264, 2448),
+    12: (4000, 3000),
+}
+
+
+class SyntheticMeter:
+    """A rendered meter photo with the ground truth of its digits."""
+
+    def __init__(self, image: np.ndarray, digit_boxes: np.ndarray, reading: str):
+        self.image = image              # BGR uint8
+        self.digit_boxes = digit_boxes  # (N, 4, 2) int32 corner points, left to right
+        self.reading = reading
+
+    def jpeg_bytes(self, quality: int = 90, exif_orientation: int | None = None) -> bytes:
+        image = Image.fromarray(cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB))
+        buffer = BytesIO()
+        if exif_orientation is None:
+            image.save(buffer, format="JPEG", quality=quality)
+        else:
+            exif = Image.Exif()
+            exif[0x0112] = exif_orientation
+            image.save(buffer, format="JPEG", quality=quality, exif=exif)
+        return buffer.getvalue()
+
+
+def synthetic_meter(width: int, height: int, num_digits: int = 8, seed: int = 0) -> SyntheticMeter:
+    """
+    Render a meter-like photo: a noisy, lit background with a dark counter
+    window in the middle, white digits and a red last digit, slightly rotated.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Smooth lighting gradient plus sensor noise
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    base = 90 + 70 * x + 40 * y
+    image = np.repeat(base[..., None], 3, axis=2) + rng.normal(0, 12, size=(height, width, 3)).astype(np.float32)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+
+    # Counter window
+    digit_height = height // 10
+    digit_width = int(digit_height * 0.6)
+    gap = digit_width // 4
+    window_width = num_digits * (digit_width + gap) + gap
+    left = (width - window_width) // 2
+    top = (height - digit_height) // 2
+    cv2.rectangle(image, (left, top - gap), (left + window_width, top + digit_height + gap), (25, 25, 25), thickness=-1)
+
+    digits = rng.integers(0, 10, size=num_digits)
+    font_scale = digit_height / 30
+    thickness = max(2, digit_height // 15)
+    boxes = []
+    for i, digit in enumerate(digits):
+        x0 = left + gap + i * (digit_width + gap)
+        color = (40, 40, 220) if i == num_digits - 1 else (235, 235, 235)
+        cv2.putText(image, str(digit), (x0, top + digit_height), cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness, cv2.LINE_AA)
+        boxes.append([[x0, top], [x0 + digit_width, top], [x0 + digit_width, top + digit_height], [x0, top + digit_height]])
+
+    # Slight camera rotation, applied to the photo and its digit boxes
+    angle = rng.uniform(-4, 4)
+    rotation = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    image = cv2.warpAffine(image, rotation, (width, height), borderMode=cv2.BORDER_REFLECT)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    boxes = boxes @ rotation[:, :2].T + rotation[:, 2]
+
+    return SyntheticMeter(image, np.rint(boxes).astype(np.int32), "".join(str(d) for d in digits))
+
+
+def synthetic_photo(megapixels: int, seed: int = 0) -> SyntheticMeter:
+    width, height = PHOTO_SIZES[megapixels]
+    return synthetic_meter(width, height, seed=seed)
+
+
+class _Array:
+    """Minimal stand-in for a torch tensor: `.cpu().numpy()`."""
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class _OBB:
+    def __init__(self, boxes: np.ndarray, classes: np.ndarray, confidences: np.ndarray):
+        self.xyxyxyxy = _Array(boxes.astype(np.float32))
+        self.cls = _Array(classes.astype(np.float32))
+        self.conf = _Array(confidences.astype(np.float32))
+
+
+class _Result:
+    def __init__(self, obb: _OBB):
+        self.obb = obb
+
+
+class StandInLearner:
+    """
+    Stand-in for a FastAI classification learner.
+
+    Has what inference_utils.predict_batch uses of a learner: validation data
+    loaders with the item transforms (resize, to tensor) and batch transforms
+    (to float, ImageNet normalisation) of the production learners, their
+    vocab, a loss function with a softmax activation and a model. So the
+    production FastAI path runs in full, except that the model is a tiny
+    randomly initialised CNN instead of the trained ResNet: timings cover
+    everything around the network but not the network itself.
+    """
+
+    def __init__(self, vocab: list, input_size: int = 224, seed: int = 0):
+        # Imported here so the other stand-ins do not need FastAI
+        import torch
+        from fastai.vision.all import CrossEntropyLossFlat, IntToFloatTensor, Normalize, Pipeline, Resize, ResizeMethod, ToTensor, imagenet_stats
+
+        valid = _StandInDataLoader(
+            after_item=Pipeline([Resize(input_size, method=ResizeMethod.Squish), ToTensor()]),
+            after_batch=Pipeline([IntToFloatTensor(), Normalize.from_stats(*imagenet_stats, cuda=False)])
+        )
+        self.dls = _StandInDataLoaders(valid=valid, vocab=list(vocab))
+        self.loss_func = CrossEntropyLossFlat()
+        torch.manual_seed(seed)
+        self.model = torch.nn.Sequential(
+            torch.nn.Conv2d(3, 8, kernel_size=3, stride=4),
+            torch.nn.ReLU(),
+            torch.nn.AdaptiveAvgPool2d(1),
+            torch.nn.Flatten(),
+            torch.nn.Linear(8, len(vocab))
+        )
+
+
+class _StandInDataLoader:
+    def __init__(self, after_item, after_batch):
+        self.after_item = after_item
+        self.after_batch = after_batch
+
+
+class _StandInDataLoaders:
+    def __init__(self, valid: _StandInDataLoader, vocab: list):
+        self.valid = valid
+        self.vocab = vocab
+
+
+class StandInDetector:
+    """
+    Stand-in for the Ultralytics OBB digit detector.
+
+    Returns the given digit boxes, each with a few jittered duplicates so the
+    post-processing (confidence filter, NMS, ordering) does realistic work.
+    Accepts one image or a list of images like an Ultralytics model.
+    """
+
+    def __init__(self, digit_boxes: np.ndarray, duplicates: int = 2, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        boxes = [digit_boxes]
+        for _ in range(duplicates):
+            boxes.append(digit_boxes + rng.normal(0, 3, size=digit_boxes.shape))
+        self.boxes = np.concatenate(boxes)
+        self.classes = np.tile(np.arange(len(digit_boxes)) % 10, duplicates + 1)
+        self.confidences = rng.uniform(0.2, 1.0, size=len(self.boxes))
+
+    def __call__(self, images):
+        batch = images if isinstance(images, list) else [images]
+        results = []
+        for image in batch:
+            # Touch the pixels the way a forward pass would, at a small fraction of the cost
+            cv2.resize(image, (640, 640), interpolation=cv2.INTER_LINEAR)
+            results.append(_Result(_OBB(self.boxes, self.classes, self.confidences)))
+        return results
@@ -15,6 +15,12 @@ class Config:
             self.config = yaml.safe_load(f)
 
     def find(self, path: str, default=None):
+        """
+        Value at a dotted path, e.g. "image_resizing.width".
+
+        `default` is returned only when the path is missing or its value is null,
+        so configured false, 0 and empty values are kept.
+        """
         try:
             if self.config:
                 element_value = reduce(operator.getitem, path.split("."), self.config)
@@ -23,4 +29,4 @@ class Config:
         except KeyError:
             element_value = None
         finally:
-            return element_value or default
+            return default if element_value is None else element_value
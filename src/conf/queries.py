@@ -1,6 +1,8 @@
+# A re-sent request id keeps its first request row, as store_request_with_response does
 store_request = """
     INSERT INTO flowvision_extraction_data(request_id, image_url, image_id, metadata, request_timestamp)
     VALUES(:request_id, :image_url, :image_id, :metadata, :request_timestamp)
+    ON CONFLICT (request_id) DO NOTHING
 """
 # store_response = """
 #     UPDATE flowvision_extraction_data
@@ -19,7 +21,11 @@ store_response = """
         quality_confidence,
         last_digit_color,
         color_confidence,
-        processing_time
+        processing_time,
+        color_method,
+        hsv_last_digit_color,
+        hsv_color_confidence,
+        reason_code
     ) = (
         :meter_reading_status, 
         :meter_reading, 
@@ -29,14 +35,117 @@ store_response = """
         :quality_confidence,
         :last_digit_color,
         :color_confidence,
-        :processing_time
+        :processing_time,
+        :color_method,
+        :hsv_last_digit_color,
+        :hsv_color_confidence,
+        :reason_code
     )
-    WHERE request_id = (:request_id)::VARCHAR
+    WHERE request_id = :request_id
 """
 
 store_feedback = """
     UPDATE flowvision_extraction_data
     SET (extracted_reading_accurate, actual_reading, feedback_timestamp) = 
     (:extracted_reading_accurate, :actual_reading, :feedback_timestamp)
-    WHERE correlation_id = (:correlation_id)::VARCHAR
-"""
\ No newline at end of file
+    WHERE correlation_id = :correlation_id
+"""
+# Request and response of the same extraction written in one statement
+store_request_with_response = """
+    INSERT INTO flowvision_extraction_data(
+        request_id,
+        image_url,
+        image_id,
+        metadata,
+        request_timestamp,
+        meter_reading_status,
+        meter_reading,
+        correlation_id,
+        response_timestamp,
+        quality_status,
+        quality_confidence,
+        last_digit_color,
+        color_confidence,
+        processing_time,
+        color_method,
+        hsv_last_digit_color,
+        hsv_color_confidence,
+        reason_code
+    )
+    VALUES(
+        :request_id,
+        :image_url,
+        :image_id,
+        :metadata,
+        :request_timestamp,
+        :meter_reading_status,
+        :meter_reading,
+        :correlation_id,
+        :response_timestamp,
+        :quality_status,
+        :quality_confidence,
+        :last_digit_color,
+        :color_confidence,
+        :processing_time,
+        :color_method,
+        :hsv_last_digit_color,
+        :hsv_color_confidence,
+        :reason_code
+    )
+    ON CONFLICT (request_id) DO UPDATE
+    SET (
+        meter_reading_status,
+        meter_reading,
+        correlation_id,
+        response_timestamp,
+        quality_status,
+        quality_confidence,
+        last_digit_color,
+        color_confidence,
+        processing_time,
+        color_method,
+        hsv_last_digit_color,
+        hsv_color_confidence,
+        reason_code
+    ) = (
+        EXCLUDED.meter_reading_status,
+        EXCLUDED.meter_reading,
+        EXCLUDED.correlation_id,
+        EXCLUDED.response_timestamp,
+        EXCLUDED.quality_status,
+        EXCLUDED.quality_confidence,
+        EXCLUDED.last_digit_color,
+        EXCLUDED.color_confidence,
+        EXCLUDED.processing_time,
+        EXCLUDED.color_method,
+        EXCLUDED.hsv_last_digit_color,
+        EXCLUDED.hsv_color_confidence,
+        EXCLUDED.reason_code
+    )
+"""
+
+# Recent images with a successful extraction, for calibrating quantized models
+select_calibration_images = """
+    SELECT request_id, image_url
+    FROM flowvision_extraction_data
+    WHERE meter_reading_status = 'SUCCESS'
+    ORDER BY request_timestamp DESC
+    LIMIT :limit
+"""
+
+# Extractions with user feedback, for accuracy reports
+select_labelled_extractions = """
+    SELECT
+        request_id,
+        image_url,
+        meter_reading_status,
+        meter_reading,
+        quality_status,
+        last_digit_color,
+        extracted_reading_accurate,
+        actual_reading
+    FROM flowvision_extraction_data
+    WHERE extracted_reading_accurate IS NOT NULL
+    ORDER BY feedback_timestamp DESC
+    LIMIT :limit
+"""
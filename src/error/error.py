@@ -16,6 +16,10 @@ class ErrorCode:
     UNSUPPORTED_FILE_TYPE_ERROR = "ERR_002", "Unsupported File Type Error", "Unsupported file type. Expected jpg or png image."
     FILE_SIZE_ERROR = "ERROR_003", "File Size Error", "File is too large."
     LLM_ERROR = "ERROR_04", "LLM Error", "An Unexpected error occurred while calling LLM."
+    SERVICE_BUSY_ERROR = "ERROR_05", "Service Busy Error", "Server is busy. Retry the request later."
+    IMAGE_FETCH_ERROR = "ERROR_06", "Image Fetch Error", "The image could not be downloaded from the given URL."
+    BATCH_SIZE_ERROR = "ERROR_07", "Batch Size Error", "Too many requests in one batch."
+    IMAGE_DIMENSIONS_ERROR = "ERROR_08", "Image Dimensions Error", "The image has too many pixels."
 
 
 class CustomHTTPException(Exception):
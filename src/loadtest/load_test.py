@@ -0,0 +1,278 @@
+"""
+End-to-end load test of the FlowVision API against local stand-ins.
+
+Starts a synthetic image server, an in-memory S3 stand-in and a SQLite
+database (see loadtest.stand_ins), launches the app from routes.py with
+uvicorn pointed at them (S3_ENDPOINT_URL, DATABASE_URL), and replays a trace
+of requests with a fixed number of concurrent clients. Reports throughput and
+p50/p95/p99 latency per endpoint.
+
+A trace is a JSONL file with one request per line:
+    {"endpoint": "extract-reading", "imageURL": "/images/3mp-0.jpg"}
+    {"endpoint": "feedback", "accurate": false, "actual": 24406.9}
+    {"endpoint": "uploadImage", "image": "/images/12mp-1.jpg"}
+    {"endpoint": "upload-and-extract-reading", "image": "/images/8mp-2.jpg"}
+Relative image paths refer to the image server. Feedback is sent for the
+correlation id of an earlier completed extraction. Without --trace a trace of
+--requests requests is generated from --mix.
+
+The models configured in CONFIG_PATH are loaded by the app as usual. To test
+an app that is already running, pass --target; it must be started with the
+S3_ENDPOINT_URL and DATABASE_URL printed by this script.
+
+Run from the repository root:
+    PYTHONPATH=src python -m loadtest.load_test --requests 500 --concurrency 16
+    PYTHONPATH=src python -m loadtest.load_test --trace trace.jsonl --concurrency 4 8 16 --output report.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+from uuid import uuid4
+
+import httpx
+import numpy as np
+
+from loadtest.stand_ins import ImageServer, S3StandIn, create_sqlite_database
+
+
+BASEPATH = "/flowvision/v1"
+ENDPOINTS = ("extract-reading", "feedback", "uploadImage", "upload-and-extract-reading")
+
+
+def generate_trace(num_requests: int, mix: dict, image_paths: list, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    endpoints = rng.choices(list(mix), weights=list(mix.values()), k=num_requests)
+    trace = []
+    for endpoint in endpoints:
+        if endpoint == "extract-reading":
+            trace.append({"endpoint": endpoint, "imageURL": rng.choice(image_paths)})
+        elif endpoint == "feedback":
+            accurate = rng.random() < 0.8
+            trace.append({"endpoint": endpoint, "accurate": accurate, "actual": None if accurate else round(rng.uniform(0, 99999), 1)})
+        else:
+            trace.append({"endpoint": endpoint, "image": rng.choice(image_paths)})
+    return trace
+
+
+def read_trace(path: str) -> list:
+    with open(path) as file:
+        trace = [json.loads(line) for line in file if line.strip()]
+    for entry in trace:
+        if entry.get("endpoint") not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in trace: {entry.get('endpoint')}")
+    return trace
+
+
+class LoadTest:
+    def __init__(self, base_url: str, image_server: ImageServer, timeout: float):
+        self.base_url = base_url
+        self.image_server = image_server
+        self.timeout = timeout
+        self.correlation_ids = []
+
+    async def run(self, trace: list, concurrency: int) -> dict:
+        """
+        Replay the trace with `concurrency` clients, each sending its next
+        request as soon as the previous one completed.
+
+        Returns:
+            Dictionary with the wall time and (latency, ok) samples per endpoint
+        """
+        queue = asyncio.Queue()
+        for entry in trace:
+            queue.put_nowait(entry)
+        samples = defaultdict(list)
+
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits) as client:
+            async def worker():
+                while not queue.empty():
+                    entry = queue.get_nowait()
+                    start_time = time.perf_counter()
+                    try:
+                        ok = await self.send(client, entry)
+                    except httpx.HTTPError:
+                        ok = False
+                    samples[entry["endpoint"]].append((time.perf_counter() - start_time, ok))
+
+            start_time = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            wall_time = time.perf_counter() - start_time
+
+        return {"wall_time": wall_time, "samples": samples}
+
+    async def send(self, client: httpx.AsyncClient, entry: dict) -> bool:
+        endpoint = entry["endpoint"]
+        if endpoint == "extract-reading":
+            body = {"imageURL": self.image_url(entry["imageURL"]), "metadata": entry.get("metadata")}
+            response = await client.post(f"{BASEPATH}/extract-reading", json=body)
+            ok = self.succeeded(response)
+            if ok:
+                self.correlation_ids.append(response.json()["result"]["correlationId"])
+            return ok
+
+        if endpoint == "feedback":
+            correlation_id = random.choice(self.correlation_ids) if self.correlation_ids else str(uuid4())
+            data = {"accurate": entry.get("accurate", True), "actual": entry.get("actual")}
+            response = await client.post(f"{BASEPATH}/feedback", json={"correlationId": correlation_id, "data": data})
+            return self.succeeded(response)
+
+        path = entry["image"]
+        image = self.image_server.images[path]
+        files = {"image": (os.path.basename(path), image, "image/jpeg")}
+        response = await client.post(f"{BASEPATH}/{endpoint}", files=files)
+        ok = self.succeeded(response)
+        if ok and endpoint == "upload-and-extract-reading":
+            self.correlation_ids.append(response.json()["result"]["correlationId"])
+        return ok
+
+    def image_url(self, url: str) -> str:
+        return self.image_server.url + url if url.startswith("/") else url
+
+    @staticmethod
+    def succeeded(response: httpx.Response) -> bool:
+        # Errors are also reported in the body's statusCode with an HTTP 200
+        if response.status_code != 200:
+            return False
+        try:
+            return response.json().get("statusCode") == 200
+        except ValueError:
+            return False
+
+
+def summarize(run: dict) -> dict:
+    report = {}
+    wall_time = run["wall_time"]
+    for endpoint, samples in sorted(run["samples"].items()):
+        latencies = np.array([latency for latency, _ in samples])
+        errors = sum(not ok for _, ok in samples)
+        report[endpoint] = {
+            "requests": len(samples),
+            "errors": errors,
+            "throughput_rps": len(samples) / wall_time if wall_time else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+            "p99_ms": float(np.percentile(latencies, 99) * 1000),
+            "max_ms": float(latencies.max() * 1000),
+        }
+    return report
+
+
+def print_report(concurrency: int, wall_time: float, report: dict):
+    print(f"\nconcurrency {concurrency}, {wall_time:.1f}s")
+    print(f"{'endpoint':<26} {'requests':>8} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, stats in report.items():
+        print(
+            f"{endpoint:<26} {stats['requests']:>8} {stats['errors']:>7} {stats['throughput_rps']:>8.1f} "
+            f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}"
+        )
+
+
+def start_app(port: int, env: dict, startup_timeout: float, workers: int) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "uvicorn", "routes:app",
+        "--app-dir", "src", "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning",
+    ]
+    process = subprocess.Popen(command, env={**os.environ, **env})
+
+    # Model loading happens at import, so wait until the app answers
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited during startup with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1.0).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"App did not start within {startup_timeout}s")
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        endpoint, weight = part.split("=")
+        if endpoint not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint: {endpoint}")
+        mix[endpoint] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", help="JSONL trace to replay")
+    parser.add_argument("--requests", type=int, default=200, help="Requests in a generated trace")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("extract-reading=8,feedback=1,uploadImage=1"))
+    parser.add_argument("--save-trace", help="Write the generated trace to this file")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8], help="Concurrent clients; one run per value")
+    parser.add_argument("--warmup", type=int, default=10, help="Extractions sent before each run and not measured")
+    parser.add_argument("--megapixels", type=int, nargs="+", default=[3, 8, 12])
+    parser.add_argument("--target", help="URL of an already running app instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes of the started app")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--timeout", type=float, default=120, help="Client timeout per request in seconds")
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    image_server = ImageServer(megapixels=args.megapixels).start()
+    s3 = S3StandIn().start()
+    workdir = tempfile.mkdtemp(prefix="flowvision-loadtest-")
+    database_url = create_sqlite_database(os.path.join(workdir, "flowvision.db"))
+    env = {
+        "S3_ENDPOINT_URL": s3.url,
+        "DATABASE_URL": database_url,
+        "AWS_ACCESS_KEY_ID": os.getenv("AWS_ACCESS_KEY_ID") or "loadtest",
+        "AWS_SECRET_ACCESS_KEY": os.getenv("AWS_SECRET_ACCESS_KEY") or "loadtest",
+        "AWS_DEFAULT_REGION": os.getenv("AWS_DEFAULT_REGION") or "us-east-1",
+    }
+    print(f"Image server: {image_server.url}\n" + "\n".join(f"{name}={value}" for name, value in env.items()))
+
+    trace = read_trace(args.trace) if args.trace else generate_trace(args.requests, args.mix, image_server.paths)
+    if args.save_trace:
+        with open(args.save_trace, "w") as file:
+            file.writelines(json.dumps(entry) + "\n" for entry in trace)
+
+    process = None
+    try:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            process = start_app(args.port, env, args.startup_timeout, args.workers)
+            base_url = f"http://127.0.0.1:{args.port}"
+
+        load_test = LoadTest(base_url, image_server, timeout=args.timeout)
+        results = {}
+        for concurrency in args.concurrency:
+            paths = image_server.paths
+            warmup = [{"endpoint": "extract-reading", "imageURL": paths[i % len(paths)]} for i in range(args.warmup)]
+            asyncio.run(load_test.run(warmup, concurrency))
+            run = asyncio.run(load_test.run(trace, concurrency))
+            report = summarize(run)
+            print_report(concurrency, run["wall_time"], report)
+            results[str(concurrency)] = {"wall_time_seconds": run["wall_time"], "endpoints": report}
+
+        print(f"\nObjects uploaded to the S3 stand-in: {len(s3.objects)}; database: {database_url}")
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump({"requests": len(trace), "concurrency": results}, file, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        s3.stop()
+        image_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Local stand-ins for the services the API depends on, for load tests.
+
+- ImageServer serves synthetic meter photos over HTTP, in place of the
+  presigned S3 URLs clients send to /extract-reading.
+- S3StandIn accepts the object PUT (plain and multipart) and GET requests of
+  StorageService and presigned URLs. Objects are kept in memory and
+  signatures are not checked.
+- create_sqlite_database creates the flowvision_extraction_data table in a
+  SQLite file that DatabaseService can use through DATABASE_URL.
+"""
+import re
+import time
+import sqlite3
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from uuid import uuid4
+
+from benchmarks.synthetic import PHOTO_SIZES, synthetic_photo
+
+
+# flowvision_db_ddl.sql in SQLite types
+SQLITE_DDL = """
+CREATE TABLE IF NOT EXISTS flowvision_extraction_data (
+    request_id VARCHAR PRIMARY KEY,
+    image_url VARCHAR NOT NULL,
+    image_id VARCHAR,
+    metadata JSON,
+    request_timestamp TIMESTAMP,
+    meter_reading_status VARCHAR,
+    meter_reading VARCHAR,
+    correlation_id VARCHAR,
+    response_timestamp TIMESTAMP,
+    extracted_reading_accurate BOOL,
+    actual_reading VARCHAR,
+    feedback_timestamp TIMESTAMP,
+    quality_status VARCHAR,
+    quality_confidence FLOAT,
+    last_digit_color VARCHAR,
+    color_confidence FLOAT,
+    processing_time FLOAT,
+    color_method VARCHAR,
+    hsv_last_digit_color VARCHAR,
+    hsv_color_confidence FLOAT,
+    reason_code VARCHAR
+);
+CREATE INDEX IF NOT EXISTS idx_metadata_correlation_id ON flowvision_extraction_data(correlation_id);
+"""
+
+
+def create_sqlite_database(path: str) -> str:
+    """Create the extraction table in a SQLite file and return its SQLAlchemy URL."""
+    with sqlite3.connect(path) as connection:
+        connection.executescript(SQLITE_DDL)
+    return f"sqlite:///{path}"
+
+
+class _StandInServer:
+    handler_class = None
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = ThreadingHTTPServer((host, port), self.handler_class)
+        self.server.daemon_threads = True
+        self.server.stand_in = self
+        self._thread = threading.Thread(target=self.server.serve_forever, name=type(self).__name__, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: HTTPStatus, body: bytes = b"", content_type: str = "application/octet-stream", headers: dict | None = None):
+        self.send_response(status.value)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+
+class _ImageHandler(_QuietHandler):
+    def do_GET(self):
+        image = self.server.stand_in.images.get(urlsplit(self.path).path)
+        if image is None:
+            self._send(HTTPStatus.NOT_FOUND)
+        else:
+            self._send(HTTPStatus.OK, image, content_type="image/jpeg")
+
+    do_HEAD = do_GET
+
+
+class ImageServer(_StandInServer):
+    """
+    Serves synthetic meter photos at /images/<megapixels>mp-<n>.jpg, with
+    `variants` different photos per size.
+    """
+    handler_class = _ImageHandler
+
+    def __init__(self, megapixels=(3, 8, 12), variants: int = 4, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(host, port)
+        self.images = {}
+        for size in megapixels:
+            if size not in PHOTO_SIZES:
+                raise ValueError(f"Unsupported photo size: {size} MP")
+            for variant in range(variants):
+                self.images[f"/images/{size}mp-{variant}.jpg"] = synthetic_photo(size, seed=variant).jpeg_bytes()
+
+    @property
+    def paths(self) -> list:
+        return sorted(self.images)
+
+
+class _S3Handler(_QuietHandler):
+    # Round trips of a new TCP + TLS 1.3 connection, of a request and of the 100-continue handshake
+    def setup(self):
+        super().setup()
+        time.sleep(2 * self.server.stand_in.round_trip_time)
+
+    def handle_expect_100(self):
+        time.sleep(self.server.stand_in.round_trip_time)
+        return super().handle_expect_100()
+
+    def parse_request(self):
+        parsed = super().parse_request()
+        time.sleep(self.server.stand_in.round_trip_time)
+        return parsed
+
+    def do_PUT(self):
+        store = self.server.stand_in
+        path, query = self._path_and_query()
+        body = self._read_body()
+        with store.lock:
+            if "uploadId" in query:
+                upload = store.uploads.get(query["uploadId"])
+                if upload is None:
+                    return self._send_error(HTTPStatus.NOT_FOUND, "NoSuchUpload")
+                upload["parts"][int(query["partNumber"])] = body
+            else:
+                store.objects[path] = (body, self.headers.get("Content-Type", "application/octet-stream"))
+        self._send(HTTPStatus.OK, headers={"ETag": f'"{len(body)}"'})
+
+    def do_POST(self):
+        # Multipart uploads: initiate with ?uploads, complete with ?uploadId=<id>
+        store = self.server.stand_in
+        path, query = self._path_and_query()
+        body = self._read_body()
+        bucket, _, key = path.lstrip("/").partition("/")
+        with store.lock:
+            if "uploads" in query:
+                upload_id = uuid4().hex
+                store.uploads[upload_id] = {"path": path, "content_type": self.headers.get("Content-Type", "application/octet-stream"), "parts": {}}
+                result = f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            else:
+                upload = store.uploads.pop(query.get("uploadId"), None)
+                if upload is None:
+                    return self._send_error(HTTPStatus.NOT_FOUND, "NoSuchUpload")
+                part_numbers = [int(number) for number in re.findall(r"<PartNumber>(\d+)</PartNumber>", body.decode())]
+                if any(number not in upload["parts"] for number in part_numbers):
+                    return self._send_error(HTTPStatus.BAD_REQUEST, "InvalidPart")
+                store.objects[path] = (b"".join(upload["parts"][number] for number in part_numbers), upload["content_type"])
+                store.multipart_uploads += 1
+                result = f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>\"{len(part_numbers)}\"</ETag></CompleteMultipartUploadResult>"
+        self._send(HTTPStatus.OK, result.encode(), content_type="application/xml")
+
+    def do_DELETE(self):
+        store = self.server.stand_in
+        path, query = self._path_and_query()
+        with store.lock:
+            if "uploadId" in query:
+                store.uploads.pop(query["uploadId"], None)
+            else:
+                store.objects.pop(path, None)
+        self._send(HTTPStatus.NO_CONTENT)
+
+    def do_GET(self):
+        store = self.server.stand_in
+        path, _ = self._path_and_query()
+        with store.lock:
+            stored = store.objects.get(path)
+        if stored is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "NoSuchKey")
+        else:
+            body, content_type = stored
+            self._send(HTTPStatus.OK, body, content_type=content_type)
+
+    do_HEAD = do_GET
+
+    def _path_and_query(self) -> tuple:
+        url = urlsplit(self.path)
+        return url.path, dict(parse_qsl(url.query, keep_blank_values=True))
+
+    def _send_error(self, status: HTTPStatus, code: str):
+        self._send(status, f"<Error><Code>{code}</Code></Error>".encode(), content_type="application/xml")
+
+
+class S3StandIn(_StandInServer):
+    """
+    In-memory object store for path-style S3 URLs (/<bucket>/<key>), with
+    multipart uploads; `multipart_uploads` counts the completed ones. Point
+    StorageService at it with S3_ENDPOINT_URL. With `round_trip_time` (seconds)
+    it emulates a remote store: each request waits one round trip and each new
+    connection two more, as for a TCP and TLS handshake.
+    """
+    handler_class = _S3Handler
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, round_trip_time: float = 0.0):
+        super().__init__(host, port)
+        self.round_trip_time = round_trip_time
+        self.objects = {}
+        self.uploads = {}
+        self.multipart_uploads = 0
+        self.lock = threading.Lock()
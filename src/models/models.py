@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from fastapi import UploadFile
 from enum import StrEnum
@@ -27,6 +27,13 @@ class Status(StrEnum):
   SUCCESS = 'SUCCESS'
 
 
+class PrescreenReason(StrEnum):
+  TOO_SMALL = 'TOO_SMALL'
+  TOO_DARK = 'TOO_DARK'
+  OVEREXPOSED = 'OVEREXPOSED'
+  BLURRY = 'BLURRY'
+
+
 class BaseResponse(BaseModel):
   id: UUID
   ts: datetime
@@ -59,9 +66,13 @@ class ReadingExtractionResultData(BaseModel):
   meterBrand: Optional[str] = None
   processingTime: float
   qualityStatus: str
-  qualityConfidence: float
+  qualityConfidence: Optional[float] = None
   lastDigitColor: str
   colorConfidence: float
+  # How the colour was decided and what the HSV comparison said; stored, not returned
+  colorMethod: Optional[str] = Field(default=None, exclude=True)
+  hsvColor: Optional[str] = Field(default=None, exclude=True)
+  hsvColorConfidence: Optional[float] = Field(default=None, exclude=True)
 
 
 
@@ -69,6 +80,8 @@ class ReadingExtractionResult(BaseModel):
   status: Status
   correlationId: UUID
   data: Optional[ReadingExtractionResultData] = None
+  # Set when the pre-screen rejected the image
+  reasonCode: Optional[PrescreenReason] = None
 
 
 class ImageUploadResponse(BaseResponse):
@@ -79,6 +92,14 @@ class ReadingExtractionResponse(BaseResponse):
   result: Optional[ReadingExtractionResult] = None
 
 
+class ImageUploadExtractionResult(ReadingExtractionResult):
+  imageURL: str
+
+
+class ImageUploadExtractionResponse(BaseResponse):
+  result: Optional[ImageUploadExtractionResult] = None
+
+
 class FeedbackRequestData(BaseModel):
   accurate: bool
   extracted: Optional[float] = None
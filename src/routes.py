@@ -1,21 +1,36 @@
 import logging
-from fastapi import FastAPI, Form, BackgroundTasks
+from typing import List
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Form, BackgroundTasks, Response
 from typing_extensions import Annotated
 
 from conf.logging import CustomLoggers
-from service.api.image_service import ImageService
+from service.api.image_service import ImageService, init_extraction_worker
+from service.api.inference_executor import InferenceExecutor
 from service.api.storage_service import StorageService
+from service.metrics import render_metrics
 from conf.config import Config
-from models.models import ImageUploadRequest, ReadingExtractionRequest, ReadingExtractionResponse, FeedbackRequest, FeedbackResponse
+from models.models import ImageUploadRequest, ImageUploadExtractionResponse, ReadingExtractionRequest, ReadingExtractionResponse, FeedbackRequest, FeedbackResponse
 
 from dotenv import load_dotenv
 
 load_dotenv()
-app = FastAPI()
 config = Config()
 CustomLoggers(config=config)
 flow_vision_service = ImageService(config=config)
 storage_service = StorageService(config=config)
+inference_executor = InferenceExecutor(config=config, name="extraction", initializer=init_extraction_worker)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await flow_vision_service.image_fetcher.close()
+    inference_executor.shutdown()
+    flow_vision_service.metadata_store.close()
+
+
+app = FastAPI(lifespan=lifespan)
 basepath = "/flowvision/v1"
 
 @app.get("/")
@@ -23,6 +38,12 @@ async def root():
     return {"message": "Hi, I am the meter reading assistant."}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 @app.post(f"{basepath}/uploadImage")
 async def upload_image(request: Annotated[ImageUploadRequest, Form()]):
     return await storage_service.upload_image(request)
@@ -30,10 +51,20 @@ async def upload_image(request: Annotated[ImageUploadRequest, Form()]):
 
 @app.post(f"{basepath}/extract-reading", response_model=ReadingExtractionResponse, response_model_exclude_none=True)
 async def extract_reading(request: ReadingExtractionRequest, background_tasks: BackgroundTasks):
-    response = flow_vision_service.extract_reading(request, background_tasks)
+    response = await flow_vision_service.extract_reading_async(request, background_tasks, inference_executor)
     return response
 
 
+@app.post(f"{basepath}/upload-and-extract-reading", response_model=ImageUploadExtractionResponse, response_model_exclude_none=True)
+async def upload_and_extract_reading(request: Annotated[ImageUploadRequest, Form()], background_tasks: BackgroundTasks):
+    return await flow_vision_service.upload_and_extract_async(request, background_tasks, inference_executor, storage_service)
+
+
+@app.post(f"{basepath}/extract-readings")
+async def extract_readings(requests: List[ReadingExtractionRequest], background_tasks: BackgroundTasks):
+    return flow_vision_service.extract_readings_async(requests, background_tasks, inference_executor)
+
+
 @app.post(f"{basepath}/feedback", response_model=FeedbackResponse, response_model_exclude_none=True)
 async def log_feedback(request: FeedbackRequest, background_tasks: BackgroundTasks):
     response = flow_vision_service.log_feedback(request, background_tasks)
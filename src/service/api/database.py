@@ -1,11 +1,15 @@
+import os
+
 import sqlalchemy as db
 from sqlalchemy import text
 from conf.config import Config
+from service.metrics import observe_stage
 
 class DatabaseService:
     def __init__(self, config: Config):
         self.config = Config
-        url_object = db.URL.create(
+        # DATABASE_URL (any SQLAlchemy URL, e.g. a SQLite file for load tests) overrides the config
+        url_object = os.getenv("DATABASE_URL") or db.URL.create(
             drivername="postgresql+psycopg2",
             username=config.find("database.username"),
             password=config.find("database.password"),
@@ -24,12 +28,48 @@ class DatabaseService:
     def upsert(self, sql, params):
         conn = self.get_connection()
         try:
-            conn.execute(statement=text(sql), parameters=params)
-            conn.commit()
+            with observe_stage("db_write"):
+                conn.execute(statement=text(sql), parameters=params)
+                conn.commit()
         except Exception as e:
             raise e
         finally:
             self.release_connection(conn=conn)
 
+    def execute_many(self, statements):
+        """
+        Run several batched statements in a single transaction.
+
+        Args:
+            statements: List of (sql, list of parameter dicts) pairs, run in order
+        """
+        conn = self.get_connection()
+        try:
+            with observe_stage("db_write"):
+                for sql, params in statements:
+                    if params:
+                        conn.execute(statement=text(sql), parameters=params)
+                conn.commit()
+        except Exception as e:
+            raise e
+        finally:
+            self.release_connection(conn=conn)
+
+    def fetch_all(self, sql, params=None) -> list:
+        """
+        Args:
+            sql: SELECT statement
+            params: Parameters of the statement
+
+        Returns:
+            List of rows as dictionaries keyed by column name
+        """
+        conn = self.get_connection()
+        try:
+            result = conn.execute(statement=text(sql), parameters=params or {})
+            return [dict(row) for row in result.mappings()]
+        finally:
+            self.release_connection(conn=conn)
+
     def update(self):
         pass
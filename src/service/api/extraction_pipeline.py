@@ -0,0 +1,343 @@
+import time
+import logging
+from dataclasses import dataclass, field
+from uuid import uuid4
+
+from conf.config import Config
+from models.models import Status, ReadingExtractionRequest, ReadingExtractionResult, ReadingExtractionResultData
+from service.vision.image_frame import ImageFrame
+from service.vision.inference_utils import (
+    classify_bfm_image,
+    classify_color_image,
+    extract_digit_image,
+    is_last_digit_color_different_hsv
+)
+from service.vision.prescreen import ImagePrescreen
+from service.metrics import observe_stage, COLOR_DECISIONS, PIPELINE_STAGE_LATENCY, PRESCREEN_RESULTS
+
+
+@dataclass
+class ExtractionContext:
+    """
+    Per-request state shared by the extraction stages.
+
+    Each stage reads what earlier stages produced and adds its own output, so
+    nothing is computed twice. Once `result` is set (for instance by a cache
+    hit) the remaining stages are skipped.
+    """
+    request: ReadingExtractionRequest
+    image_bytes: bytes | None = None
+    frame: ImageFrame | None = None
+    cache_misses: list = field(default_factory=list)
+    quality: dict | None = None
+    meter_reading: str | None = None
+    digit_boxes: list = field(default_factory=list)
+    color: dict | None = None
+    color_method: str | None = None
+    hsv_color: dict | None = None
+    result: ReadingExtractionResult | None = None
+    timings: dict = field(default_factory=dict)
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    @property
+    def quality_status(self) -> str:
+        return self.quality['prediction'].lower() if self.quality else "unknown"
+
+
+class Stage:
+    """One step of the extraction. Synchronous stages run on the inference executor."""
+    name = None
+    is_async = False
+    required = False
+    # Whether the stage still runs once the context already holds a result
+    runs_after_result = False
+
+    def run(self, context: ExtractionContext):
+        raise NotImplementedError
+
+
+class FetchStage(Stage):
+    name = "fetch"
+    is_async = True
+    required = True
+
+    def __init__(self, image_fetcher):
+        self.image_fetcher = image_fetcher
+
+    async def run(self, context: ExtractionContext):
+        if context.image_bytes is None:
+            context.image_bytes = await self.image_fetcher.fetch(context.request.imageURL)
+
+
+class CacheLookupStage(Stage):
+    name = "cache_lookup"
+
+    def __init__(self, result_cache):
+        self.result_cache = result_cache
+
+    def run(self, context: ExtractionContext):
+        key = self.result_cache.key_for_bytes(context.image_bytes)
+        cached = self.result_cache.get(key)
+        if cached is None:
+            context.cache_misses.append(key)
+        else:
+            context.result = ReadingExtractionResult(correlationId=uuid4(), **cached)
+
+
+class PreprocessStage(Stage):
+    name = "preprocess"
+    required = True
+
+    def __init__(self, preprocess_image, result_cache):
+        self.preprocess_image = preprocess_image
+        self.result_cache = result_cache
+
+    def run(self, context: ExtractionContext):
+        context.frame = self.preprocess_image(context.image_bytes)
+        if self.result_cache.enabled and self.result_cache.hash_pixels:
+            key = self.result_cache.key_for_frame(context.frame)
+            cached = self.result_cache.get(key)
+            if cached is None:
+                context.cache_misses.append(key)
+            else:
+                context.result = ReadingExtractionResult(correlationId=uuid4(), **cached)
+
+
+class PrescreenStage(Stage):
+    """
+    Rejects images that are too small, too dark, overexposed or blurry before
+    any model runs (see ImagePrescreen). A rejected image gets an UNCLEAR
+    result carrying the reason, which also ends the pipeline. It has no
+    qualityConfidence since the quality CNN did not run.
+    """
+    name = "prescreen"
+
+    def __init__(self, prescreen: ImagePrescreen):
+        self.prescreen = prescreen
+
+    def run(self, context: ExtractionContext):
+        reason, _ = self.prescreen.check(context.frame)
+        PRESCREEN_RESULTS.labels(result=reason.value if reason else "PASS").inc()
+        if reason is None:
+            return
+
+        context.result = ReadingExtractionResult(
+            status=Status.UNCLEAR,
+            correlationId=uuid4(),
+            reasonCode=reason,
+            data=ReadingExtractionResultData(
+                meterReading="Image quality too poor for recognition",
+                processingTime=0.0,
+                qualityStatus="bad",
+                lastDigitColor="unknown",
+                colorConfidence=0.0
+            )
+        )
+
+
+class QualityStage(Stage):
+    name = "quality"
+
+    def __init__(self, bfm_classification_model):
+        self.bfm_classification_model = bfm_classification_model
+
+    def run(self, context: ExtractionContext):
+        context.quality = classify_bfm_image(context.frame.rgb(), self.bfm_classification_model)
+
+
+class DetectStage(Stage):
+    name = "detect"
+
+    def __init__(self, vision_service):
+        self.vision_service = vision_service
+
+    def run(self, context: ExtractionContext):
+        # Only proceed with meter reading if quality is good (or was not checked)
+        if context.quality_status not in ('good', 'unknown'):
+            context.meter_reading = "Image quality too poor for recognition"
+            return
+
+        # The quality result is handed over so backends do not classify the image again
+        meter_reading_result = self.vision_service.extract(frame=context.frame, quality=context.quality)
+        # Expecting: meter_reading, sorted_boxes, sorted_classes (and confidences)
+        if isinstance(meter_reading_result, tuple) and len(meter_reading_result) >= 3:
+            meter_reading, context.digit_boxes = meter_reading_result[:2]
+        else:
+            meter_reading = meter_reading_result
+
+        # Convert tuple to string if necessary
+        context.meter_reading = str(meter_reading[0]) if isinstance(meter_reading, tuple) else str(meter_reading)
+
+
+class ColorStage(Stage):
+    """
+    Colour of the last digit, decided in two steps.
+
+    With `color_cascade.enabled` the last digit is first compared with the two
+    digits before it in HSV space. If the comparison is confident enough, its
+    answer is used; otherwise, or with fewer than three digits, the colour CNN
+    classifies the last digit. The HSV answer and the method that decided are
+    kept on the context so both get stored.
+    """
+    name = "color"
+
+    def __init__(self, color_classification_model, config: Config):
+        self.color_classification_model = color_classification_model
+        self.cascade_enabled = config.find("color_cascade.enabled", default=False)
+        self.match_threshold = config.find("color_cascade.match_threshold", default=0.85)
+        self.min_confidence = config.find("color_cascade.min_confidence", default=0.9)
+        self.different_color = config.find("color_cascade.different_color", default="red")
+        self.same_color = config.find("color_cascade.same_color", default="black")
+
+    def run(self, context: ExtractionContext):
+        # Only classify color if digits were detected
+        if len(context.digit_boxes) == 0:
+            return
+
+        image = context.frame.bgr()
+        if self.cascade_enabled and len(context.digit_boxes) >= 3:
+            digit_crops = [extract_digit_image(image, box) for box in context.digit_boxes[-3:]]
+            with observe_stage("hsv_color"):
+                hsv = is_last_digit_color_different_hsv(digit_crops, threshold=self.match_threshold)
+            context.hsv_color = {
+                'prediction': self.different_color if hsv['is_red'] else self.same_color,
+                'confidence': float(hsv['confidence'])
+            }
+            if context.hsv_color['confidence'] >= self.min_confidence:
+                context.color = context.hsv_color
+                context.color_method = "hsv"
+                COLOR_DECISIONS.labels(method="hsv").inc()
+                return
+            last_digit_image = digit_crops[-1]
+        else:
+            last_digit_image = extract_digit_image(image, context.digit_boxes[-1])
+
+        context.color = classify_color_image(last_digit_image, self.color_classification_model)
+        context.color_method = "cnn"
+        COLOR_DECISIONS.labels(method="cnn").inc()
+
+
+class AssembleStage(Stage):
+    name = "assemble"
+    required = True
+    runs_after_result = True
+
+    def __init__(self, result_cache):
+        self.result_cache = result_cache
+
+    def run(self, context: ExtractionContext):
+        if context.result is None:
+            context.result = self.build_result(context)
+
+        # Store the result under every key that missed, including after a pixel-level hit
+        cache_value = context.result.model_dump(mode="json", exclude={"correlationId"})
+        # The colour decision fields are excluded from responses but stored with every result, cached ones too
+        if context.result.data is not None:
+            data = context.result.data
+            cache_value["data"].update(colorMethod=data.colorMethod, hsvColor=data.hsvColor, hsvColorConfidence=data.hsvColorConfidence)
+        for key in context.cache_misses:
+            self.result_cache.set(key, cache_value)
+
+    def build_result(self, context: ExtractionContext) -> ReadingExtractionResult:
+        quality = context.quality or {"prediction": "unknown", "confidence": 0.0}
+        color = context.color or {"prediction": "unknown", "confidence": 0.0}
+        meter_reading_str = context.meter_reading or ""
+        quality_status = context.quality_status
+
+        if 'nometer' in meter_reading_str.lower():
+            meter_reading_status = Status.NOMETER
+        elif 'unclear' in meter_reading_str.lower() or quality_status == 'bad':
+            meter_reading_status = Status.UNCLEAR
+        else:
+            meter_reading_status = Status.SUCCESS
+
+        return ReadingExtractionResult(
+            status=meter_reading_status,
+            correlationId=uuid4(),
+            data=ReadingExtractionResultData(
+                meterReading=meter_reading_str,
+                processingTime=0.0,
+                qualityStatus=quality_status,
+                qualityConfidence=quality['confidence'],
+                lastDigitColor=color['prediction'].lower(),
+                colorConfidence=color['confidence'],
+                colorMethod=context.color_method,
+                hsvColor=context.hsv_color['prediction'] if context.hsv_color else None,
+                hsvColorConfidence=context.hsv_color['confidence'] if context.hsv_color else None
+            )
+        )
+
+
+class ExtractionPipeline:
+    """
+    Runs the extraction stages in order, each at most once per request.
+
+    Stages listed under `pipeline.skip_stages` are left out. Consecutive
+    synchronous stages are handed to the inference executor as one unit of
+    work, so a request costs one executor hop however many stages it runs.
+    Time spent in every stage is recorded in `context.timings`.
+    """
+
+    def __init__(self, config: Config, stages: list):
+        self.base_logger = logging.getLogger(config.find("logs.api_logger.name"))
+        skipped = set(config.find("pipeline.skip_stages", default=[]))
+        for stage in stages:
+            if stage.name in skipped and stage.required:
+                raise ValueError(f"Pipeline stage {stage.name} cannot be skipped")
+        self.stages = [stage for stage in stages if stage.name not in skipped]
+        self.stages_by_name = {stage.name: stage for stage in self.stages}
+        self.base_logger.info("Extraction pipeline: %s", " -> ".join(stage.name for stage in self.stages))
+
+    async def run(self, context: ExtractionContext, executor, run_stages=None, wait: bool = False) -> ExtractionContext:
+        """
+        Args:
+            context: Context of the request to process
+            executor: InferenceExecutor that runs the synchronous stages
+            run_stages: Picklable callable used instead of `run_sync` for process pools
+            wait: Wait for executor capacity instead of failing fast with a 503
+
+        Returns:
+            The context after all stages ran; a new object when a process pool was used
+        """
+        run_stages = run_stages or self.run_sync
+        start_time = time.perf_counter()
+        pending = []
+        for stage in self.stages:
+            if not stage.is_async:
+                pending.append(stage.name)
+                continue
+            if pending:
+                context = await executor.submit(run_stages, pending, context, wait=wait)
+                pending = []
+            await self._run_async_stage(stage, context)
+        if pending:
+            context = await executor.submit(run_stages, pending, context, wait=wait)
+
+        context.result.data.processingTime = time.perf_counter() - start_time
+        # Observed here rather than in the stages so timings from process-pool workers are counted too
+        for name, seconds in context.timings.items():
+            PIPELINE_STAGE_LATENCY.labels(stage=name).observe(seconds)
+        self.base_logger.debug("Stage timings for request %s: %s", context.request.id, context.timings)
+        return context
+
+    def run_sync(self, stage_names: list, context: ExtractionContext) -> ExtractionContext:
+        for name in stage_names:
+            self._run_stage(self.stages_by_name[name], context)
+        return context
+
+    def _run_stage(self, stage: Stage, context: ExtractionContext):
+        if context.done and not stage.runs_after_result:
+            return
+        stage_start = time.perf_counter()
+        stage.run(context)
+        context.timings[stage.name] = time.perf_counter() - stage_start
+
+    async def _run_async_stage(self, stage: Stage, context: ExtractionContext):
+        if context.done and not stage.runs_after_result:
+            return
+        stage_start = time.perf_counter()
+        await stage.run(context)
+        context.timings[stage.name] = time.perf_counter() - stage_start
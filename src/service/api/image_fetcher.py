@@ -0,0 +1,153 @@
+import time
+import random
+import asyncio
+import logging
+from http import HTTPStatus
+
+import httpx
+
+from error.error import CustomHTTPException, ErrorCode
+from conf.config import Config
+from service.metrics import observe_stage, IMAGE_FETCH_BYTES, IMAGE_FETCH_FAILURES, IMAGE_FETCH_LATENCY, IMAGE_FETCH_RETRIES
+
+
+class ImageFetcher:
+    """
+    Async download of request images over a shared keep-alive connection pool.
+
+    Connections are pooled per host and reused across requests, every attempt is
+    bounded by connect/read timeouts, and the body is streamed so a download is
+    abandoned as soon as it exceeds `max_bytes`. Transport errors and 5xx/429
+    responses are retried with exponential backoff and full jitter.
+    """
+
+    retryable_status_codes = {
+        HTTPStatus.TOO_MANY_REQUESTS.value,
+        HTTPStatus.INTERNAL_SERVER_ERROR.value,
+        HTTPStatus.BAD_GATEWAY.value,
+        HTTPStatus.SERVICE_UNAVAILABLE.value,
+        HTTPStatus.GATEWAY_TIMEOUT.value,
+    }
+
+    def __init__(self, config: Config, transport: httpx.AsyncBaseTransport | None = None):
+        self.base_logger = logging.getLogger(config.find("logs.api_logger.name"))
+        self.max_bytes = config.find("image_fetch.max_bytes", default=config.find("file_size_limit", default=20971520))
+        self.chunk_size = config.find("image_fetch.chunk_size", default=65536)
+        self.retries = config.find("image_fetch.retries", default=2)
+        self.backoff_base = config.find("image_fetch.backoff_base_seconds", default=0.2)
+        self.backoff_max = config.find("image_fetch.backoff_max_seconds", default=2.0)
+        self.timeout = httpx.Timeout(
+            connect=config.find("image_fetch.connect_timeout_seconds", default=3.0),
+            read=config.find("image_fetch.read_timeout_seconds", default=10.0),
+            write=config.find("image_fetch.read_timeout_seconds", default=10.0),
+            pool=config.find("image_fetch.pool_timeout_seconds", default=5.0),
+        )
+        self.limits = httpx.Limits(
+            max_connections=config.find("image_fetch.max_connections", default=32),
+            max_keepalive_connections=config.find("image_fetch.max_keepalive_connections", default=16),
+            keepalive_expiry=config.find("image_fetch.keepalive_expiry_seconds", default=30.0),
+        )
+        self.transport = transport
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                transport=self.transport,
+                follow_redirects=True
+            )
+        return self._client
+
+    async def fetch(self, url: str) -> bytes:
+        """
+        Download an image.
+
+        Args:
+            url: URL of the image, typically a presigned S3 GET URL
+
+        Returns:
+            The image bytes
+
+        Raises:
+            CustomHTTPException: If the image is too large, unreachable or the download keeps failing
+        """
+        start_time = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                with observe_stage("fetch"):
+                    content = await self._fetch_once(url)
+                break
+            except _RetryableFetchError as e:
+                if attempt >= self.retries:
+                    IMAGE_FETCH_FAILURES.labels(reason=e.reason).inc()
+                    raise e.to_http_exception()
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                self.base_logger.warning("Image fetch failed (%s), retry %d in %.2fs", e.reason, attempt + 1, delay)
+                attempt += 1
+                IMAGE_FETCH_RETRIES.inc()
+                await asyncio.sleep(delay)
+            except CustomHTTPException as e:
+                IMAGE_FETCH_FAILURES.labels(reason=str(e.status_code)).inc()
+                raise
+
+        IMAGE_FETCH_LATENCY.observe(time.perf_counter() - start_time)
+        IMAGE_FETCH_BYTES.inc(len(content))
+        return content
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch_once(self, url: str) -> bytes:
+        try:
+            async with self.client.stream("GET", url) as response:
+                if response.status_code in self.retryable_status_codes:
+                    raise _RetryableFetchError(f"status {response.status_code}", HTTPStatus.BAD_GATEWAY)
+                if response.status_code != HTTPStatus.OK.value:
+                    raise CustomHTTPException(
+                        status_code=HTTPStatus.BAD_REQUEST.value,
+                        error_code=ErrorCode.IMAGE_FETCH_ERROR.value,
+                        detail=f"Could not fetch image: {response.status_code} {response.reason_phrase}"
+                    )
+
+                content_length = response.headers.get("Content-Length")
+                if content_length is not None and content_length.isdigit():
+                    self._validate_size(int(content_length))
+
+                content = bytearray()
+                async for chunk in response.aiter_bytes(self.chunk_size):
+                    content += chunk
+                    self._validate_size(len(content))
+                return bytes(content)
+        except httpx.TimeoutException as e:
+            raise _RetryableFetchError(f"timeout ({type(e).__name__})", HTTPStatus.GATEWAY_TIMEOUT)
+        except httpx.TransportError as e:
+            raise _RetryableFetchError(f"transport error ({type(e).__name__})", HTTPStatus.BAD_GATEWAY)
+
+    def _validate_size(self, size: int):
+        if size > self.max_bytes:
+            raise CustomHTTPException(
+                status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE.value,
+                error_code=ErrorCode.FILE_SIZE_ERROR.value,
+                detail=f"Image File is too large. File must be less than {self.max_bytes} bytes.",
+            )
+
+
+class _RetryableFetchError(Exception):
+    def __init__(self, reason: str, status: HTTPStatus):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+
+    def to_http_exception(self) -> CustomHTTPException:
+        return CustomHTTPException(
+            status_code=self.status.value,
+            error_code=ErrorCode.IMAGE_FETCH_ERROR.value,
+            detail=f"Could not fetch image: {self.reason}"
+        )
@@ -1,3 +1,6 @@
+import json
+import asyncio
+import hashlib
 import logging
 from http import HTTPStatus
 
@@ -6,29 +9,40 @@ from datetime import datetime
 from uuid import uuid4, UUID
 
 from fastapi import BackgroundTasks
-from error.error import CustomHTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from error.error import CustomHTTPException, ErrorCode
 from service.vision.openai_vision_service import OpenAIVisionService
 from service.vision.qwen_vision_service import QwenVisionService
 from service.vision.inception_v3_service import InceptionV3VisionService
-from models.models import Error, Status, ReadingExtractionRequest, ReadingExtractionResponse, ReadingExtractionResult, ReadingExtractionResultData, ResponseCode, FeedbackRequest, FeedbackResponseStatus, FeedbackResponse, FeedbackStatus, BaseResponse
+from models.models import Error, ReadingExtractionRequest, ReadingExtractionResponse, ResponseCode, FeedbackRequest, FeedbackResponseStatus, FeedbackResponse, FeedbackStatus, BaseResponse, ImageUploadRequest, ImageUploadExtractionResult, ImageUploadExtractionResponse
 from conf.config import Config
 from service.api.metadata_service import MetadataStore
-from PIL import Image, ImageOps
+from service.api.storage_service import StorageService
+from service.api.inference_executor import InferenceExecutor
+from service.api.image_fetcher import ImageFetcher
+from service.api.result_cache import ExtractionResultCache
+from service.api.extraction_pipeline import (
+    ExtractionContext,
+    ExtractionPipeline,
+    FetchStage,
+    CacheLookupStage,
+    PreprocessStage,
+    QualityStage,
+    DetectStage,
+    ColorStage,
+    PrescreenStage,
+    AssembleStage
+)
+from PIL import Image
 
-import requests
 from io import BytesIO
-import numpy as np
-import cv2
-
-from service.vision.inference_utils import (
-    load_bfm_classification,
-    load_individual_numbers_model,
-    load_color_classification_model,
-    classify_bfm_image,
-    direct_recognize_meter_reading,
-    classify_color_image,
-    extract_digit_image
-)
+
+from service.vision.model_registry import get_model_registry
+from service.vision.image_frame import ImageFrame
+from service.vision.image_plan import ImagePlan, resize_target
+from service.vision.prescreen import ImagePrescreen
+from service.metrics import observe_stage, EXTRACTIONS, EXTRACTION_LATENCY
 
 
 class ImageService:
@@ -38,6 +52,13 @@ class ImageService:
         self.extraction_logger = logging.getLogger(config.find("logs.extraction_request_logger.name"))
 
         self.metadata_store = MetadataStore(config=config)
+        self.image_fetcher = ImageFetcher(config=config)
+
+        # Quality and colour models are needed by every backend, so load them once up front.
+        # Behind a batcher, concurrent requests share their forward passes
+        self.model_registry = get_model_registry(config)
+        self.bfm_classification_model = self.model_registry.batched("bfm_classification")
+        self.color_classification_model = self.model_registry.batched("color_classification")
 
         vision_model: str = config.find("vision_model")
         self.base_logger.info("Vision model: %s", vision_model)
@@ -56,30 +77,49 @@ class ImageService:
 
         self.resizing_width = config.find("image_resizing.width")
         self.resizing_height = config.find("image_resizing.height")
+        self.reduced_decode = config.find("image_resizing.reduced_decode", default=True)
         self.crop_left = config.find("image_crop.left")
         self.crop_top = config.find("image_crop.top")
         self.crop_right = config.find("image_crop.right")
         self.crop_bottom = config.find("image_crop.bottom")
 
+        self.batch_max_items = config.find("batch_extraction.max_items", default=1000)
+        self.batch_max_concurrency = config.find("batch_extraction.max_concurrency", default=16)
+
+        # Cached results are only valid for the same models and preprocessing settings
+        pipeline_settings = json.dumps({
+            "vision_model": vision_model,
+            "image_resizing": config.find("image_resizing"),
+            "image_crop": config.find("image_crop"),
+            "image_enhancement": config.find("image_enhancement"),
+            "color_cascade": config.find("color_cascade"),
+            "prescreen": config.find("prescreen"),
+        }, sort_keys=True)
+        self.pipeline_fingerprint = hashlib.sha256(pipeline_settings.encode()).hexdigest()[:8]
+        self.result_cache = ExtractionResultCache(config=config, version_provider=self.cache_version)
+
+        # fetch -> cache_lookup -> preprocess -> prescreen -> quality -> detect -> color -> assemble
+        self.pipeline = ExtractionPipeline(config=config, stages=[
+            FetchStage(self.image_fetcher),
+            CacheLookupStage(self.result_cache),
+            PreprocessStage(self.preprocess_image, self.result_cache),
+            PrescreenStage(ImagePrescreen(config)),
+            QualityStage(self.bfm_classification_model),
+            DetectStage(self.vision_service),
+            ColorStage(self.color_classification_model, config),
+            AssembleStage(self.result_cache),
+        ])
+
+    def cache_version(self) -> str:
+        return f"{self.model_registry.version()}-{self.pipeline_fingerprint}"
+
     def resize_image(self, image: Image.Image, max_height=800, max_width=1000):
         """Resize the image only if it exceeds the specified dimensions."""
-        original_width, original_height = image.size
-
-        # Check if resizing is needed
-        if original_width > max_width or original_height > max_height:
-            # Calculate the new size maintaining the aspect ratio
-            aspect_ratio = original_width / original_height
-            if original_width > original_height:
-                new_width = max_width
-                new_height = int(max_width / aspect_ratio)
-            else:
-                new_height = max_height
-                new_width = int(max_height * aspect_ratio)
-
-            # Resize the image using LANCZOS for high-quality downscaling
-            return image.resize((new_width, new_height), Image.LANCZOS)
-        else:
+        target_size = resize_target(image.size, max_width=max_width, max_height=max_height)
+        if target_size == image.size:
             return image
+        # Resize the image using LANCZOS for high-quality downscaling
+        return image.resize(target_size, Image.LANCZOS)
 
     def crop_image(self, image: Image.Image):
         width, height = image.size   # Get dimensions
@@ -90,102 +130,214 @@ class ImageService:
         cropped_image = image.crop((left, top, right, bottom))
         return cropped_image
 
-    def preprocess_image(self, imageURL):
-        image = Image.open(BytesIO(requests.get(imageURL).content))
-        image = ImageOps.exif_transpose(image)
-        resized_image = self.resize_image(image, max_height=self.resizing_height, max_width=self.resizing_width)
-        cropped_image = self.crop_image(resized_image)
-        image_buffer = BytesIO()
-        cropped_image.save(image_buffer, format="PNG")
-        # cropped_image.save("image_used.png")
-        return image_buffer.getvalue()
-
-    def extract_reading(self, request: ReadingExtractionRequest, background_tasks: BackgroundTasks) -> ReadingExtractionResponse:
-        status_code = HTTPStatus.OK.value
-        response_code = ResponseCode.OK
+    def preprocess_image(self, image_bytes: bytes) -> ImageFrame:
+        """
+        Decode the image, make it upright and apply resize_image and crop_image,
+        planned as one step so that only the cropped region is resampled.
+        """
+        with observe_stage("decode"):
+            image = Image.open(BytesIO(image_bytes))
+            plan = ImagePlan.for_image(
+                image,
+                crop=(self.crop_left, self.crop_top, self.crop_right, self.crop_bottom),
+                max_width=self.resizing_width,
+                max_height=self.resizing_height
+            )
+            if self.reduced_decode:
+                plan.draft(image)
+            # PIL decodes lazily; load here so the decode is not attributed to the next step
+            image.load()
+        with observe_stage("resize"):
+            cropped_image = plan.apply(image)
+            # Decoded once here; later stages reuse the pixels and PNG is only encoded on demand
+            return ImageFrame.from_pil(cropped_image, source_size=plan.upright_size)
+
+    async def extract_reading_async(self, request: ReadingExtractionRequest, background_tasks: BackgroundTasks, executor: InferenceExecutor):
+        """
+        Run the extraction pipeline. The download happens on the event loop and
+        the blocking stages on the inference executor, so the event loop stays free.
+        Returns a 503 response straight away if the executor queue is full.
+        """
+        self.accept_extraction_request(request, background_tasks)
+
+        try:
+            response = await self.run_extraction(request, executor)
+        except CustomHTTPException as e:
+            response = self.handle_custom_http_exception(error=e, id=request.id)
+            return JSONResponse(
+                status_code=e.status_code,
+                content=jsonable_encoder(response, exclude_none=True),
+                headers=e.headers
+            )
+
+        self.complete_extraction_request(response, background_tasks)
+        return response
+
+    async def upload_and_extract_async(self, request: ImageUploadRequest, background_tasks: BackgroundTasks, executor: InferenceExecutor, storage_service: StorageService):
+        """
+        Store an uploaded image and extract its reading in one call.
+
+        The upload is validated once and rejected with a 503 before anything
+        is stored if the executor has no capacity. The S3 upload (on a worker
+        thread) and the extraction pipeline then run concurrently on the same
+        in-memory bytes, so the image is never downloaded back. The request and
+        its result are stored only once the upload has succeeded, so no stored
+        extraction points at a missing image. The response carries the reading
+        together with the presigned GET URL of the stored image, and is an
+        error if either of the two failed.
+        """
         request.id = request.id if request.id else uuid4()
         request.ts = request.ts if request.ts else datetime.now()
-        background_tasks.add_task(self.metadata_store.store_request, request)
+        try:
+            image_bytes, content_type, file_name = await storage_service.image_validator.validate(request)
+        except CustomHTTPException as e:
+            return self.handle_custom_http_exception(error=e, id=request.id)
+        except Exception as e:
+            return self.handle_other_exceptions(error=e, id=request.id)
+        finally:
+            await request.image.close()
 
         try:
-            start_time = datetime.now()
-            self.extraction_logger.info(str(request.model_dump_json()))
-            cropped_image = self.preprocess_image(request.imageURL)
-
-            # Get quality status from BFM classification
-            quality_result = classify_bfm_image(cropped_image)
-            quality_status = quality_result['prediction'].lower()
-            quality_confidence = quality_result['confidence']
-
-            # Only proceed with meter reading if quality is good
-            if quality_status == 'good':
-                # Detect digits and get their bounding boxes
-                meter_reading_result = self.vision_service.extract(image_bytes=cropped_image)
-                # Expecting: meter_reading, sorted_boxes, sorted_classes
-                if isinstance(meter_reading_result, tuple) and len(meter_reading_result) >= 3:
-                    meter_reading, sorted_boxes, sorted_classes = meter_reading_result
-                else:
-                    meter_reading = meter_reading_result
-                    sorted_boxes, sorted_classes = [], []
-
-                # Convert tuple to string if necessary
-                meter_reading_str = str(meter_reading[0]) if isinstance(meter_reading, tuple) else str(meter_reading)
-            else:
-                meter_reading_str = "Image quality too poor for recognition"
-                sorted_boxes = []
-                meter_reading_status = Status.UNCLEAR
-
-            processing_time = (datetime.now() - start_time).total_seconds()
-
-            # Default color result
-            color_result = {"prediction": "unknown", "confidence": 0.0}
-
-            # Only classify color if digits were detected
-            if sorted_boxes and len(sorted_boxes) > 0:
-                image_array = np.frombuffer(cropped_image, np.uint8)
-                image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-                last_box = sorted_boxes[-1]
-                last_digit_image = extract_digit_image(image, last_box)
-                color_result = classify_color_image(last_digit_image)
-
-            last_digit_color = color_result['prediction'].lower()
-            color_confidence = color_result['confidence']
-
-            if 'nometer' in meter_reading_str.lower():
-                meter_reading_status = Status.NOMETER
-            elif 'unclear' in meter_reading_str.lower() or quality_status == 'bad':
-                meter_reading_status = Status.UNCLEAR
-            else:
-                meter_reading_status = Status.SUCCESS
-             
-            result = ReadingExtractionResult(
-                status=meter_reading_status,
-                correlationId=uuid4(),
-                data=ReadingExtractionResultData(
-                    meterReading=meter_reading_str,
-                    processingTime=processing_time,
-                    qualityStatus=quality_status,
-                    qualityConfidence=quality_confidence,
-                    lastDigitColor=last_digit_color,
-                    colorConfidence=color_confidence
-                )
+            executor.check_capacity()
+        except CustomHTTPException as e:
+            response = self.handle_custom_http_exception(error=e, id=request.id)
+            return JSONResponse(
+                status_code=e.status_code,
+                content=jsonable_encoder(response, exclude_none=True),
+                headers=e.headers
+            )
+
+        # Presigning is local; the URL is only stored or returned once the object exists
+        image_url = storage_service.generate_presigned_download_url(object_key=file_name)
+        extraction_request = ReadingExtractionRequest(id=request.id, ts=request.ts, imageURL=image_url, metadata=request.metadata)
+        upload_error, response = await asyncio.gather(
+            asyncio.to_thread(storage_service.store_image, image_bytes=image_bytes, content_type=content_type, object_key=file_name),
+            self.run_extraction(extraction_request, executor, image_bytes=image_bytes),
+            return_exceptions=True
+        )
+
+        if isinstance(upload_error, CustomHTTPException):
+            return self.handle_custom_http_exception(error=upload_error, id=request.id)
+        if isinstance(upload_error, Exception):
+            return self.handle_other_exceptions(error=upload_error, id=request.id)
+        if isinstance(response, CustomHTTPException):
+            # The executor filled up after the capacity check; the image is stored but not extracted
+            error = response
+            response = self.handle_custom_http_exception(error=error, id=request.id)
+            return JSONResponse(
+                status_code=error.status_code,
+                content=jsonable_encoder(response, exclude_none=True),
+                headers=error.headers
+            )
+
+        self.accept_extraction_request(extraction_request, background_tasks)
+        self.complete_extraction_request(response, background_tasks)
+        if not isinstance(response, ReadingExtractionResponse):
+            return response
+        return ImageUploadExtractionResponse(
+            id=response.id,
+            ts=response.ts,
+            responseCode=response.responseCode,
+            statusCode=response.statusCode,
+            result=ImageUploadExtractionResult(imageURL=image_url, **dict(response.result))
+        )
+
+    def extract_readings_async(self, requests: list[ReadingExtractionRequest], background_tasks: BackgroundTasks, executor: InferenceExecutor):
+        """
+        Run the extraction pipeline for a batch of requests.
+
+        Images are fetched concurrently, up to `batch_extraction.max_concurrency`
+        at a time, and their inference is coalesced by the model batchers. Instead
+        of failing with a 503 the batch waits for executor capacity. Responses are
+        streamed as NDJSON, one line per request in order of completion. Each
+        request is stored with its response as soon as it completes, so results
+        computed before a client disconnects are kept.
+        """
+        batch_id = uuid4()
+        if len(requests) > self.batch_max_items:
+            error = CustomHTTPException(
+                status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE.value,
+                error_code=ErrorCode.BATCH_SIZE_ERROR.value,
+                detail=f"Too many requests in batch. At most {self.batch_max_items} requests are allowed."
             )
+            response = self.handle_custom_http_exception(error=error, id=batch_id)
+            return JSONResponse(status_code=error.status_code, content=jsonable_encoder(response, exclude_none=True))
+
+        for request in requests:
+            request.id = request.id if request.id else uuid4()
+            request.ts = request.ts if request.ts else datetime.now()
+            self.extraction_logger.info(str(request.model_dump_json()))
+        self.base_logger.info("Batch %s: %d extraction requests", batch_id, len(requests))
+
+        return StreamingResponse(
+            self._stream_extractions(requests, executor),
+            media_type="application/x-ndjson",
+            background=background_tasks
+        )
+
+    async def _stream_extractions(self, requests: list[ReadingExtractionRequest], executor: InferenceExecutor):
+        semaphore = asyncio.Semaphore(self.batch_max_concurrency)
+
+        async def extract(request: ReadingExtractionRequest):
+            async with semaphore:
+                response = await self.run_extraction(request, executor, wait=True)
+            # Stored before it is streamed; off the event loop as the write-behind queue may block when full
+            await asyncio.to_thread(self.metadata_store.store_extraction, request, response)
+            return response
+
+        tasks = [asyncio.create_task(extract(request)) for request in requests]
+        try:
+            for next_completed in asyncio.as_completed(tasks):
+                response = await next_completed
+                yield response.model_dump_json(exclude_none=True) + "\n"
+        finally:
+            # The client went away or the stream failed; stop work that is still queued
+            for task in tasks:
+                task.cancel()
+
+    async def run_extraction(self, request: ReadingExtractionRequest, executor: InferenceExecutor, wait: bool = False, image_bytes: bytes | None = None) -> BaseResponse:
+        """
+        Run the pipeline for one accepted request and build its response.
+        `image_bytes`, when given, is used instead of downloading `request.imageURL`.
+
+        Raises:
+            CustomHTTPException: 503 if the executor queue is full and `wait` is False
+        """
+        run_stages = None if executor.kind == "thread" else run_stages_in_worker
+        status = "ERROR"
+
+        try:
+            context = await self.pipeline.run(ExtractionContext(request=request, image_bytes=image_bytes), executor, run_stages=run_stages, wait=wait)
             response = ReadingExtractionResponse(
                 id=request.id,
                 ts=datetime.now(),
-                responseCode=response_code,
-                statusCode=status_code,
-                result=result
+                responseCode=ResponseCode.OK,
+                statusCode=HTTPStatus.OK.value,
+                result=context.result
             )
-            background_tasks.add_task(self.metadata_store.store_response, response)
+            status = context.result.status.value
+            EXTRACTION_LATENCY.labels(backend=self.model).observe(context.result.data.processingTime)
         except CustomHTTPException as e:
+            if e.error_code == ErrorCode.SERVICE_BUSY_ERROR.value:
+                raise
             response = self.handle_custom_http_exception(error=e, id=request.id)
         except Exception as e:
             response = self.handle_other_exceptions(error=e, id=request.id)
-  
+        EXTRACTIONS.labels(status=status, backend=self.model).inc()
+
         self.extraction_logger.info(str(response.model_dump_json()))
         return response
 
+    def accept_extraction_request(self, request: ReadingExtractionRequest, background_tasks: BackgroundTasks):
+        request.id = request.id if request.id else uuid4()
+        request.ts = request.ts if request.ts else datetime.now()
+        background_tasks.add_task(self.metadata_store.store_request, request)
+        self.extraction_logger.info(str(request.model_dump_json()))
+
+    def complete_extraction_request(self, response: BaseResponse, background_tasks: BackgroundTasks):
+        if isinstance(response, ReadingExtractionResponse):
+            background_tasks.add_task(self.metadata_store.store_response, response)
+
     def log_feedback(self, request: FeedbackRequest, background_tasks: BackgroundTasks):
         status_code = HTTPStatus.OK.value
         response_code = ResponseCode.OK
@@ -244,3 +396,31 @@ class ImageService:
         )
         self.base_logger.error(str(response.model_dump_json()))
         return response
+
+
+# Service instance of a process-pool worker, created by init_extraction_worker
+_worker_service = None
+
+
+def init_extraction_worker():
+    """Process-pool initializer: build the worker's own ImageService and models."""
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = ImageService(config=Config())
+
+
+def run_stages_in_worker(stage_names: list, context: ExtractionContext) -> ExtractionContext:
+    return _worker_service.pipeline.run_sync(stage_names, context)
+
+
+def preprocessing_service(config: Config) -> ImageService:
+    """ImageService with only the preprocessing settings, without loading any model."""
+    service = ImageService.__new__(ImageService)
+    service.resizing_width = config.find("image_resizing.width")
+    service.resizing_height = config.find("image_resizing.height")
+    service.reduced_decode = config.find("image_resizing.reduced_decode", default=True)
+    service.crop_left = config.find("image_crop.left")
+    service.crop_top = config.find("image_crop.top")
+    service.crop_right = config.find("image_crop.right")
+    service.crop_bottom = config.find("image_crop.bottom")
+    return service
@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from http import HTTPStatus
+
+from error.error import CustomHTTPException, ErrorCode
+from conf.config import Config
+from service.metrics import EXECUTOR_QUEUE_DEPTH, EXECUTOR_IN_FLIGHT, EXECUTOR_REJECTED, EXECUTOR_WAIT
+
+
+def _timed_call(fn, args, submitted_at):
+    # Runs inside the pool worker; wall clock is used because process workers do not share perf_counter
+    started_at = time.time()
+    return started_at - submitted_at, fn(*args)
+
+
+class InferenceExecutor:
+    """
+    Bounded pool that runs blocking inference work off the asyncio event loop.
+
+    At most `max_workers` calls run at once and at most `max_queue_size` more may
+    wait for a worker. When both are taken, `submit` fails fast with a 503
+    instead of letting the wait grow without limit.
+    """
+
+    def __init__(self, config: Config, name: str = "extraction", initializer=None, initargs=()):
+        self.name = name
+        self.base_logger = logging.getLogger(config.find("logs.api_logger.name"))
+        self.kind = config.find(f"executors.{name}.kind", default="thread")
+        self.max_workers = config.find(f"executors.{name}.max_workers", default=os.cpu_count() or 1)
+        self.max_queue_size = config.find(f"executors.{name}.max_queue_size", default=16)
+        self.retry_after = config.find(f"executors.{name}.retry_after_seconds", default=1)
+
+        if self.kind == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=initializer, initargs=initargs)
+        elif self.kind == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-worker")
+        else:
+            raise ValueError(f"Unsupported executor kind: {self.kind}")
+
+        self._capacity = self.max_workers + self.max_queue_size
+        self._in_flight = 0
+        self._semaphore = None
+        self.base_logger.info(
+            "Inference executor %s: %s pool, %d workers, queue size %d",
+            name, self.kind, self.max_workers, self.max_queue_size
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of accepted calls still waiting for a worker."""
+        return max(0, self._in_flight - self.max_workers)
+
+    async def submit(self, fn, *args, wait: bool = False):
+        """
+        Run `fn(*args)` on the pool and return its result.
+
+        Args:
+            fn: Callable to run; must be picklable when the pool is a process pool
+            args: Positional arguments for the callable
+            wait: Wait for a free slot instead of rejecting when the queue is full
+
+        Returns:
+            The return value of the callable
+
+        Raises:
+            CustomHTTPException: 503 if the queue is full and `wait` is False
+        """
+        if not wait:
+            self.check_capacity()
+
+        async with self._get_semaphore():
+            self._in_flight += 1
+            self._update_gauges()
+            try:
+                loop = asyncio.get_running_loop()
+                wait_time, result = await loop.run_in_executor(self._pool, _timed_call, fn, args, time.time())
+            finally:
+                self._in_flight -= 1
+                self._update_gauges()
+
+        EXECUTOR_WAIT.labels(executor=self.name).observe(wait_time)
+        return result
+
+    def check_capacity(self):
+        """
+        Fail fast as `submit` does when no worker or queue slot is free, so a
+        caller can reject a request before doing any other work for it.
+
+        Raises:
+            CustomHTTPException: 503 if the queue is full
+        """
+        if self._get_semaphore().locked():
+            EXECUTOR_REJECTED.labels(executor=self.name).inc()
+            self.base_logger.warning("Inference executor %s is saturated, rejecting request", self.name)
+            raise CustomHTTPException(
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE.value,
+                error_code=ErrorCode.SERVICE_BUSY_ERROR.value,
+                detail="Server is busy. Retry the request later.",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created on first use so it belongs to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._capacity)
+        return self._semaphore
+
+    def _update_gauges(self):
+        EXECUTOR_IN_FLIGHT.labels(executor=self.name).set(self._in_flight)
+        EXECUTOR_QUEUE_DEPTH.labels(executor=self.name).set(self.queue_depth)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
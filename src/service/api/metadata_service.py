@@ -1,5 +1,6 @@
 from models.models import Error, Status, ReadingExtractionRequest, ReadingExtractionResponse, ReadingExtractionResult, ReadingExtractionResultData, ResponseCode, FeedbackRequest, FeedbackResponseStatus, FeedbackResponse, FeedbackStatus, BaseResponse
 from service.api.database import DatabaseService
+from service.api.write_behind import WriteBehindQueue
 from conf.config import Config
 from conf import queries
 import json
@@ -13,50 +14,90 @@ class MetadataStore:
         self.database_service = DatabaseService(config=config)
         self.timestamp_format = "%m-%d-%Y, %H:%M:%S"
         self.base_logger = logging.getLogger(config.find("logs.api_logger.name"))
+        # Rows are batched by a write-behind queue when enabled, otherwise written one by one
+        self.write_behind = None
+        if config.find("write_behind.enabled", default=False):
+            self.write_behind = WriteBehindQueue(config=config, database_service=self.database_service)
 
     def store_request(self, request: ReadingExtractionRequest):
         try:
-            to_store = {
-                "request_id": str(request.id),
-                "image_url": request.imageURL,
-                "image_id": None,
-                "metadata": json.dumps(request.metadata) if (request.metadata is not None) else request.metadata,
-                "request_timestamp": request.ts.strftime(self.timestamp_format)
-            }
+            to_store = self.request_row(request)
             # print(f"STORING REQUEST: {to_store}")
-            self.database_service.upsert(queries.store_request, to_store)
+            if self.write_behind is not None:
+                self.write_behind.put_request(to_store)
+            else:
+                self.database_service.upsert(queries.store_request, to_store)
         except Exception as e:
             self.base_logger.error("\nError type: %s\nRequest id: %s\nTrace: %s", type(e).__name__, request.id, traceback.format_exc())
 
     def store_response(self, response: ReadingExtractionResponse):
         try:
-            to_store = {
-                "meter_reading_status": response.result.status.value,
-                "meter_reading": response.result.data.meterReading,
-                "correlation_id": str(response.result.correlationId),
-                "response_timestamp": response.ts.strftime(self.timestamp_format),
-                "request_id": str(response.id),
-                #New Response params
-                "quality_status": response.result.data.qualityStatus,
-                "quality_confidence": response.result.data.qualityConfidence,
-                "last_digit_color": response.result.data.lastDigitColor,
-                "color_confidence": response.result.data.colorConfidence,
-                "processing_time": response.result.data.processingTime
-            }
+            to_store = self.response_row(response)
             # print(f"STORING RESPONSE: {to_store}")
-            self.database_service.upsert(queries.store_response, to_store)
+            if self.write_behind is not None:
+                self.write_behind.put_response(to_store)
+            else:
+                self.database_service.upsert(queries.store_response, to_store)
         except Exception as e:
             self.base_logger.error("\nError type: %s\nRequest id: %s\nTrace: %s", type(e).__name__, response.id, traceback.format_exc())
 
     def store_feedback(self, feedback: FeedbackRequest):
         try:
-            to_store = {
-                "extracted_reading_accurate": feedback.data.accurate,
-                "actual_reading": feedback.data.actual,
-                "feedback_timestamp": feedback.ts.strftime(self.timestamp_format),
-                "correlation_id": str(feedback.correlationId)
-            }
+            to_store = self.feedback_row(feedback)
             # print(f"STORING FEEDBACK: {to_store}")
-            self.database_service.upsert(queries.store_feedback, to_store)
+            if self.write_behind is not None:
+                self.write_behind.put_feedback(to_store)
+            else:
+                self.database_service.upsert(queries.store_feedback, to_store)
         except Exception as e:
             self.base_logger.error("\nError type: %s\nRequest id: %s\nTrace: %s", type(e).__name__, feedback.id, traceback.format_exc())
+
+    def store_extraction(self, request: ReadingExtractionRequest, response: BaseResponse):
+        """
+        Store a request together with its response, if it succeeded. Through the
+        write-behind queue both become one upsert, batched with other extractions.
+        """
+        self.store_request(request)
+        if isinstance(response, ReadingExtractionResponse):
+            self.store_response(response)
+
+    def close(self):
+        """Write rows still held by the write-behind queue."""
+        if self.write_behind is not None:
+            self.write_behind.close()
+
+    def request_row(self, request: ReadingExtractionRequest) -> dict:
+        return {
+            "request_id": str(request.id),
+            "image_url": request.imageURL,
+            "image_id": None,
+            "metadata": json.dumps(request.metadata) if (request.metadata is not None) else request.metadata,
+            "request_timestamp": request.ts.strftime(self.timestamp_format)
+        }
+
+    def response_row(self, response: ReadingExtractionResponse) -> dict:
+        return {
+            "meter_reading_status": response.result.status.value,
+            "meter_reading": response.result.data.meterReading,
+            "correlation_id": str(response.result.correlationId),
+            "response_timestamp": response.ts.strftime(self.timestamp_format),
+            "request_id": str(response.id),
+            #New Response params
+            "quality_status": response.result.data.qualityStatus,
+            "quality_confidence": response.result.data.qualityConfidence,
+            "last_digit_color": response.result.data.lastDigitColor,
+            "color_confidence": response.result.data.colorConfidence,
+            "processing_time": response.result.data.processingTime,
+            "color_method": response.result.data.colorMethod,
+            "hsv_last_digit_color": response.result.data.hsvColor,
+            "hsv_color_confidence": response.result.data.hsvColorConfidence,
+            "reason_code": response.result.reasonCode.value if response.result.reasonCode else None
+        }
+
+    def feedback_row(self, feedback: FeedbackRequest) -> dict:
+        return {
+            "extracted_reading_accurate": feedback.data.accurate,
+            "actual_reading": feedback.data.actual,
+            "feedback_timestamp": feedback.ts.strftime(self.timestamp_format),
+            "correlation_id": str(feedback.correlationId)
+        }
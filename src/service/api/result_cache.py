@@ -0,0 +1,174 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+import redis
+
+from conf.config import Config
+from service.vision.image_frame import ImageFrame
+from service.metrics import RESULT_CACHE_LOOKUPS
+
+
+class LRUTTLCache:
+    """Bounded in-process LRU map whose entries also expire after `ttl_seconds`."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ExtractionResultCache:
+    """
+    Content-addressed cache of extraction results.
+
+    Keys are digests of the fetched image bytes and, optionally, of the decoded
+    pixels. Lookups go to a bounded in-process LRU first and then to an optional
+    Redis tier shared between nodes. Every key is namespaced by the model version
+    returned from `version_provider`, so results computed by older models are
+    never served; the memory tier is cleared when that version changes.
+
+    Values are the JSON-compatible `ReadingExtractionResult` fields that do not
+    change between requests (everything but the correlation id).
+    """
+
+    def __init__(self, config: Config, version_provider):
+        self.base_logger = logging.getLogger(config.find("logs.api_logger.name"))
+        self.enabled = config.find("result_cache.enabled", default=False)
+        self.hash_pixels = config.find("result_cache.hash_pixels", default=False)
+        self.version_provider = version_provider
+        self.memory = LRUTTLCache(
+            max_entries=config.find("result_cache.memory.max_entries", default=1024),
+            ttl_seconds=config.find("result_cache.memory.ttl_seconds", default=3600)
+        )
+
+        self.redis_ttl = config.find("result_cache.redis.ttl_seconds", default=86400)
+        self.redis = None
+        if self.enabled and config.find("result_cache.redis.enabled", default=False):
+            self.redis = redis.Redis.from_url(
+                config.find("result_cache.redis.url", default="redis://localhost:6379/0"),
+                socket_timeout=config.find("result_cache.redis.socket_timeout_seconds", default=0.1),
+                socket_connect_timeout=config.find("result_cache.redis.socket_timeout_seconds", default=0.1)
+            )
+
+        self._version = None
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for_bytes(image_bytes: bytes) -> str:
+        return "bytes:" + hashlib.sha256(image_bytes).hexdigest()
+
+    @staticmethod
+    def key_for_frame(frame: ImageFrame) -> str:
+        pixels = np.ascontiguousarray(frame.rgb())
+        digest = hashlib.blake2b(memoryview(pixels).cast("B"), digest_size=32)
+        digest.update(str(pixels.shape).encode())
+        return "pixels:" + digest.hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+        namespaced_key = self._namespaced(key)
+
+        value = self.memory.get(namespaced_key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(namespaced_key)
+            except redis.RedisError as e:
+                self._count("redis_errors")
+                self.base_logger.warning("Result cache Redis lookup failed: %s", str(e))
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.memory.set(namespaced_key, value)
+                self._count("redis_hits")
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: dict):
+        if not self.enabled:
+            return
+        namespaced_key = self._namespaced(key)
+        self.memory.set(namespaced_key, value)
+        self._count("sets")
+
+        if self.redis is not None:
+            try:
+                self.redis.set(namespaced_key, json.dumps(value), ex=self.redis_ttl)
+            except redis.RedisError as e:
+                self._count("redis_errors")
+                self.base_logger.warning("Result cache Redis write failed: %s", str(e))
+
+    def invalidate(self):
+        """Drop every entry of the memory tier; Redis entries are left to expire."""
+        self.memory.clear()
+        self._count("invalidations")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "enabled": self.enabled,
+            "model_version": self._version,
+            "memory_entries": len(self.memory),
+            "memory_evictions": self.memory.evictions,
+            "memory_expirations": self.memory.expirations,
+            **counts
+        }
+
+    def _namespaced(self, key: str) -> str:
+        version = self.version_provider()
+        if version != self._version:
+            if self._version is not None:
+                self.base_logger.info("Model version changed from %s to %s, invalidating result cache", self._version, version)
+                self.invalidate()
+            self._version = version
+        return f"flowvision:extraction:{version}:{key}"
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+        if name in ("memory_hits", "redis_hits", "misses"):
+            RESULT_CACHE_LOOKUPS.labels(outcome=name).inc()
@@ -1,15 +1,22 @@
 from error.error import CustomHTTPException
 from validation.validators import ImageValidator
-from models.models import ImageUploadRequest, ImageUploadResponse, ImageUploadResult
+from models.models import Error, ResponseCode, ImageUploadRequest, ImageUploadResponse, ImageUploadResult
 from conf.config import Config
+from service.metrics import observe_stage
 
+import asyncio
 import logging
+import traceback
 from http import HTTPStatus
 from datetime import datetime
 import requests
+from io import BytesIO
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
 from uuid import uuid4, UUID
+from urllib.parse import urlparse, unquote
 
 import os
 
@@ -22,29 +29,44 @@ class StorageService:
     self.image_validator = ImageValidator(config)
     self.presigned_url_expiration = config.find("presigned_url_expiration")
     self.bucket_name = config.find("s3.bucket_name")
-    self.s3_client = boto3.client("s3", aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"), aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"), config=BotoConfig(signature_version='s3v4')
+    # S3_ENDPOINT_URL points the client at an S3-compatible store (localstack, load-test stand-in)
+    endpoint_url = os.getenv("S3_ENDPOINT_URL")
+    # One client per process: it is thread-safe and keeps a pool of keep-alive connections
+    self.s3_client = boto3.client("s3", aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"), aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"), config=BotoConfig(signature_version='s3v4', s3={'addressing_style': 'path'} if endpoint_url else None, max_pool_connections=config.find("s3.max_pool_connections", default=32)),
+    endpoint_url=endpoint_url
     # endpoint_url=config.find("s3.endpoint_url"),
     )
+    # Images above multipart_threshold bytes are uploaded in parts, max_concurrency at a time
+    self.transfer_config = TransferConfig(
+      multipart_threshold=config.find("s3.upload.multipart_threshold", default=16777216),
+      multipart_chunksize=config.find("s3.upload.multipart_chunksize", default=8388608),
+      max_concurrency=config.find("s3.upload.max_concurrency", default=4)
+    )
 
-  def _send_to_storage(self, url, image_bytes, content_type):
+  def _send_to_storage(self, object_key, image_bytes, content_type):
     try:
-      http_response = requests.put(
-        url=url,
-        data=image_bytes,
-        headers={'Content-Type': content_type}
+      if len(image_bytes) < self.transfer_config.multipart_threshold:
+        # One request on a pooled connection, without the transfer manager's threads
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=object_key, Body=image_bytes, ContentType=content_type)
+      else:
+        self.s3_client.upload_fileobj(
+          BytesIO(image_bytes),
+          self.bucket_name,
+          object_key,
+          ExtraArgs={'ContentType': content_type},
+          Config=self.transfer_config
+        )
+    except ClientError as e:
+      self.logger.error(f"AWS PUT OBJECT RESPONSE: {e.response}")
+      raise CustomHTTPException(
+        status_code=e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', HTTPStatus.INTERNAL_SERVER_ERROR.value),
+        detail=f"Error uploading image to storage: {e.response.get('Error', {}).get('Message', str(e))}"
       )
     except Exception as e:
-      self.logger.error(f"Error uploading image to presigned URL: {str(e)}")
+      self.logger.error(f"Error uploading image to storage: {str(e)}")
       raise CustomHTTPException(
         status_code=HTTPStatus.INTERNAL_SERVER_ERROR.value,
-        detail=f"Error uploading image to presigned URL: {str(e)}"
-      )
-
-    if http_response.status_code != HTTPStatus.OK.value:
-      self.logger.error(f"AWS PUT BUCKET RESPONSE: {http_response.__dict__}")
-      raise CustomHTTPException(
-        status_code=http_response.status_code,
-        detail=f"Error uploading image to presigned URL: {http_response.reason}"
+        detail=f"Error uploading image to storage: {str(e)}"
       )
 
   async def _get_from_storage(self, url):
@@ -71,12 +93,10 @@ class StorageService:
 
     try:
       image_bytes, content_type, file_name = await self.image_validator.validate(request)
-      upload_url = self.generate_presigned_upload_url(object_key=file_name, content_type=content_type)
-      self.logger.info(msg=f"PRESIGNED UPLOAD URL GENERATED: {upload_url}")
       download_url = self.generate_presigned_download_url(object_key=file_name)
       self.logger.info(msg=f"PRESIGNED DOWNLOAD URL GENERATED: {download_url}")
 
-      self._send_to_storage(url=upload_url, image_bytes=image_bytes, content_type=content_type)
+      await asyncio.to_thread(self.store_image, image_bytes=image_bytes, content_type=content_type, object_key=file_name)
       await request.image.close()
 
       result = ImageUploadResult(imageURL=download_url)
@@ -96,6 +116,57 @@ class StorageService:
       if request.image:
         await request.image.close()
 
+  def store_image(self, image_bytes: bytes, content_type: str, object_key: str):
+    """
+    Upload validated image bytes to S3 through the pooled client, in parts
+    above the multipart threshold. Blocking; callers on the event loop run it
+    in a worker thread.
+    Args:
+        image_bytes (bytes): The image
+        content_type (str): The content type of the image (jpeg, jpg, or png)
+        object_key (str): The key (path) where the object will be stored in S3
+    Raises:
+        CustomHTTPException: If the upload fails
+    """
+    with observe_stage("upload"):
+      self._send_to_storage(object_key=object_key, image_bytes=image_bytes, content_type=content_type)
+
+  def object_key_from_url(self, url: str) -> str | None:
+    """
+    Key of the object in our bucket that a stored image URL points at. Only
+    the host and path are used, so this works for expired presigned URLs too.
+    Args:
+        url (str): An image URL, e.g. the presigned GET URL returned on upload
+    Returns:
+        str | None: The object key, or None if the URL is not on our bucket
+    """
+    parsed = urlparse(url)
+    host = parsed.hostname or ""
+    path = unquote(parsed.path).lstrip("/")
+    endpoint_host = urlparse(self.s3_client.meta.endpoint_url).hostname or ""
+    if not (host == endpoint_host or host.endswith(".amazonaws.com") or host.endswith("." + endpoint_host)):
+      return None
+    # Virtual-hosted style: https://<bucket>.s3.<region>.amazonaws.com/<key>
+    if host.startswith(self.bucket_name + "."):
+      return path or None
+    # Path style: https://<endpoint>/<bucket>/<key>
+    if path.startswith(self.bucket_name + "/"):
+      return path[len(self.bucket_name) + 1:] or None
+    return None
+
+  def read_image(self, object_key: str) -> bytes:
+    """
+    Read a stored image back through the pooled client. Blocking.
+    Args:
+        object_key (str): The key (path) of the object in S3
+    Returns:
+        bytes: The image
+    Raises:
+        ClientError: If the object cannot be read
+    """
+    response = self.s3_client.get_object(Bucket=self.bucket_name, Key=object_key)
+    return response["Body"].read()
+
   def generate_presigned_upload_url(self, object_key: str, content_type: str = None, expiration: int = None) -> str:
     """
     Generate a presigned URL for uploading an object to S3.
@@ -148,3 +219,23 @@ class StorageService:
         status_code=HTTPStatus.INTERNAL_SERVER_ERROR.value,
         detail=f"Failed to generate presigned download URL: {str(e)}"
       )
+
+  def handle_custom_http_exception(self, error: CustomHTTPException, id: UUID | None):
+    self.logger.error("\nError type: %s\nRequest id: %s\nTrace: %s", error.detail, id, traceback.format_exc())
+    return ImageUploadResponse(
+      id=id if id else uuid4(),
+      ts=datetime.now(),
+      responseCode=ResponseCode.ERROR,
+      statusCode=error.status_code,
+      error=Error(errorCode=error.error_code, errorMsg=error.detail or error.phrase)
+    )
+
+  def handle_other_exceptions(self, error: Exception, id: UUID | None):
+    self.logger.error("\nError type: %s\nRequest id: %s\nTrace: %s", type(error).__name__, id, traceback.format_exc())
+    return ImageUploadResponse(
+      id=id if id else uuid4(),
+      ts=datetime.now(),
+      responseCode=ResponseCode.ERROR,
+      statusCode=HTTPStatus.INTERNAL_SERVER_ERROR.value,
+      error=Error(errorCode=HTTPStatus.INTERNAL_SERVER_ERROR.value, errorMsg=str(error))
+    )
@@ -0,0 +1,162 @@
+import time
+import logging
+import threading
+import traceback
+
+from conf.config import Config
+from conf import queries
+from service.api.database import DatabaseService
+from service.metrics import WRITE_BEHIND_FLUSH_FAILURES, WRITE_BEHIND_FLUSH_LATENCY, WRITE_BEHIND_MERGED, WRITE_BEHIND_QUEUE_DEPTH, WRITE_BEHIND_ROWS
+
+
+class WriteBehindQueue:
+    """
+    Collects metadata rows in memory and writes them to the database in batches.
+
+    A background thread flushes the pending rows once `max_batch_size` of them
+    are waiting or `flush_interval_ms` after the first one arrived, whichever
+    comes first. A flush is one transaction: when both the request and the
+    response of an extraction are pending they become a single upsert, the
+    remaining requests and responses are written with executemany, and feedback
+    goes last so it finds the responses of the same flush. If that transaction
+    fails, the rows are written again one transaction each, in the same order,
+    so a bad row only loses itself. `put` blocks while `max_pending` rows are
+    waiting, and `close` drains whatever is left.
+    """
+
+    def __init__(self, config: Config, database_service: DatabaseService):
+        self.base_logger = logging.getLogger(config.find("logs.api_logger.name"))
+        self.database_service = database_service
+        self.max_batch_size = config.find("write_behind.max_batch_size", default=200)
+        self.flush_interval = config.find("write_behind.flush_interval_ms", default=200) / 1000
+        self.max_pending = config.find("write_behind.max_pending", default=10000)
+
+        self._requests = {}
+        self._responses = {}
+        self._feedback = []
+        self._first_pending_at = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of rows waiting to be written."""
+        return len(self._requests) + len(self._responses) + len(self._feedback)
+
+    def put_request(self, row: dict):
+        self._put(lambda: self._requests.__setitem__(row["request_id"], row))
+
+    def put_response(self, row: dict):
+        self._put(lambda: self._responses.__setitem__(row["request_id"], row))
+
+    def put_feedback(self, row: dict):
+        self._put(lambda: self._feedback.append(row))
+
+    def close(self, timeout: float | None = None):
+        """Stop the flush thread after writing every pending row."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        # Rows put after the thread stopped, or all rows if it never started
+        self.flush()
+
+    def flush(self):
+        """Write every pending row now."""
+        with self._condition:
+            requests, responses, feedback = self._take_pending()
+        self._write(requests, responses, feedback)
+
+    def _put(self, add):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Write-behind queue is closed")
+            if self._thread is None:
+                # Started on first use so processes that never store anything do not get a thread
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+            while self.queue_depth >= self.max_pending and not self._closed:
+                self._condition.wait()
+            add()
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            WRITE_BEHIND_QUEUE_DEPTH.set(self.queue_depth)
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._flush_due():
+                    timeout = None
+                    if self._first_pending_at is not None:
+                        timeout = max(0.0, self._first_pending_at + self.flush_interval - time.monotonic())
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+                requests, responses, feedback = self._take_pending()
+            self._write(requests, responses, feedback)
+
+    def _flush_due(self) -> bool:
+        if self._first_pending_at is None:
+            return False
+        return self.queue_depth >= self.max_batch_size or time.monotonic() - self._first_pending_at >= self.flush_interval
+
+    def _take_pending(self):
+        requests, responses, feedback = self._requests, self._responses, self._feedback
+        self._requests, self._responses, self._feedback = {}, {}, []
+        self._first_pending_at = None
+        WRITE_BEHIND_QUEUE_DEPTH.set(0)
+        # Wake producers blocked on a full queue
+        self._condition.notify_all()
+        return requests, responses, feedback
+
+    def _write(self, requests: dict, responses: dict, feedback: list):
+        num_rows = len(requests) + len(responses) + len(feedback)
+        if num_rows == 0:
+            return
+
+        merged = [{**requests[request_id], **responses[request_id]} for request_id in requests.keys() & responses.keys()]
+        request_rows = [row for request_id, row in requests.items() if request_id not in responses]
+        response_rows = [row for request_id, row in responses.items() if request_id not in requests]
+
+        statements = [
+            (queries.store_request_with_response, merged),
+            (queries.store_request, request_rows),
+            (queries.store_response, response_rows),
+            (queries.store_feedback, feedback)
+        ]
+        start_time = time.perf_counter()
+        try:
+            self.database_service.execute_many(statements)
+            WRITE_BEHIND_ROWS.labels(outcome="written").inc(num_rows)
+            WRITE_BEHIND_MERGED.inc(len(merged))
+        except Exception as e:
+            WRITE_BEHIND_FLUSH_FAILURES.inc()
+            self.base_logger.warning("Write-behind flush of %d rows failed (%s), retrying row by row", num_rows, type(e).__name__)
+            self._write_rows(statements)
+
+        latency = time.perf_counter() - start_time
+        WRITE_BEHIND_FLUSH_LATENCY.observe(latency)
+        self.base_logger.debug("Write-behind flush: %d rows (%d merged) in %.4fs, %d pending", num_rows, len(merged), latency, self.queue_depth)
+
+    def _write_rows(self, statements: list):
+        """Write every row of a failed flush in its own transaction and drop only those that fail again."""
+        for sql, rows in statements:
+            # A merged row carries both a request and its response
+            merged = sql == queries.store_request_with_response
+            num_rows = 2 if merged else 1
+            for row in rows:
+                WRITE_BEHIND_ROWS.labels(outcome="retried").inc(num_rows)
+                try:
+                    self.database_service.upsert(sql, row)
+                    WRITE_BEHIND_ROWS.labels(outcome="written").inc(num_rows)
+                    if merged:
+                        WRITE_BEHIND_MERGED.inc()
+                except Exception as e:
+                    WRITE_BEHIND_ROWS.labels(outcome="dropped").inc(num_rows)
+                    self.base_logger.error(
+                        "\nError type: %s\nWrite-behind row dropped\nRequest id: %s\nCorrelation id: %s\nTrace: %s",
+                        type(e).__name__, row.get("request_id"), row.get("correlation_id"), traceback.format_exc()
+                    )
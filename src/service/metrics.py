@@ -0,0 +1,197 @@
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+
+# Stage latencies range from well under a millisecond (NMS) to seconds (URL fetch, LLM backends)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_LATENCY = Histogram(
+    "flowvision_stage_duration_seconds",
+    "Time spent in one step of the extraction",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+PIPELINE_STAGE_LATENCY = Histogram(
+    "flowvision_pipeline_stage_duration_seconds",
+    "Time spent in one stage of the extraction pipeline",
+    ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+
+EXTRACTION_LATENCY = Histogram(
+    "flowvision_extraction_duration_seconds",
+    "Time spent running the extraction pipeline for one request",
+    ["backend"],
+    buckets=LATENCY_BUCKETS
+)
+
+EXTRACTIONS = Counter(
+    "flowvision_extractions_total",
+    "Extraction responses by reading status (ERROR for failed requests) and vision backend",
+    ["status", "backend"]
+)
+
+IMAGE_FETCH_LATENCY = Histogram(
+    "flowvision_image_fetch_duration_seconds",
+    "Time taken to download an image from its URL, retries included",
+    buckets=LATENCY_BUCKETS
+)
+
+IMAGE_FETCH_BYTES = Counter(
+    "flowvision_image_fetch_bytes_total",
+    "Bytes of images downloaded from their URL"
+)
+
+IMAGE_FETCH_RETRIES = Counter(
+    "flowvision_image_fetch_retries_total",
+    "Image downloads retried after a transport error or a retryable status"
+)
+
+IMAGE_FETCH_FAILURES = Counter(
+    "flowvision_image_fetch_failures_total",
+    "Image downloads that failed, by reason or HTTP status",
+    ["reason"]
+)
+
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "flowvision_executor_queue_depth",
+    "Accepted calls waiting for an inference executor worker",
+    ["executor"],
+    multiprocess_mode="livesum"
+)
+
+EXECUTOR_IN_FLIGHT = Gauge(
+    "flowvision_executor_in_flight",
+    "Calls running on or waiting for an inference executor",
+    ["executor"],
+    multiprocess_mode="livesum"
+)
+
+EXECUTOR_WAIT = Histogram(
+    "flowvision_executor_wait_seconds",
+    "Time an accepted call waited for an inference executor worker",
+    ["executor"],
+    buckets=LATENCY_BUCKETS
+)
+
+EXECUTOR_REJECTED = Counter(
+    "flowvision_executor_rejected_total",
+    "Calls rejected with a 503 because the executor queue was full",
+    ["executor"]
+)
+
+MODEL_LOAD_SECONDS = Gauge(
+    "flowvision_model_load_seconds",
+    "Time taken to load a model in this process",
+    ["model"],
+    multiprocess_mode="livemax"
+)
+
+MODEL_PARAMETER_BYTES = Gauge(
+    "flowvision_model_parameter_bytes",
+    "Size of the parameters and buffers of a loaded model",
+    ["model"],
+    multiprocess_mode="livemax"
+)
+
+MODEL_RSS_DELTA_BYTES = Gauge(
+    "flowvision_model_rss_delta_bytes",
+    "Growth of the process resident memory while a model was loaded",
+    ["model"],
+    multiprocess_mode="livemax"
+)
+
+BATCHER_QUEUE_DEPTH = Gauge(
+    "flowvision_batcher_queue_depth",
+    "Images waiting for the next micro-batch of a model",
+    ["model"],
+    multiprocess_mode="livesum"
+)
+
+BATCH_SIZE = Histogram(
+    "flowvision_batch_size",
+    "Images per forward pass of a micro-batched model",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+
+BATCHER_QUEUE_WAIT = Histogram(
+    "flowvision_batcher_queue_wait_seconds",
+    "Time an image waited for its micro-batch to start",
+    ["model"],
+    buckets=LATENCY_BUCKETS
+)
+
+WRITE_BEHIND_QUEUE_DEPTH = Gauge(
+    "flowvision_write_behind_queue_depth",
+    "Metadata rows waiting to be written to the database",
+    multiprocess_mode="livesum"
+)
+
+WRITE_BEHIND_FLUSH_LATENCY = Histogram(
+    "flowvision_write_behind_flush_duration_seconds",
+    "Time taken by one write-behind flush, row-by-row retries included",
+    buckets=LATENCY_BUCKETS
+)
+
+WRITE_BEHIND_FLUSH_FAILURES = Counter(
+    "flowvision_write_behind_flush_failures_total",
+    "Write-behind flushes whose transaction failed and were retried row by row"
+)
+
+WRITE_BEHIND_ROWS = Counter(
+    "flowvision_write_behind_rows_total",
+    "Metadata rows handled by the write-behind queue: written, retried after a failed flush, or dropped",
+    ["outcome"]
+)
+
+WRITE_BEHIND_MERGED = Counter(
+    "flowvision_write_behind_merged_upserts_total",
+    "Requests written together with their response as a single upsert"
+)
+
+PRESCREEN_RESULTS = Counter(
+    "flowvision_prescreen_results_total",
+    "Pre-screen outcomes: PASS or the rule that rejected the image",
+    ["result"]
+)
+
+COLOR_DECISIONS = Counter(
+    "flowvision_color_decisions_total",
+    "Last-digit colour decisions by the method that made them (hsv or cnn)",
+    ["method"]
+)
+
+RESULT_CACHE_LOOKUPS = Counter(
+    "flowvision_result_cache_lookups_total",
+    "Result cache lookups by outcome",
+    ["outcome"]
+)
+
+
+def observe_stage(stage: str):
+    """
+    Time a block of code as one extraction stage.
+
+    Usage:
+        with observe_stage("resize"):
+            ...
+    """
+    return STAGE_LATENCY.labels(stage=stage).time()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    Metrics in the Prometheus text format, with their content type.
+
+    When PROMETHEUS_MULTIPROC_DIR is set (process-pool executor or several
+    server workers) the samples written by every process are aggregated.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
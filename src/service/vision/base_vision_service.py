@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
 
+from service.vision.image_frame import ImageFrame
+
 
 class BaseVisionService(ABC):
     @abstractmethod
-    def extract(image=None, image_bytes: bytes | None = None, download_url: str | None = None):
+    def extract(image=None, image_bytes: bytes | None = None, download_url: str | None = None, frame: ImageFrame | None = None, quality: dict | None = None):
         pass
 
     def system_context(self):
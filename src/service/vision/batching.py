@@ -0,0 +1,103 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+from service.metrics import BATCHER_QUEUE_DEPTH, BATCHER_QUEUE_WAIT, BATCH_SIZE
+
+
+_STOP = object()
+
+
+class DynamicBatcher:
+    """
+    Micro-batching front for a model that accepts a list of images.
+
+    Concurrent callers are queued and a single worker thread gathers them into
+    one batch, up to `max_batch_size` images or until `max_wait_ms` has passed
+    since the first image of the batch arrived. The batch goes through one
+    forward pass and every caller gets back only its own result.
+
+    Calling the batcher mirrors calling an Ultralytics model on one image: it
+    returns a list holding that image's result, so it can be used in place of
+    the model. Its `predict_batch` mirrors a classifier handle instead (see
+    inference_utils.predict_batch), for which `infer` runs the model on a list
+    of images.
+    """
+
+    def __init__(self, model, max_batch_size: int = 8, max_wait_ms: float = 10, name: str = "model", logger=None, infer=None):
+        self.model = model
+        self.infer = infer or model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self.name = name
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._queue = queue.Queue()
+
+        self._worker = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._worker.start()
+
+    def __call__(self, image):
+        return [self.submit(image).result()]
+
+    def predict_batch(self, images) -> list:
+        """Queue every image for the next batches and return their results in order."""
+        futures = [self.submit(image) for image in images]
+        return [future.result() for future in futures]
+
+    def submit(self, image) -> Future:
+        """Queue an image for the next batch and return a future for its result."""
+        future = Future()
+        self._queue.put((image, future, time.perf_counter()))
+        BATCHER_QUEUE_DEPTH.labels(model=self.name).set(self._queue.qsize())
+        return future
+
+    def close(self):
+        """Stop the worker once the images already queued have been processed."""
+        self._queue.put(_STOP)
+        self._worker.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Put the sentinel back so the loop exits after this batch
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+
+            batch = self._collect(first)
+            started = time.perf_counter()
+            BATCHER_QUEUE_DEPTH.labels(model=self.name).set(self._queue.qsize())
+            BATCH_SIZE.labels(model=self.name).observe(len(batch))
+            queue_wait = BATCHER_QUEUE_WAIT.labels(model=self.name)
+            for _, _, enqueued in batch:
+                queue_wait.observe(started - enqueued)
+
+            try:
+                results = list(self.infer([image for image, _, _ in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Expected {len(batch)} results, got {len(results)}")
+            except Exception as e:
+                self.logger.error("Batched inference failed for %s (batch size %d): %s", self.name, len(batch), str(e))
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
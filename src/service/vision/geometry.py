@@ -0,0 +1,156 @@
+import numpy as np
+
+
+def polygon_areas(polygons):
+    """
+    Area of each polygon using the shoelace formula
+
+    Args:
+        polygons: Array of shape (N, K, 2) with the vertices of N polygons
+
+    Returns:
+        Array of shape (N,) with the area of each polygon
+    """
+    polygons = np.asarray(polygons, dtype=np.float64)
+    x = polygons[..., 0]
+    y = polygons[..., 1]
+    return 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y, axis=-1))
+
+
+def _counter_clockwise(polygons):
+    """Return the polygons with their vertices in counter-clockwise order"""
+    x = polygons[..., 0]
+    y = polygons[..., 1]
+    signed_area = np.sum(x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y, axis=-1)
+    return np.where((signed_area < 0)[:, None, None], polygons[:, ::-1], polygons)
+
+
+def _clip_areas(subjects, clips):
+    """
+    Intersection area of each subject polygon with its convex clip polygon.
+
+    Sutherland-Hodgman clipping run for all pairs at once. The clipped polygons
+    have a varying number of vertices, so they are kept in a padded array with a
+    vertex count per row.
+
+    Args:
+        subjects: Array of shape (M, 4, 2), counter-clockwise convex quads
+        clips: Array of shape (M, 4, 2), counter-clockwise convex quads
+
+    Returns:
+        Array of shape (M,) with the intersection areas
+    """
+    num_pairs = subjects.shape[0]
+    rows = np.arange(num_pairs)[:, None]
+    points = subjects
+    counts = np.full(num_pairs, subjects.shape[1])
+
+    for edge in range(clips.shape[1]):
+        start = clips[:, edge][:, None, :]
+        end = clips[:, (edge + 1) % clips.shape[1]][:, None, :]
+        width = points.shape[1]
+        index = np.arange(width)[None, :]
+        valid = index < counts[:, None]
+
+        # Previous vertex of each vertex, wrapping around at the row's own vertex count
+        prev_index = np.where(index == 0, counts[:, None] - 1, index - 1)
+        prev_points = points[rows, np.maximum(prev_index, 0)]
+
+        direction = end - start
+        side = direction[..., 0] * (points[..., 1] - start[..., 1]) - direction[..., 1] * (points[..., 0] - start[..., 0])
+        prev_side = direction[..., 0] * (prev_points[..., 1] - start[..., 1]) - direction[..., 1] * (prev_points[..., 0] - start[..., 0])
+        inside = side >= 0
+        prev_inside = prev_side >= 0
+
+        crossing = valid & (inside != prev_inside)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(crossing, prev_side / (prev_side - side), 0.0)
+        intersections = prev_points + t[..., None] * (points - prev_points)
+
+        # For every edge prev -> cur emit [intersection, cur] and keep only the valid slots
+        candidates = np.stack([intersections, points], axis=2).reshape(num_pairs, 2 * width, 2)
+        keep = np.stack([crossing, valid & inside], axis=2).reshape(num_pairs, 2 * width)
+
+        counts = keep.sum(axis=1)
+        order = np.argsort(~keep, axis=1, kind="stable")
+        new_width = max(int(counts.max()) if num_pairs else 0, 1)
+        points = candidates[rows, order[:, :new_width]]
+
+    width = points.shape[1]
+    index = np.arange(width)[None, :]
+    valid = index < counts[:, None]
+    next_index = np.where(index + 1 < counts[:, None], index + 1, 0)
+    next_points = points[rows, next_index]
+    cross = points[..., 0] * next_points[..., 1] - next_points[..., 0] * points[..., 1]
+    areas = 0.5 * np.abs(np.sum(np.where(valid, cross, 0.0), axis=1))
+    return np.where(counts >= 3, areas, 0.0)
+
+
+def intersection_areas(boxes):
+    """
+    Exact pairwise intersection areas of convex quadrilaterals
+
+    Args:
+        boxes: Array of shape (N, 4, 2) with the corner points of N oriented boxes
+
+    Returns:
+        Symmetric array of shape (N, N); the diagonal holds each box's own area
+    """
+    boxes = _counter_clockwise(np.asarray(boxes, dtype=np.float64).reshape(-1, 4, 2))
+    num_boxes = boxes.shape[0]
+    areas = np.zeros((num_boxes, num_boxes))
+    first, second = np.triu_indices(num_boxes, k=1)
+    if first.size:
+        pair_areas = _clip_areas(boxes[first], boxes[second])
+        areas[first, second] = pair_areas
+        areas[second, first] = pair_areas
+    areas[np.arange(num_boxes), np.arange(num_boxes)] = polygon_areas(boxes)
+    return areas
+
+
+def iou_matrix(boxes):
+    """
+    Pairwise Intersection over Union of oriented boxes
+
+    Args:
+        boxes: Array of shape (N, 4, 2) with the corner points of N oriented boxes
+
+    Returns:
+        Array of shape (N, N) with IoU values between 0 and 1
+    """
+    intersections = intersection_areas(boxes)
+    areas = np.diag(intersections)
+    unions = areas[:, None] + areas[None, :] - intersections
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(unions > 0, intersections / unions, 0.0)
+
+
+def greedy_nms(boxes, scores, iou_threshold=0.5):
+    """
+    Greedy non-maximum suppression over the IoU matrix of oriented boxes
+
+    Boxes are visited by descending score (ties keep their input order); each
+    kept box suppresses every remaining box whose IoU with it reaches the threshold.
+
+    Args:
+        boxes: Array of shape (N, 4, 2) with the corner points of N oriented boxes
+        scores: Array of shape (N,) with the confidence of each box
+        iou_threshold: IoU at or above which a lower-scored box is suppressed
+
+    Returns:
+        Array with the indices of the kept boxes, highest score first
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if scores.size == 0:
+        return np.empty(0, dtype=np.intp)
+
+    overlaps = iou_matrix(boxes) >= iou_threshold
+    order = np.argsort(-scores, kind="stable")
+    suppressed = np.zeros(scores.size, dtype=bool)
+    keep = []
+    for index in order:
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        suppressed |= overlaps[index]
+    return np.asarray(keep, dtype=np.intp)
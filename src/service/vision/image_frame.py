@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from service.metrics import observe_stage
+
+
+@dataclass
+class ImageFrame:
+    """
+    A decoded image passed between the extraction stages.
+
+    Holds the pixels once as a uint8 HxWx3 array together with their channel
+    order, so stages ask for the layout they need instead of re-decoding. The
+    other channel order and the PNG encoding (only needed by backends that take
+    bytes) are computed on first use and cached.
+    """
+    pixels: np.ndarray
+    color_order: str = "RGB"
+    source_size: tuple | None = None    # (width, height) of the upright source image before resizing and cropping
+    _cache: dict = field(default_factory=dict, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.color_order not in ("RGB", "BGR"):
+            raise ValueError(f"Unsupported colour order: {self.color_order}")
+        if self.source_size is None:
+            self.source_size = self.size
+
+    @classmethod
+    def from_pil(cls, image: Image.Image, source_size: tuple | None = None) -> "ImageFrame":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return cls(pixels=np.asarray(image), color_order="RGB", source_size=source_size)
+
+    @classmethod
+    def from_bytes(cls, image_bytes: bytes) -> "ImageFrame":
+        return cls.from_pil(Image.open(BytesIO(image_bytes)))
+
+    @property
+    def width(self) -> int:
+        return self.pixels.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.pixels.shape[0]
+
+    @property
+    def size(self) -> tuple:
+        return self.width, self.height
+
+    def rgb(self) -> np.ndarray:
+        """Pixels in RGB order, as expected by PIL and FastAI."""
+        return self._in_order("RGB")
+
+    def bgr(self) -> np.ndarray:
+        """Pixels in BGR order, as expected by OpenCV and Ultralytics."""
+        return self._in_order("BGR")
+
+    def to_pil(self) -> Image.Image:
+        return Image.fromarray(self.rgb())
+
+    def png_bytes(self) -> bytes:
+        """PNG encoding of the frame, for backends that only accept image bytes."""
+        if "png" not in self._cache:
+            with observe_stage("png_encode"):
+                ok, encoded = cv2.imencode(".png", self.bgr())
+            if not ok:
+                raise ValueError("Could not encode image frame as PNG")
+            self._cache["png"] = encoded.tobytes()
+        return self._cache["png"]
+
+    def _in_order(self, color_order: str) -> np.ndarray:
+        if color_order == self.color_order:
+            return self.pixels
+        if color_order not in self._cache:
+            # RGB <-> BGR is the same channel swap in both directions
+            self._cache[color_order] = cv2.cvtColor(self.pixels, cv2.COLOR_RGB2BGR)
+        return self._cache[color_order]
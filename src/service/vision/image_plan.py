@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+
+from PIL import Image, ExifTags
+
+
+# Where the point (u, v) of the upright image, in fractions of its width and
+# height, lies in the stored image, for each EXIF orientation
+_STORED_POINT = {
+    1: lambda u, v: (u, v),
+    2: lambda u, v: (1 - u, v),             # mirrored
+    3: lambda u, v: (1 - u, 1 - v),         # rotated 180
+    4: lambda u, v: (u, 1 - v),             # flipped
+    5: lambda u, v: (v, u),                 # transposed
+    6: lambda u, v: (v, 1 - u),             # rotated 90 clockwise
+    7: lambda u, v: (1 - v, 1 - u),         # transversed
+    8: lambda u, v: (1 - v, u),             # rotated 90 counter-clockwise
+}
+
+# Transposition that makes the stored image upright, as in ImageOps.exif_transpose
+_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def resize_target(size: tuple, max_width: int, max_height: int) -> tuple:
+    """
+    Size of an image of `size` scaled down to fit `max_width` along its longer
+    side if it is landscape, or `max_height` otherwise, keeping the aspect
+    ratio. Images within both limits keep their size.
+    """
+    width, height = size
+    if width <= max_width and height <= max_height:
+        return size
+    aspect_ratio = width / height
+    if width > height:
+        return max_width, int(max_width / aspect_ratio)
+    return int(max_height * aspect_ratio), max_height
+
+
+@dataclass(frozen=True)
+class ImagePlan:
+    """
+    Geometry of the preprocessing of one source image, decided before decoding.
+
+    The service makes the image upright (EXIF orientation), scales it down to
+    the resize limits and keeps the crop box, given in fractions of the upright
+    image. The plan maps the pixels of that crop back to a box in the stored
+    image, so only the box is resampled, straight to the output size, and only
+    the small result is transposed upright. JPEGs are also decoded at the
+    largest DCT scale that still covers the output resolution. The result
+    matches transposing, resizing and cropping the whole image up to
+    resampling rounding.
+    """
+    source_size: tuple      # (width, height) of the stored image
+    orientation: int        # EXIF orientation, 1-8
+    resized_size: tuple     # (width, height) of the whole upright image after resizing
+    crop_box: tuple         # (left, top, right, bottom) pixels of the output in the resized image
+    stored_box: tuple       # the same box in fractions of the stored image
+
+    @classmethod
+    def create(cls, source_size: tuple, orientation: int, crop: tuple, max_width: int, max_height: int) -> "ImagePlan":
+        """
+        Args:
+            source_size: (width, height) of the stored image
+            orientation: EXIF orientation; anything outside 1-8 is treated as 1
+            crop: (left, top, right, bottom) fractions of the upright image to keep
+            max_width: Resize limit for landscape images
+            max_height: Resize limit for other images
+
+        Returns:
+            ImagePlan for the image
+        """
+        orientation = orientation if orientation in _STORED_POINT else 1
+        upright_size = source_size[::-1] if orientation >= 5 else source_size
+        resized_width, resized_height = resize_target(upright_size, max_width, max_height)
+
+        # Rounded as Image.crop rounds the box of crop_image
+        left, top, right, bottom = crop
+        crop_box = (
+            round(left * resized_width), round(top * resized_height),
+            round(right * resized_width), round(bottom * resized_height)
+        )
+        corners = [
+            _STORED_POINT[orientation](crop_box[0] / resized_width, crop_box[1] / resized_height),
+            _STORED_POINT[orientation](crop_box[2] / resized_width, crop_box[3] / resized_height),
+        ]
+        stored_box = (
+            min(u for u, _ in corners), min(v for _, v in corners),
+            max(u for u, _ in corners), max(v for _, v in corners)
+        )
+        return cls(source_size, orientation, (resized_width, resized_height), crop_box, stored_box)
+
+    @classmethod
+    def for_image(cls, image: Image.Image, crop: tuple, max_width: int, max_height: int) -> "ImagePlan":
+        """Plan for an opened, not yet loaded, image."""
+        orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+        return cls.create(image.size, orientation, crop, max_width, max_height)
+
+    @property
+    def upright_size(self) -> tuple:
+        """(width, height) of the source image once made upright."""
+        return self.source_size[::-1] if self.orientation >= 5 else self.source_size
+
+    @property
+    def output_size(self) -> tuple:
+        """(width, height) of the upright output."""
+        left, top, right, bottom = self.crop_box
+        return right - left, bottom - top
+
+    @property
+    def stored_output_size(self) -> tuple:
+        """Size of the output before it is transposed upright."""
+        return self.output_size[::-1] if self.orientation >= 5 else self.output_size
+
+    @property
+    def draft_size(self) -> tuple:
+        """Smallest size, in stored orientation, the whole image may be decoded at."""
+        upright_width, upright_height = self.resized_size
+        return (upright_height, upright_width) if self.orientation >= 5 else (upright_width, upright_height)
+
+    def draft(self, image: Image.Image):
+        """Let a JPEG decode at reduced scale. Must be called before the image is loaded; other formats are unaffected."""
+        if self.draft_size != self.source_size:
+            image.draft("RGB", self.draft_size)
+
+    def apply(self, image: Image.Image) -> Image.Image:
+        """
+        Args:
+            image: The planned image as stored, possibly decoded at reduced scale
+
+        Returns:
+            The upright, resized and cropped image
+        """
+        width, height = image.size
+        left, top, right, bottom = self.stored_box
+        box = (left * width, top * height, right * width, bottom * height)
+        pixel_box = tuple(round(c) for c in box)
+        output_size = self.stored_output_size
+        if (pixel_box[2] - pixel_box[0], pixel_box[3] - pixel_box[1]) == output_size and all(abs(c - p) < 1e-6 for c, p in zip(box, pixel_box)):
+            # Already at the output scale, e.g. decoded at exactly the resized size: a plain crop
+            image = image.crop(pixel_box)
+        else:
+            image = image.resize(output_size, Image.LANCZOS, box=box)
+
+        if self.orientation in _TRANSPOSE:
+            image = image.transpose(_TRANSPOSE[self.orientation])
+        return image
@@ -10,10 +10,9 @@ from conf.config import Config
 from ultralytics import YOLO
 import yaml
 
+from service.vision.model_registry import get_model_registry
+from service.vision.image_frame import ImageFrame
 from service.vision.inference_utils import (
-    load_bfm_classification,
-    load_individual_numbers_model,
-    load_color_classification_model,
     classify_bfm_image,
     direct_recognize_meter_reading,
     classify_color_image
@@ -27,31 +26,34 @@ class InceptionV3VisionService(BaseVisionService):
         self.base_logger = logging.getLogger(api_logger_name)
         self.base_logger.info("Loading fine-tuned models...")
         
-        # Load models from config
-        self.bfm_classification_model = load_bfm_classification()
-        self.individual_numbers_model = load_individual_numbers_model()
-        self.color_classification_model = load_color_classification_model()
+        # Shared model handles, loaded once per process
+        model_registry = get_model_registry(config)
+        self.bfm_classification_model = model_registry.get("bfm_classification")
+        self.individual_numbers_model = model_registry.batched("individual_numbers")
+        self.color_classification_model = model_registry.get("color_classification")
         
-    def extract(self, image=None, image_bytes: bytes | None = None, download_url: str | None = None):
+    def extract(self, image=None, image_bytes: bytes | None = None, download_url: str | None = None, frame: ImageFrame | None = None, quality: dict | None = None):
         try:
-            # Convert input to image
-            if image_bytes:
-                image = Image.open(BytesIO(image_bytes))
-            elif download_url:
-                image = Image.open(BytesIO(requests.get(download_url).content))
+            # Convert input to a decoded frame
+            if frame is None:
+                if image_bytes:
+                    image = Image.open(BytesIO(image_bytes))
+                elif download_url:
+                    image = Image.open(BytesIO(requests.get(download_url).content))
+                frame = ImageFrame.from_pil(image)
             
-            # Convert to numpy array
-            img = np.array(image)
-            
-            is_meter = classify_bfm_image(img, self.bfm_classification_model)
+            # Reuse the quality result when the caller already classified this frame
+            is_meter = quality if quality is not None else classify_bfm_image(frame.rgb(), self.bfm_classification_model)
             self.base_logger.info(f"Meter classification result: {is_meter}")
             
             if is_meter['prediction'] != 'good':
                 return "nometer"
                 
-            reading = direct_recognize_meter_reading(img, self.individual_numbers_model)
+            # The digit detector works on OpenCV channel order
+            reading = direct_recognize_meter_reading(frame.bgr(), self.individual_numbers_model)
             return reading
             
         except Exception as e:
+            # Raised like the other backends, so a failed inference is reported as an error and never cached
             self.base_logger.error(f"Error in meter reading extraction: {str(e)}", exc_info=True)
-            return "unclear"
\ No newline at end of file
+            raise
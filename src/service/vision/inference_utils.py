@@ -2,6 +2,7 @@ import warnings
 warnings.filterwarnings('ignore')
 
 from fastai.vision.all import *
+from fastcore.transform import compose_tfms
 from PIL import Image
 import numpy as np
 import os
@@ -10,7 +11,12 @@ from ultralytics import YOLO
 import yaml
 
 from conf.config import Config
+from service.vision.geometry import iou_matrix, greedy_nms
+from service.vision.image_frame import ImageFrame
+from service.vision.image_preprocessor import ImagePreprocessor
+from service.metrics import observe_stage
 import logging
+from typing import NamedTuple
 
 # Load configuration
 # def load_config(config_path="src/conf/config.yaml"):
@@ -31,6 +37,17 @@ import logging
 CONFIG = Config().config
 base_logger = logging.getLogger(CONFIG['logs']['api_logger']['name'])
 extraction_logger = logging.getLogger(CONFIG['logs']['extraction_request_logger']['name'])
+# Built once per process; keeps its CLAHE objects and scratch buffers between calls
+IMAGE_PREPROCESSOR = ImagePreprocessor(Config())
+
+
+class DigitDetections(NamedTuple):
+    """Digits found on a meter, ordered left to right"""
+    reading: str
+    boxes: np.ndarray        # (N, 4, 2) int32 corner points
+    classes: np.ndarray      # (N,) digit class ids
+    confidences: np.ndarray  # (N,) detection confidences
+
 
 #Load the Bulk Flow Meter FastAI classification model
 def load_bfm_classification(model_path=None):
@@ -76,6 +93,57 @@ def load_color_classification_model(model_path=None):
     learn = load_learner(model_path)
     return learn
 
+def _shared_model(name):
+    """
+    Return the process-wide handle for a model from the model registry
+    """
+    # Imported here because the registry itself uses the loaders above
+    from service.vision.model_registry import get_model_registry
+    return get_model_registry().get(name)
+
+
+def predict_batch(model, images):
+    """
+    Classify several images in one forward pass
+    
+    Does what `Learner.predict` does for each image without building a test
+    DataLoader: the validation item transforms of the learner (resize, to
+    tensor) are applied per image, the batch transforms (to float, normalize)
+    once on the stacked batch, and the model runs in eval mode under
+    `torch.inference_mode`. Models with their own `predict_batch` (ONNX
+    Runtime) are called directly.
+    
+    Args:
+        model: FastAI learner or a model with `predict_batch`
+        images: List of images accepted by PILImage.create (RGB arrays, PIL images or paths)
+        
+    Returns:
+        List of (class, index, probabilities) per image
+    """
+    if hasattr(model, "predict_batch"):
+        return model.predict_batch(images)
+    
+    dl = model.dls.valid
+    device = next(model.model.parameters()).device
+    # split_idx=1 selects the validation behaviour of each transform (e.g. centre crop)
+    items = [compose_tfms(PILImage.create(image), dl.after_item.fs, split_idx=1) for image in images]
+    batch = compose_tfms(TensorImage(torch.stack(items)).to(device), dl.after_batch.fs, split_idx=1)
+    
+    model.model.eval()
+    with torch.inference_mode():
+        logits = model.model(batch)
+    activation = getattr(model.loss_func, "activation", noop)
+    probs = activation(logits).float().cpu()
+    
+    vocab = model.dls.vocab
+    return [(vocab[int(idx)], int(idx), row) for idx, row in zip(probs.argmax(dim=1), probs)]
+
+def _classification_result(pred_class, pred_idx, probs):
+    return {
+        'prediction': str(pred_class),
+        'confidence': float(probs[pred_idx]),
+        'all_probs': [float(p) for p in probs]
+    }
 
 # def classify_bfm_image(image_path, model=None):
 def classify_bfm_image(img, model=None):
@@ -83,115 +151,77 @@ def classify_bfm_image(img, model=None):
     Classify a Bulk Flow Meter image as good or bad
     
     Args:
-        image_path: Path to the image file or PIL Image object
-        model: Optional pre-loaded model. If None, will load the model
+        img: RGB numpy array, PIL Image or path to the image file, or a list of them
+        model: Optional pre-loaded model. If None, the shared registry model is used
         
     Returns:
-        Dictionary with classification results:
+        Dictionary with classification results, or a list of them for a list of images:
         {
             'prediction': str,       # 'good' or 'bad'
             'confidence': float,     # Probability of the prediction
             'all_probs': list        # Probabilities for all classes
         }
     """
-    # Load model if not provided
+    # Use the shared process-wide model if not provided
     if model is None:
-        model = load_bfm_classification()
-    
-    # Load the image
-    # if isinstance(image_path, str):
-    #     image = cv2.imread(image_path)
-    # elif isinstance(image_path, np.ndarray):
-    #     image = image_path
-    # else:
-    #     raise ValueError("Input must be either a file path or a numpy array")
+        model = _shared_model("bfm_classification")
     
-    # # Convert BGR to RGB since FastAI expects RGB
-    # image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    
-    # # Convert to FastAI image format
-    # img = PILImage.create(image)
+    images = img if isinstance(img, list) else [img]
     
     # Make prediction
-    pred_class, pred_idx, probs = model.predict(img)
+    with observe_stage("bfm_classify"):
+        predictions = predict_batch(model, images)
     
-    return {
-        'prediction': str(pred_class),
-        'confidence': float(probs[pred_idx]),
-        'all_probs': [float(p) for p in probs]
-    }
+    results = [_classification_result(*prediction) for prediction in predictions]
+    return results if isinstance(img, list) else results[0]
 
 def classify_color_image(image_path, model=None):
     """
     Classify a color image as red, black, or blue
+    
+    Args:
+        image_path: BGR numpy array or path to the image file, or a list of them
+            (e.g. several digit crops, classified in one forward pass)
+        model: Optional pre-loaded model. If None, the shared registry model is used
+        
+    Returns:
+        Dictionary with 'prediction', 'confidence' and 'all_probs', or a list of
+        them for a list of images
     """
     if model is None:
-        model = load_color_classification_model()
+        model = _shared_model("color_classification")
+    
+    images = []
+    for item in (image_path if isinstance(image_path, list) else [image_path]):
+        # Load the image
+        if isinstance(item, str):
+            image = cv2.imread(item)
+        elif isinstance(item, np.ndarray):
+            image = item
+        else:
+            raise ValueError("Input must be either a file path or a numpy array")
         
-    # Load the image
-    if isinstance(image_path, str):
-        image = cv2.imread(image_path)
-    elif isinstance(image_path, np.ndarray):
-        image = image_path
-    else:
-        raise ValueError("Input must be either a file path or a numpy array")
+        # Convert BGR to RGB since FastAI expects RGB
+        images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
     
-    # Convert BGR to RGB since FastAI expects RGB
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    
-    # Convert to FastAI image format
-    img = PILImage.create(image)
-
     # Make prediction
-    pred_class, pred_idx, probs = model.predict(img)
+    with observe_stage("color_classify"):
+        predictions = predict_batch(model, images)
     
-    return {
-        'prediction': str(pred_class),
-        'confidence': float(probs[pred_idx]),
-        'all_probs': [float(p) for p in probs]
-    }
+    results = [_classification_result(*prediction) for prediction in predictions]
+    return results if isinstance(image_path, list) else results[0]
 
 def enhance_image(image):
     """
     Enhance the image to improve readability for image while preserving color
-    """
-    # Get enhancement parameters from config
-    enhance_config = CONFIG['image_enhancement']
-    clahe_clip = enhance_config['clahe_clip_limit']
-    clahe_grid = tuple(enhance_config['clahe_tile_grid_size'])
-    sharp_alpha = enhance_config['sharpening_alpha']
-    sharp_beta = enhance_config['sharpening_beta']
-    color_alpha = enhance_config['color_boost_alpha']
-    color_beta = enhance_config['color_boost_beta']
-    
-    # Convert to HSV color space to separate brightness from color
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    h, s, v = cv2.split(hsv)
-    
-    # Apply adaptive thresholding to the value channel (brightness)
-    thresh = cv2.adaptiveThreshold(
-        v, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-        cv2.THRESH_BINARY, 11, 2
-    )
-    
-    # Apply unsharp masking for sharpening to the value channel
-    gaussian = cv2.GaussianBlur(v, (0, 0), 3.0)
-    sharpened_v = cv2.addWeighted(v, sharp_alpha, gaussian, sharp_beta, 0)
-    
-    # Increase contrast in the value channel
-    clahe = cv2.createCLAHE(clipLimit=clahe_clip, tileGridSize=clahe_grid)
-    enhanced_v = clahe.apply(sharpened_v)
-    
-    # Merge channels back with enhanced value channel
-    enhanced_hsv = cv2.merge([h, s, enhanced_v])
     
-    # Convert back to BGR color space
-    enhanced = cv2.cvtColor(enhanced_hsv, cv2.COLOR_HSV2BGR)
-    
-    # Apply color boost to make digits stand out more
-    enhanced_image = cv2.convertScaleAbs(enhanced, alpha=color_alpha, beta=color_beta)
-    
-    return enhanced_image
+    Args:
+        image: BGR numpy array
+        
+    Returns:
+        Enhanced BGR numpy array (see ImagePreprocessor)
+    """
+    return IMAGE_PREPROCESSOR.enhance(image)
 
 def test_image_prediction(image_path=None):
     """
@@ -218,17 +248,21 @@ def test_image_prediction(image_path=None):
 def sort_boxes_by_position(boxes, classes):
     """
     Sort detected digit boxes by their x-coordinate for left-to-right reading order.
+    
+    Args:
+        boxes: Array of shape (N, 4, 2) with the corner points of each box
+        classes: Array of shape (N,) with the class of each box
+        
+    Returns:
+        Boxes and classes as arrays, ordered left to right
     """
-    # Create a list of (box, class) tuples
-    box_class_pairs = list(zip(boxes, classes))
+    boxes = np.asarray(boxes).reshape(-1, 4, 2)
+    classes = np.asarray(classes)
     
     # For oriented bounding boxes, use the leftmost x-coordinate of each box
-    sorted_pairs = sorted(box_class_pairs, key=lambda pair: np.min(pair[0][:, 0]))
+    order = np.argsort(boxes[:, :, 0].min(axis=1), kind="stable")
     
-    # Unzip the sorted pairs back into separate lists
-    sorted_boxes, sorted_classes = zip(*sorted_pairs) if box_class_pairs else ([], [])
-    
-    return list(sorted_boxes), list(sorted_classes)
+    return boxes[order], classes[order]
 
 def calculate_iou(box1, box2):
     """
@@ -241,27 +275,7 @@ def calculate_iou(box1, box2):
     Returns:
         IoU value between 0 and 1
     """
-    # Convert polygon points to contour format for OpenCV
-    box1_contour = box1.reshape(-1, 1, 2).astype(np.int32)
-    box2_contour = box2.reshape(-1, 1, 2).astype(np.int32)
-    
-    # Create blank binary images
-    img_size = (1000, 1000)  # Large enough canvas
-    box1_mask = np.zeros(img_size, dtype=np.uint8)
-    box2_mask = np.zeros(img_size, dtype=np.uint8)
-    
-    # Fill polygons
-    cv2.fillPoly(box1_mask, [box1_contour], 1)
-    cv2.fillPoly(box2_mask, [box2_contour], 1)
-    
-    # Calculate intersection and union
-    intersection = np.logical_and(box1_mask, box2_mask).sum()
-    union = np.logical_or(box1_mask, box2_mask).sum()
-    
-    # Calculate IoU
-    if union == 0:
-        return 0
-    return intersection / union
+    return float(iou_matrix(np.stack([box1, box2]))[0, 1])
 
 def remove_overlapping_boxes(boxes, classes, confidences, iou_threshold=0.5):
     """
@@ -279,39 +293,12 @@ def remove_overlapping_boxes(boxes, classes, confidences, iou_threshold=0.5):
     if len(boxes) == 0:
         return [], [], []
     
-    # Combine data for sorting
-    box_data = list(zip(boxes, classes, confidences))
+    # IoU for all pairs at once, then greedy suppression in order of confidence
+    keep = greedy_nms(np.asarray(boxes), confidences, iou_threshold=iou_threshold)
     
-    # Sort by confidence (descending)
-    box_data.sort(key=lambda x: x[2], reverse=True)
-    
-    # Initialize lists for keeping filtered boxes
-    filtered_boxes = []
-    filtered_classes = []
-    filtered_confidences = []
-    
-    # Process boxes in order of confidence
-    while box_data:
-        # Get the box with the highest confidence
-        current_box, current_class, current_conf = box_data.pop(0)
-        
-        # Add to filtered list
-        filtered_boxes.append(current_box)
-        filtered_classes.append(current_class)
-        filtered_confidences.append(current_conf)
-        
-        # Check remaining boxes
-        remaining_boxes = []
-        for box, cls, conf in box_data:
-            # Calculate IoU between current box and this box
-            iou = calculate_iou(current_box, box)
-            
-            # If IoU is below threshold, keep this box for next iteration
-            if iou < iou_threshold:
-                remaining_boxes.append((box, cls, conf))
-        
-        # Update box_data with remaining boxes
-        box_data = remaining_boxes
+    filtered_boxes = [boxes[i] for i in keep]
+    filtered_classes = [classes[i] for i in keep]
+    filtered_confidences = [confidences[i] for i in keep]
     
     return filtered_boxes, filtered_classes, filtered_confidences
 
@@ -320,15 +307,17 @@ def direct_recognize_meter_reading(image_path, individual_numbers_model=None):
     Process image and directly recognize digits without meter detection
     
     Args:
-        image_path: Path to the input image or PIL Image object
+        image_path: Path to the input image, PIL Image, ImageFrame or BGR numpy array
         individual_numbers_model: Pre-loaded YOLO model (optional)
     
     Returns:
-        Meter reading as a string
+        DigitDetections (reading, boxes, classes, confidences), or an error string
     """
     # Step 1: Load the image
     if isinstance(image_path, str):
         image = cv2.imread(image_path)
+    elif isinstance(image_path, ImageFrame):
+        image = image_path.bgr()
     elif isinstance(image_path, (np.ndarray, Image.Image)):
         if isinstance(image_path, Image.Image):
             image = np.array(image_path)
@@ -342,54 +331,73 @@ def direct_recognize_meter_reading(image_path, individual_numbers_model=None):
         return "Error: Could not load image"
     
     # Step 2: Enhance the image for better digit recognition
-    enhanced_image = enhance_image(image)
+    with observe_stage("enhance"):
+        enhanced_image = enhance_image(image)
     
     # Step 3: Detect individual numbers directly on the enhanced image
     if individual_numbers_model is None:
-        individual_numbers_model = load_individual_numbers_model()
-    digit_results = individual_numbers_model(enhanced_image)
+        individual_numbers_model = _shared_model("individual_numbers")
+    with observe_stage("yolo_detect"):
+        digit_results = individual_numbers_model(enhanced_image)
+    
+    # Step 4: Confidence filter, overlap removal and left-to-right ordering on whole arrays
+    with observe_stage("nms"):
+        detections = postprocess_digit_results(digit_results)
+    if len(detections.boxes) == 0:
+        return "Error: No digits detected in the image"
+    
+    return detections
+
+def postprocess_digit_results(digit_results, min_confidence=0.3, iou_threshold=0.3):
+    """
+    Turn YOLO OBB results into the digits of a meter reading
     
-    digit_boxes = []
-    digit_classes = []
-    digit_confidences = []
+    Each result's boxes, classes and confidences are moved off the device once
+    as whole arrays; filtering, non-maximum suppression and ordering then run on
+    those arrays.
     
-    # Process digit detection results
+    Args:
+        digit_results: Iterable of Ultralytics results with an `obb` attribute
+        min_confidence: Detections at or below this confidence are dropped
+        iou_threshold: IoU at or above which the less confident box is dropped
+        
+    Returns:
+        DigitDetections with the reading and the boxes, classes and confidences
+        of the kept digits ordered left to right
+    """
+    boxes, classes, confidences = [], [], []
     for result in digit_results:
-        if hasattr(result, 'obb') and result.obb is not None:
-            xyxyxyxy = result.obb.xyxyxyxy  # polygon format with 4-points
-            class_ids = result.obb.cls.int()  # class ids of each box
-            confidences = result.obb.conf  # confidence scores
-            
-            # Process each detected digit
-            for i, box in enumerate(xyxyxyxy):
-                # Convert tensor to numpy array and reshape to 4 points format
-                points = box.cpu().numpy().reshape(-1, 2).astype(np.int32)
-                class_id = class_ids[i].item()
-                confidence = confidences[i].item()
-                
-                # Only consider high confidence detections
-                if confidence > 0.3:
-                    digit_boxes.append(points)
-                    digit_classes.append(class_id)
-                    digit_confidences.append(confidence)
-                extraction_logger.debug("Original digit results: %s", digit_classes)
-    
-    # Step 4: Remove overlapping boxes
-    if digit_boxes:
-        digit_boxes, digit_classes, digit_confidences = remove_overlapping_boxes(
-            digit_boxes, digit_classes, digit_confidences, iou_threshold=0.3
-        )
-    
-    # Step 5: Post-processing - sort the digits from left to right
-    if not digit_boxes:
-        return "Error: No digits detected in the image"
+        obb = getattr(result, 'obb', None)
+        if obb is None:
+            continue
+        boxes.append(obb.xyxyxyxy.cpu().numpy().reshape(-1, 4, 2))
+        classes.append(obb.cls.cpu().numpy().astype(np.int64))
+        confidences.append(obb.conf.cpu().numpy())
+    
+    if not boxes:
+        return DigitDetections("", np.empty((0, 4, 2), dtype=np.int32), np.empty(0, dtype=np.int64), np.empty(0))
+    
+    boxes = np.concatenate(boxes).astype(np.int32)
+    classes = np.concatenate(classes)
+    confidences = np.concatenate(confidences)
+    extraction_logger.debug("Original digit results: %s", classes)
+    
+    # Only consider high confidence detections
+    confident = confidences > min_confidence
+    boxes, classes, confidences = boxes[confident], classes[confident], confidences[confident]
+    
+    # Remove overlapping boxes, keeping the most confident one
+    keep = greedy_nms(boxes, confidences, iou_threshold=iou_threshold)
+    boxes, classes, confidences = boxes[keep], classes[keep], confidences[keep]
     
-    sorted_boxes, sorted_classes = sort_boxes_by_position(digit_boxes, digit_classes)
+    # Sort the digits from left to right
+    order = np.argsort(boxes[:, :, 0].min(axis=1), kind="stable")
+    boxes, classes, confidences = boxes[order], classes[order], confidences[order]
     
-    # Step 6: Extract the class labels and join them to form the digit sequence
-    meter_reading = ''.join([str(cls) for cls in sorted_classes])
+    # Join the class labels to form the digit sequence
+    meter_reading = ''.join(classes.astype(str))
     
-    return meter_reading , sorted_boxes , sorted_classes
+    return DigitDetections(meter_reading, boxes, classes, confidences)
 
 # Function to extract digit image from its bounding box
 def extract_digit_image(image, box):
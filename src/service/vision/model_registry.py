@@ -0,0 +1,246 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from functools import partial
+
+from conf.config import Config
+from service.metrics import MODEL_LOAD_SECONDS, MODEL_PARAMETER_BYTES, MODEL_RSS_DELTA_BYTES
+from service.vision.batching import DynamicBatcher
+from service.vision.onnx_backend import QUANTIZATION_MODES, load_onnx_classifier, load_onnx_detector, quantized_path
+from service.vision.inference_utils import (
+    load_bfm_classification,
+    load_individual_numbers_model,
+    load_color_classification_model,
+    predict_batch
+)
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for the fine-tuned models.
+
+    Each model configured under `models` is loaded at most once per process and
+    the same handle is shared by every caller. Load time and memory footprint of
+    each model are exported as Prometheus gauges.
+
+    With `inference.backend: onnx` the models exported by tools.export_onnx are
+    loaded from `inference.onnx.models` instead and run with ONNX Runtime; the
+    handles keep the interfaces of the PyTorch models. Models with a mode under
+    `inference.onnx.quantization` load their INT8 variant.
+    """
+
+    loaders = {
+        "bfm_classification": load_bfm_classification,
+        "individual_numbers": load_individual_numbers_model,
+        "color_classification": load_color_classification_model,
+    }
+
+    onnx_loaders = {
+        "bfm_classification": load_onnx_classifier,
+        "individual_numbers": load_onnx_detector,
+        "color_classification": load_onnx_classifier,
+    }
+
+    # Models called through inference_utils.predict_batch rather than on a list of images
+    classifiers = {"bfm_classification", "color_classification"}
+
+    # PyTorch models whose predictor keeps per-call state (Ultralytics), so one
+    # handle must not run on several threads at once
+    not_thread_safe = {"individual_numbers"}
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.base_logger = logging.getLogger(config.find("logs.api_logger.name"))
+        self.backend = config.find("inference.backend", default="torch")
+        if self.backend not in ("torch", "onnx"):
+            raise ValueError(f"Unsupported inference backend: {self.backend}")
+        self._models = {}
+        self._batchers = {}
+        self._serialized = {}
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str):
+        """
+        Return the shared handle for a model, loading it on first use.
+
+        Args:
+            name: Key of the model under `models` in the config
+
+        Returns:
+            The loaded model object
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            # Another thread may have finished loading while we waited
+            if name not in self._models:
+                self._models[name] = self._load(name)
+            return self._models[name]
+
+    def batched(self, name: str):
+        """
+        Return a shared micro-batching front for a model if batching is enabled
+        for it under `batching.<name>`, otherwise the plain model handle.
+        Classifier fronts batch `predict_batch` calls, detector fronts calls on
+        one image. Without batching, PyTorch models that are not thread-safe
+        are returned behind a lock so concurrent executor threads take turns.
+
+        Args:
+            name: Key of the model under `models` in the config
+
+        Returns:
+            A DynamicBatcher wrapping the model, a SerializedModel, or the model itself
+        """
+        if not self.config.find(f"batching.{name}.enabled", default=False):
+            model = self.get(name)
+            if self.backend == "onnx" or name not in self.not_thread_safe:
+                return model
+            with self._lock:
+                if name not in self._serialized:
+                    self._serialized[name] = SerializedModel(model)
+                return self._serialized[name]
+
+        model = self.get(name)
+        with self._lock:
+            if name not in self._batchers:
+                self._batchers[name] = DynamicBatcher(
+                    model,
+                    max_batch_size=self.config.find(f"batching.{name}.max_batch_size", default=8),
+                    max_wait_ms=self.config.find(f"batching.{name}.max_wait_ms", default=10),
+                    name=name,
+                    logger=self.base_logger,
+                    infer=partial(predict_batch, model) if name in self.classifiers else None
+                )
+            return self._batchers[name]
+
+    def preload(self, names=None):
+        """Load the given models (all known models by default) up front."""
+        for name in names or self.loaders.keys():
+            self.get(name)
+
+    def version(self) -> str:
+        """
+        Short digest identifying the loaded model files by their content.
+        Changes whenever different weights are loaded, and only then.
+        """
+        fingerprints = sorted(f"{name}={fingerprint}" for name, fingerprint in self._fingerprints.items())
+        return hashlib.sha256("|".join(fingerprints).encode()).hexdigest()[:16]
+
+    def _load(self, name: str):
+        if name not in self.loaders:
+            raise KeyError(f"Unknown model: {name}")
+
+        rss_before = _rss_bytes()
+        start_time = time.perf_counter()
+        if self.backend == "onnx":
+            model_path = self.config.find(f"inference.onnx.models.{name}")
+            quantization = self.config.find(f"inference.onnx.quantization.{name}", default=None)
+            if quantization:
+                if quantization not in QUANTIZATION_MODES:
+                    raise ValueError(f"Unsupported quantization for {name}: {quantization}")
+                model_path = quantized_path(model_path, quantization)
+            self.base_logger.info("Loading ONNX model %s from %s", name, model_path)
+            model = self.onnx_loaders[name](
+                model_path,
+                intra_op_threads=self.config.find(f"inference.onnx.threads.{name}.intra_op", default=self.config.find("inference.onnx.intra_op_threads", default=0)),
+                inter_op_threads=self.config.find(f"inference.onnx.threads.{name}.inter_op", default=self.config.find("inference.onnx.inter_op_threads", default=0))
+            )
+        else:
+            model_path = self.config.find(f"models.{name}")
+            self.base_logger.info("Loading model %s from %s", name, model_path)
+            model = self.loaders[name](model_path)
+        load_time = time.perf_counter() - start_time
+        rss_after = _rss_bytes()
+        parameter_bytes = _parameter_bytes(model)
+
+        self._fingerprints[name] = _file_digest(model_path)
+        MODEL_LOAD_SECONDS.labels(model=name).set(load_time)
+        MODEL_PARAMETER_BYTES.labels(model=name).set(parameter_bytes)
+        if rss_before is not None and rss_after is not None:
+            MODEL_RSS_DELTA_BYTES.labels(model=name).set(rss_after - rss_before)
+        self.base_logger.info(
+            "Loaded model %s in %.2fs (parameters: %.1f MB)",
+            name, load_time, parameter_bytes / (1024 * 1024)
+        )
+        return model
+
+
+class SerializedModel:
+    """
+    Model handle that runs one call at a time.
+
+    Calls go to the wrapped model under a lock; every other attribute is read
+    from the model, so the handle can be used in place of it.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self.model(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def _torch_module(model):
+    # FastAI learners and Ultralytics wrappers both keep the nn.Module on `.model`
+    module = getattr(model, "model", model)
+    return module if hasattr(module, "parameters") else None
+
+
+def _parameter_bytes(model) -> int:
+    if hasattr(model, "parameter_bytes"):
+        return model.parameter_bytes
+    module = _torch_module(model)
+    if module is None:
+        return 0
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def _file_digest(path) -> str:
+    # Content hash, so copying or re-deploying the same weights keeps cached results valid
+    try:
+        if not os.path.exists(path):
+            return str(path)
+        paths = [path] if os.path.isfile(path) else sorted(
+            os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+        )
+        digest = hashlib.sha256()
+        for file_path in paths:
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        return digest.hexdigest()
+    except (OSError, TypeError):
+        return str(path)
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry(config: Config | None = None) -> ModelRegistry:
+    """Return the process-wide model registry, creating it on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry(config=config or Config())
+    return _registry
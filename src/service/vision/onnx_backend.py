@@ -0,0 +1,269 @@
+import os
+import json
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+from PIL import Image
+
+from service.vision.geometry import greedy_nms
+
+
+def metadata_path(model_path: str) -> str:
+    """Path of the JSON file written next to an exported model by tools.export_onnx."""
+    return os.path.splitext(model_path)[0] + ".json"
+
+
+QUANTIZATION_MODES = ("dynamic", "static")
+
+
+def quantized_path(model_path: str, mode: str) -> str:
+    """Path of the INT8 variant of an exported model written by tools.quantize_onnx."""
+    return f"{os.path.splitext(model_path)[0]}.int8-{mode}.onnx"
+
+
+def session_options(intra_op_threads: int = 0, inter_op_threads: int = 0) -> ort.SessionOptions:
+    """
+    Args:
+        intra_op_threads: Threads used inside one operator; 0 lets ONNX Runtime use all cores
+        inter_op_threads: Threads running independent operators in parallel; 0 for the default
+
+    Returns:
+        Session options with full graph optimisation and the given thread counts
+    """
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    if inter_op_threads > 1:
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return options
+
+
+class _OnnxModel:
+    def __init__(self, model_path: str, intra_op_threads: int = 0, inter_op_threads: int = 0):
+        self.model_path = model_path
+        with open(metadata_path(model_path), "r") as f:
+            self.metadata = json.load(f)
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=session_options(intra_op_threads, inter_op_threads),
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    @property
+    def parameter_bytes(self) -> int:
+        return os.path.getsize(self.model_path)
+
+
+class OnnxClassifier(_OnnxModel):
+    """
+    An exported FastAI image classifier run with ONNX Runtime.
+
+    The validation transforms of the learner (resize, scaling to [0, 1] and
+    normalisation) are stored in the metadata file at export time and redone
+    here with PIL and NumPy, so `predict` takes the same inputs and returns the
+    same (class, index, probabilities) triple as `Learner.predict`.
+    """
+
+    def __init__(self, model_path: str, intra_op_threads: int = 0, inter_op_threads: int = 0):
+        super().__init__(model_path, intra_op_threads, inter_op_threads)
+        self.vocab = self.metadata["vocab"]
+        self.width, self.height = self.metadata["size"]
+        self.resize_method = self.metadata.get("resize_method", "crop")
+        self.pad_mode = self.metadata.get("pad_mode", "reflection")
+        self.activation = self.metadata.get("activation", "softmax")
+        mean = self.metadata.get("mean")
+        std = self.metadata.get("std")
+        self.mean = np.asarray(mean, dtype=np.float32).reshape(3, 1, 1) if mean else None
+        self.std = np.asarray(std, dtype=np.float32).reshape(3, 1, 1) if std else None
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images: list) -> list:
+        """
+        Args:
+            images: PIL images or RGB uint8 arrays
+
+        Returns:
+            List of (class, index, probabilities) per image
+        """
+        batch = np.stack([self.preprocess(image) for image in images])
+        logits = self.session.run(None, {self.input_name: batch})[0]
+        probs = self._activate(logits)
+        results = []
+        for row in probs:
+            index = int(row.argmax())
+            results.append((self.vocab[index], index, row))
+        return results
+
+    def preprocess(self, image) -> np.ndarray:
+        """Resize like FastAI's validation `Resize` and return a normalised CHW float32 array."""
+        if not isinstance(image, Image.Image):
+            image = Image.fromarray(np.asarray(image))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        width, height = image.size
+        if self.resize_method == "squish":
+            crop_width, crop_height = width, height
+        else:
+            # Crop keeps the largest centred region with the target aspect ratio, pad the smallest enclosing one
+            ratio_w, ratio_h = width / self.width, height / self.height
+            scale = min(ratio_w, ratio_h) if self.resize_method == "crop" else max(ratio_w, ratio_h)
+            crop_width, crop_height = int(scale * self.width), int(scale * self.height)
+        left, top = int(0.5 * (width - crop_width)), int(0.5 * (height - crop_height))
+
+        if left < 0 or top < 0:
+            pixels = np.asarray(image)
+            pad_x, pad_y = max(0, -left), max(0, -top)
+            border = cv2.BORDER_REFLECT_101 if self.pad_mode == "reflection" else cv2.BORDER_CONSTANT
+            pixels = cv2.copyMakeBorder(pixels, pad_y, crop_height - height - pad_y, pad_x, crop_width - width - pad_x, border)
+            image = Image.fromarray(pixels)
+            left, top = max(0, left), max(0, top)
+
+        image = image.crop((left, top, left + crop_width, top + crop_height)).resize((self.width, self.height), Image.BILINEAR)
+        pixels = np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255.0
+        if self.mean is not None:
+            pixels = (pixels - self.mean) / self.std
+        return pixels
+
+    def _activate(self, logits: np.ndarray) -> np.ndarray:
+        if self.activation == "softmax":
+            exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+            return exp / exp.sum(axis=1, keepdims=True)
+        if self.activation == "sigmoid":
+            return 1.0 / (1.0 + np.exp(-logits))
+        return logits
+
+
+class _HostArray:
+    """Array with the `.cpu().numpy()` accessors of the torch tensors in Ultralytics results."""
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class OnnxOBB:
+    def __init__(self, corners: np.ndarray, classes: np.ndarray, confidences: np.ndarray):
+        self.xyxyxyxy = _HostArray(corners)
+        self.cls = _HostArray(classes)
+        self.conf = _HostArray(confidences)
+
+
+class OnnxOBBResult:
+    def __init__(self, obb: OnnxOBB, orig_shape: tuple, names: dict):
+        self.obb = obb
+        self.orig_shape = orig_shape
+        self.names = names
+
+
+class OnnxOBBDetector(_OnnxModel):
+    """
+    An exported Ultralytics oriented-box detector run with ONNX Runtime.
+
+    Mirrors calling the Ultralytics model on BGR images: letterboxing to the
+    export size, confidence filtering, class-aware rotated NMS and scaling back
+    to the input image. Returns one result per image with an `obb` holding
+    `xyxyxyxy`, `cls` and `conf`, so `postprocess_digit_results` works as is.
+    """
+
+    def __init__(self, model_path: str, intra_op_threads: int = 0, inter_op_threads: int = 0,
+                 conf_threshold: float = 0.25, iou_threshold: float = 0.7, max_detections: int = 300):
+        super().__init__(model_path, intra_op_threads, inter_op_threads)
+        self.imgsz = int(self.metadata["imgsz"])
+        self.names = {int(k): v for k, v in self.metadata["names"].items()}
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+
+    def __call__(self, images):
+        batch = images if isinstance(images, list) else [images]
+        inputs, transforms = zip(*(self.letterbox(image) for image in batch))
+        # Exported with a dynamic batch axis: (B, 4 + classes + 1, anchors)
+        outputs = self.session.run(None, {self.input_name: np.stack(inputs)})[0]
+        return [
+            self._postprocess(prediction, transform, image.shape[:2])
+            for prediction, transform, image in zip(outputs, transforms, batch)
+        ]
+
+    def letterbox(self, image: np.ndarray):
+        """Scale a BGR image into an imgsz x imgsz canvas padded with grey, as Ultralytics does."""
+        height, width = image.shape[:2]
+        gain = min(self.imgsz / height, self.imgsz / width)
+        new_width, new_height = int(round(width * gain)), int(round(height * gain))
+        pad_x, pad_y = (self.imgsz - new_width) / 2, (self.imgsz - new_height) / 2
+
+        if (new_width, new_height) != (width, height):
+            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+        left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+        image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+        tensor = np.ascontiguousarray(image[..., ::-1].transpose(2, 0, 1), dtype=np.float32) / 255.0
+        return tensor, (gain, left, top)
+
+    def _postprocess(self, prediction: np.ndarray, transform: tuple, orig_shape: tuple) -> OnnxOBBResult:
+        prediction = prediction.T
+        num_classes = prediction.shape[1] - 5
+        scores = prediction[:, 4:4 + num_classes]
+        classes = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), classes]
+
+        keep = confidences > self.conf_threshold
+        xywh, angles = prediction[keep, :4], prediction[keep, -1]
+        classes, confidences = classes[keep], confidences[keep]
+
+        gain, left, top = transform
+        centers = (xywh[:, :2] - np.array([left, top], dtype=np.float32)) / gain
+        sizes = xywh[:, 2:4] / gain
+        corners = xywhr_to_corners(centers, sizes, angles)
+
+        if len(corners):
+            # Offsetting each class keeps boxes of different classes from suppressing each other
+            offsets = (classes * (4 * max(orig_shape) + self.imgsz))[:, None, None]
+            order = greedy_nms(corners + offsets, confidences, iou_threshold=self.iou_threshold)[:self.max_detections]
+            corners, classes, confidences = corners[order], classes[order], confidences[order]
+
+        obb = OnnxOBB(corners.astype(np.float32), classes.astype(np.float32), confidences.astype(np.float32))
+        return OnnxOBBResult(obb, orig_shape, self.names)
+
+
+def xywhr_to_corners(centers: np.ndarray, sizes: np.ndarray, angles: np.ndarray) -> np.ndarray:
+    """
+    Corner points of rotated boxes
+
+    Args:
+        centers: Array of shape (N, 2) with box centres
+        sizes: Array of shape (N, 2) with box widths and heights
+        angles: Array of shape (N,) with rotations in radians
+
+    Returns:
+        Array of shape (N, 4, 2) in the corner order used by Ultralytics
+    """
+    cos, sin = np.cos(angles), np.sin(angles)
+    half_w, half_h = sizes[:, 0] / 2, sizes[:, 1] / 2
+    vec1 = np.stack([half_w * cos, half_w * sin], axis=1)
+    vec2 = np.stack([-half_h * sin, half_h * cos], axis=1)
+    return np.stack([
+        centers + vec1 + vec2,
+        centers + vec1 - vec2,
+        centers - vec1 - vec2,
+        centers - vec1 + vec2,
+    ], axis=1)
+
+
+def load_onnx_classifier(model_path: str, intra_op_threads: int = 0, inter_op_threads: int = 0) -> OnnxClassifier:
+    return OnnxClassifier(model_path, intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
+
+
+def load_onnx_detector(model_path: str, intra_op_threads: int = 0, inter_op_threads: int = 0) -> OnnxOBBDetector:
+    return OnnxOBBDetector(model_path, intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
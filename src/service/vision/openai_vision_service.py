@@ -3,6 +3,7 @@ import base64
 
 from error.error import CustomHTTPException, ErrorCode
 from service.vision.base_vision_service import BaseVisionService
+from service.vision.image_frame import ImageFrame
 from conf.config import Config
 
 import os
@@ -18,8 +19,11 @@ class OpenAIVisionService(BaseVisionService):
 
 
     # Will need to change to just use url
-    def extract(self, image=None, image_bytes: bytes | None = None, download_url: str | None = None) -> str:
+    def extract(self, image=None, image_bytes: bytes | None = None, download_url: str | None = None, frame: ImageFrame | None = None, quality: dict | None = None) -> str:
         try:
+            # The API takes encoded images, so this is the one place a frame is turned into PNG
+            if frame is not None and image_bytes is None:
+                image_bytes = frame.png_bytes()
 
             content_messages = []
             content_messages.append({"type": "text", "text": "Extract the meter readings from the image"})
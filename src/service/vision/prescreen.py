@@ -0,0 +1,65 @@
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+from conf.config import Config
+from models.models import PrescreenReason
+from service.vision.image_frame import ImageFrame
+
+
+class PrescreenResult(NamedTuple):
+    reason: PrescreenReason | None      # first rule the image failed, None if it passed
+    stats: dict
+
+
+class ImagePrescreen:
+    """
+    Cheap checks that reject images no model can read.
+
+    Works on a grayscale copy of the frame decimated to about `analysis_width`
+    pixels wide, plus the size of the uploaded image. The rules run in order
+    and the first one that fails is the reason:
+
+    - TOO_SMALL: the upright source image is smaller than `min_source_width` x `min_source_height`
+    - TOO_DARK: more than `max_dark_fraction` of the pixels are at or below `dark_level`
+    - OVEREXPOSED: more than `max_bright_fraction` of the pixels are at or above `bright_level`
+    - BLURRY: the variance of the Laplacian is below `min_laplacian_variance`
+    """
+
+    def __init__(self, config: Config):
+        self.analysis_width = config.find("prescreen.analysis_width", default=256)
+        self.min_source_width = config.find("prescreen.min_source_width", default=0)
+        self.min_source_height = config.find("prescreen.min_source_height", default=0)
+        self.dark_level = config.find("prescreen.dark_level", default=20)
+        self.max_dark_fraction = config.find("prescreen.max_dark_fraction", default=1.0)
+        self.bright_level = config.find("prescreen.bright_level", default=250)
+        self.max_bright_fraction = config.find("prescreen.max_bright_fraction", default=1.0)
+        self.min_laplacian_variance = config.find("prescreen.min_laplacian_variance", default=0.0)
+
+    def check(self, frame: ImageFrame) -> PrescreenResult:
+        source_width, source_height = frame.source_size
+        if source_width < self.min_source_width or source_height < self.min_source_height:
+            return PrescreenResult(PrescreenReason.TOO_SMALL, {"source_size": frame.source_size})
+
+        gray = self.downsampled_gray(frame)
+        histogram = np.bincount(gray.ravel(), minlength=256)
+        dark_fraction = histogram[:self.dark_level + 1].sum() / gray.size
+        bright_fraction = histogram[self.bright_level:].sum() / gray.size
+        stats = {"dark_fraction": float(dark_fraction), "bright_fraction": float(bright_fraction)}
+        if dark_fraction > self.max_dark_fraction:
+            return PrescreenResult(PrescreenReason.TOO_DARK, stats)
+        if bright_fraction > self.max_bright_fraction:
+            return PrescreenResult(PrescreenReason.OVEREXPOSED, stats)
+
+        stats["laplacian_variance"] = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+        if stats["laplacian_variance"] < self.min_laplacian_variance:
+            return PrescreenResult(PrescreenReason.BLURRY, stats)
+        return PrescreenResult(None, stats)
+
+    def downsampled_gray(self, frame: ImageFrame) -> np.ndarray:
+        # Plain decimation: an area filter would cost more than all the statistics together
+        step = max(1, frame.width // self.analysis_width)
+        pixels = frame.pixels[::step, ::step]
+        code = cv2.COLOR_RGB2GRAY if frame.color_order == "RGB" else cv2.COLOR_BGR2GRAY
+        return cv2.cvtColor(np.ascontiguousarray(pixels), code)
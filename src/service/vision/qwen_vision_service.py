@@ -2,6 +2,7 @@ from transformers import Qwen2VLForConditionalGeneration, AutoTokenizer, AutoPro
 from qwen_vl_utils import process_vision_info
 import torch
 from service.vision.base_vision_service import BaseVisionService
+from service.vision.image_frame import ImageFrame
 import base64
 from conf.config import Config
 import logging
@@ -28,9 +29,12 @@ class QwenVisionService(BaseVisionService):
     self.processor = AutoProcessor.from_pretrained(model_name, trust_remote_code=True, device_map=device_map)
 
 
-  def extract(self, image=None, image_bytes: bytes | None = None, download_url: str | None = None):
+  def extract(self, image=None, image_bytes: bytes | None = None, download_url: str | None = None, frame: ImageFrame | None = None, quality: dict | None = None):
 
     try:
+      if frame is not None and image_bytes is None:
+          image_bytes = frame.png_bytes()
+
       content_messages = []
       content_messages.append({"type": "text", "text": "Extract the meter readings from the image"})
 
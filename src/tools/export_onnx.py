@@ -0,0 +1,183 @@
+"""
+Export the BFM, colour and digit models to ONNX and check parity.
+
+The FastAI classifiers are exported from their `nn.Module` with a dynamic
+batch axis; the validation transforms (resize, normalisation), the vocab and
+the output activation are written to a JSON file next to each .onnx file so
+OnnxClassifier can reproduce `Learner.predict`. The Ultralytics detector is
+exported with its own exporter (dynamic batch, simplified graph) together with
+its class names and input size.
+
+After exporting, every model is run through PyTorch and ONNX Runtime on the
+same images and compared: maximum probability difference and top-1 agreement
+for the classifiers, reading agreement and box distance for the detector. The
+exit status is 1 if parity is not met. Images come from --images (meter photos
+as sent to the service) and --digit-images (digit crops for the colour model)
+or are rendered synthetically.
+
+Paths are read from `models.*` and written to `inference.onnx.models.*` of
+the config. Run from the repository root:
+    PYTHONPATH=src python -m tools.export_onnx
+    PYTHONPATH=src python -m tools.export_onnx --models bfm_classification --parity-only
+"""
+import os
+import sys
+import json
+import glob
+import shutil
+import argparse
+
+import cv2
+import numpy as np
+import torch
+from fastai.vision.all import PILImage, load_learner
+from ultralytics import YOLO
+
+from conf.config import Config
+from benchmarks.synthetic import synthetic_meter
+from service.vision.inference_utils import enhance_image, extract_digit_image, postprocess_digit_results
+from service.vision.onnx_backend import OnnxClassifier, OnnxOBBDetector, metadata_path
+
+
+CLASSIFIERS = ("bfm_classification", "color_classification")
+DETECTORS = ("individual_numbers",)
+
+
+def classifier_metadata(learn) -> dict:
+    """Validation transforms, vocab and activation of a FastAI learner."""
+    resize = next((tfm for tfm in learn.dls.valid.after_item if type(tfm).__name__ == "Resize"), None)
+    if resize is None:
+        raise ValueError("Only learners with a Resize item transform can be exported")
+    normalize = next((tfm for tfm in learn.dls.valid.after_batch if type(tfm).__name__ == "Normalize"), None)
+
+    loss_name = type(learn.loss_func).__name__.lower()
+    if "crossentropy" in loss_name:
+        activation = "softmax"
+    elif "bce" in loss_name:
+        activation = "sigmoid"
+    else:
+        activation = None
+
+    return {
+        "vocab": [str(label) for label in learn.dls.vocab],
+        # FastAI stores Resize sizes as (width, height)
+        "size": [int(resize.size[0]), int(resize.size[1])],
+        "resize_method": str(resize.method),
+        "pad_mode": str(resize.pad_mode),
+        "mean": normalize.mean.flatten().tolist() if normalize is not None else None,
+        "std": normalize.std.flatten().tolist() if normalize is not None else None,
+        "activation": activation,
+    }
+
+
+def export_classifier(learner_path: str, output_path: str, opset: int):
+    learn = load_learner(learner_path, cpu=True)
+    metadata = classifier_metadata(learn)
+    width, height = metadata["size"]
+
+    model = learn.model.eval()
+    dummy = torch.zeros(1, 3, height, width)
+    torch.onnx.export(
+        model, dummy, output_path,
+        input_names=["image"], output_names=["logits"],
+        dynamic_axes={"image": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset
+    )
+    with open(metadata_path(output_path), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def export_detector(weights_path: str, output_path: str, opset: int, imgsz: int):
+    model = YOLO(weights_path)
+    exported = model.export(format="onnx", dynamic=True, simplify=True, imgsz=imgsz, opset=opset)
+    if os.path.abspath(exported) != os.path.abspath(output_path):
+        shutil.move(exported, output_path)
+    with open(metadata_path(output_path), "w") as f:
+        json.dump({"task": model.task, "imgsz": imgsz, "names": {int(k): v for k, v in model.names.items()}}, f, indent=2)
+
+
+def read_images(directory: str, count: int) -> list:
+    paths = sorted(glob.glob(os.path.join(directory, "*.jpg")) + glob.glob(os.path.join(directory, "*.jpeg")) + glob.glob(os.path.join(directory, "*.png")))
+    return [cv2.imread(path) for path in paths[:count]]
+
+
+def synthetic_images(count: int, seed: int) -> tuple:
+    """Synthetic BGR meter images and crops of their last three digits."""
+    meters = [synthetic_meter(800, 450, seed=seed + i) for i in range(count)]
+    digits = [extract_digit_image(meter.image, box) for meter in meters for box in meter.digit_boxes[-3:]]
+    return [meter.image for meter in meters], digits
+
+
+def classifier_parity(learner_path: str, onnx_path: str, images: list) -> dict:
+    learn = load_learner(learner_path, cpu=True)
+    onnx_model = OnnxClassifier(onnx_path)
+    max_diff, agree = 0.0, 0
+    for image in images:
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        torch_class, _, torch_probs = learn.predict(PILImage.create(rgb))
+        onnx_class, _, onnx_probs = onnx_model.predict(rgb)
+        max_diff = max(max_diff, float(np.abs(np.asarray(torch_probs) - onnx_probs).max()))
+        agree += str(torch_class) == onnx_class
+    return {"images": len(images), "top1_agreement": agree / len(images), "max_prob_diff": max_diff}
+
+
+def detector_parity(weights_path: str, onnx_path: str, images: list) -> dict:
+    torch_model = YOLO(weights_path)
+    onnx_model = OnnxOBBDetector(onnx_path)
+    same_reading, max_corner_diff = 0, 0.0
+    for image in images:
+        enhanced = enhance_image(image)
+        torch_digits = postprocess_digit_results(torch_model(enhanced, verbose=False))
+        onnx_digits = postprocess_digit_results(onnx_model(enhanced))
+        same_reading += torch_digits.reading == onnx_digits.reading
+        if len(torch_digits.boxes) == len(onnx_digits.boxes) and len(torch_digits.boxes):
+            max_corner_diff = max(max_corner_diff, float(np.abs(torch_digits.boxes - onnx_digits.boxes).max()))
+    return {"images": len(images), "reading_agreement": same_reading / len(images), "max_corner_diff_px": max_corner_diff}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=list(CLASSIFIERS + DETECTORS), choices=CLASSIFIERS + DETECTORS)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--imgsz", type=int, default=640, help="Detector input size")
+    parser.add_argument("--parity-only", action="store_true", help="Check models exported before")
+    parser.add_argument("--images", help="Directory of meter photos for the parity check")
+    parser.add_argument("--digit-images", help="Directory of single-digit crops for checking the colour model")
+    parser.add_argument("--num-images", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-prob-diff", type=float, default=1e-3)
+    parser.add_argument("--min-agreement", type=float, default=1.0)
+    args = parser.parse_args()
+
+    config = Config()
+    images, digit_images = synthetic_images(args.num_images, args.seed)
+    if args.images:
+        images = read_images(args.images, args.num_images)
+    if args.digit_images:
+        digit_images = read_images(args.digit_images, args.num_images)
+
+    failed = False
+    for name in args.models:
+        source = config.find(f"models.{name}")
+        target = config.find(f"inference.onnx.models.{name}")
+        if not args.parity_only:
+            print(f"Exporting {name}: {source} -> {target}")
+            if name in DETECTORS:
+                export_detector(source, target, args.opset, args.imgsz)
+            else:
+                export_classifier(source, target, args.opset)
+
+        if name in DETECTORS:
+            result = detector_parity(source, target, images)
+            ok = result["reading_agreement"] >= args.min_agreement
+        else:
+            result = classifier_parity(source, target, digit_images if name == "color_classification" else images)
+            ok = result["top1_agreement"] >= args.min_agreement and result["max_prob_diff"] <= args.max_prob_diff
+        failed |= not ok
+        print(f"{name}: {'OK' if ok else 'PARITY FAILED'} {json.dumps(result)}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Accuracy against latency of the INT8 model variants on feedback-labelled data.
+
+Reads the extractions with user feedback from flowvision_extraction_data,
+reads back and preprocesses their images as the service does, and runs every
+variant of each model on them: the fp32 export and the INT8 files written by
+tools.quantize_onnx. Per model and variant it reports:
+
+- accuracy: for the digit detector, the share of readings whose digits match
+  the reading confirmed or corrected by feedback; for the BFM classifier, the
+  share of images with such a reading classified "good"; for the colour
+  classifier (no colour feedback exists), agreement with the fp32 model on the
+  last digit found by the fp32 detector
+- agreement: share of predictions equal to the fp32 model's
+- latency: mean and p95 milliseconds per image, and the file size
+
+A variant is marked ACCEPT when it loses at most --max-accuracy-drop accuracy
+against fp32, otherwise REJECT. Set `inference.onnx.quantization.<model>` for
+the accepted ones.
+
+Run from the repository root:
+    PYTHONPATH=src python -m tools.quantization_report --limit 1000 --output quantization.json
+"""
+import os
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from conf.config import Config
+from service.vision.onnx_backend import QUANTIZATION_MODES, OnnxClassifier, OnnxOBBDetector, quantized_path
+from service.vision.inference_utils import classify_bfm_image, classify_color_image, direct_recognize_meter_reading
+from tools.stored_images import digit_crops, fetch_images, labelled_rows, preprocess, true_reading
+
+
+MODELS = ("bfm_classification", "individual_numbers", "color_classification")
+
+
+def variants(config: Config, name: str) -> dict:
+    """Existing model files per variant, fp32 first."""
+    model_path = config.find(f"inference.onnx.models.{name}")
+    paths = {"fp32": model_path}
+    for mode in QUANTIZATION_MODES:
+        if os.path.exists(quantized_path(model_path, mode)):
+            paths[f"int8-{mode}"] = quantized_path(model_path, mode)
+    return paths
+
+
+def load(config: Config, name: str, model_path: str):
+    threads = {
+        "intra_op_threads": config.find(f"inference.onnx.threads.{name}.intra_op", default=config.find("inference.onnx.intra_op_threads", default=0)),
+        "inter_op_threads": config.find(f"inference.onnx.threads.{name}.inter_op", default=config.find("inference.onnx.inter_op_threads", default=0)),
+    }
+    if name == "individual_numbers":
+        return OnnxOBBDetector(model_path, **threads)
+    return OnnxClassifier(model_path, **threads)
+
+
+def predict_all(name: str, model, inputs: list) -> tuple:
+    """Predictions (a reading or a class per input) and seconds per input."""
+    predictions, latencies = [], []
+    for item in inputs:
+        start_time = time.perf_counter()
+        if name == "individual_numbers":
+            detections = direct_recognize_meter_reading(item, model)
+            prediction = None if isinstance(detections, str) else detections.reading
+        elif name == "bfm_classification":
+            prediction = classify_bfm_image(item, model)["prediction"]
+        else:
+            prediction = classify_color_image(item, model)["prediction"]
+        latencies.append(time.perf_counter() - start_time)
+        predictions.append(prediction)
+    return predictions, latencies
+
+
+def accuracy(name: str, predictions: list, truths: list, reference: list) -> float | None:
+    if name == "color_classification":
+        pairs = list(zip(predictions, reference))
+    elif name == "bfm_classification":
+        pairs = [(prediction, "good") for prediction, truth in zip(predictions, truths) if truth is not None]
+    else:
+        pairs = [(prediction, truth) for prediction, truth in zip(predictions, truths) if truth is not None]
+    return sum(prediction == expected for prediction, expected in pairs) / len(pairs) if pairs else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=MODELS)
+    parser.add_argument("--limit", type=int, default=500, help="Most recent labelled extractions to use")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    config = Config()
+    rows, images, skipped = fetch_images(config, labelled_rows(config, args.limit))
+    print(f"{len(rows)} labelled extractions ({skipped} images could not be read)")
+    if not rows:
+        return
+    frames = preprocess(config, images)
+    truths = [true_reading(row) for row in rows]
+
+    fp32_detector = load(config, "individual_numbers", config.find("inference.onnx.models.individual_numbers"))
+    inputs = {
+        "bfm_classification": [frame.rgb() for frame in frames],
+        "individual_numbers": [frame.bgr() for frame in frames],
+        # One last-digit crop per image where the fp32 detector found digits
+        "color_classification": [crops[-1] for crops in (digit_crops(frame, fp32_detector, count=1) for frame in frames) if crops],
+    }
+
+    report = {}
+    print(f"\n{'model':<22} {'variant':<13} {'inputs':>6} {'accuracy':>9} {'agreement':>9} {'mean ms':>8} {'p95 ms':>8} {'MB':>7}  decision")
+    for name in args.models:
+        report[name] = {}
+        reference = None
+        for variant, model_path in variants(config, name).items():
+            model = load(config, name, model_path)
+            predictions, latencies = predict_all(name, model, inputs[name])
+            reference = predictions if reference is None else reference
+            result = {
+                "path": model_path,
+                "inputs": len(predictions),
+                "accuracy": accuracy(name, predictions, truths, reference),
+                "agreement": sum(a == b for a, b in zip(predictions, reference)) / len(predictions) if predictions else None,
+                "mean_ms": float(np.mean(latencies) * 1000) if latencies else None,
+                "p95_ms": float(np.percentile(latencies, 95) * 1000) if latencies else None,
+                "size_mb": os.path.getsize(model_path) / (1024 * 1024),
+            }
+            fp32 = report[name].get("fp32")
+            if fp32 is not None and result["accuracy"] is not None and fp32["accuracy"] is not None:
+                result["decision"] = "ACCEPT" if fp32["accuracy"] - result["accuracy"] <= args.max_accuracy_drop else "REJECT"
+            report[name][variant] = result
+            print(
+                f"{name:<22} {variant:<13} {result['inputs']:>6} {_percent(result['accuracy']):>9} {_percent(result['agreement']):>9} "
+                f"{_number(result['mean_ms']):>8} {_number(result['p95_ms']):>8} {result['size_mb']:>7.1f}  {result.get('decision', '')}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"labelled_extractions": len(rows), "max_accuracy_drop": args.max_accuracy_drop, "models": report}, file, indent=2)
+
+
+def _percent(value):
+    return "-" if value is None else f"{value:.1%}"
+
+
+def _number(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Write INT8 variants of the exported ONNX models.
+
+For each model in `inference.onnx.models` (written by tools.export_onnx) this
+writes <model>.int8-dynamic.onnx and/or <model>.int8-static.onnx next to it,
+together with a copy of its metadata file:
+
+- dynamic: weights are quantized ahead of time and activations per call;
+  needs no data.
+- static: weights and activations are quantized ahead of time (QDQ, per
+  channel), with activation ranges calibrated on stored images: the images of
+  the most recent successful extractions in flowvision_extraction_data, or
+  the files in --calibration-images. Each model is calibrated on what it sees
+  in the service: preprocessed frames for the BFM classifier, enhanced frames
+  for the digit detector and crops of the last digits, found by the fp32
+  detector, for the colour classifier.
+
+The service loads a variant once `inference.onnx.quantization.<model>` is set
+to its mode; compare the variants with tools.quantization_report first.
+
+Run from the repository root:
+    PYTHONPATH=src python -m tools.quantize_onnx
+    PYTHONPATH=src python -m tools.quantize_onnx --models individual_numbers --modes static --calibration-images photos/
+"""
+import os
+import shutil
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from conf.config import Config
+from service.vision.onnx_backend import QUANTIZATION_MODES, OnnxClassifier, OnnxOBBDetector, metadata_path, quantized_path
+from service.vision.inference_utils import enhance_image
+from tools.stored_images import calibration_rows, digit_crops, fetch_images, preprocess, read_image_files
+
+
+MODELS = ("bfm_classification", "individual_numbers", "color_classification")
+
+
+class ArrayCalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed model inputs to the calibrator in batches."""
+
+    def __init__(self, input_name: str, samples: list, batch_size: int = 8):
+        self.input_name = input_name
+        self.batches = [np.stack(samples[i:i + batch_size]) for i in range(0, len(samples), batch_size)]
+        self.position = 0
+
+    def get_next(self):
+        if self.position >= len(self.batches):
+            return None
+        batch = self.batches[self.position]
+        self.position += 1
+        return {self.input_name: batch}
+
+    def rewind(self):
+        self.position = 0
+
+
+def calibration_samples(name: str, model, frames: list, detector: OnnxOBBDetector) -> list:
+    """Model inputs for the frames, preprocessed as the model itself does."""
+    if name == "bfm_classification":
+        return [model.preprocess(frame.rgb()) for frame in frames]
+    if name == "individual_numbers":
+        return [model.letterbox(enhance_image(frame.bgr()))[0] for frame in frames]
+    crops = [crop for frame in frames for crop in digit_crops(frame, detector)]
+    return [model.preprocess(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)) for crop in crops]
+
+
+def quantize(model_path: str, mode: str, calibration_reader: CalibrationDataReader | None = None) -> str:
+    output_path = quantized_path(model_path, mode)
+    if mode == "dynamic":
+        # ONNX Runtime's CPU ConvInteger kernel only takes unsigned weights
+        quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            # Shape inference and graph fusion first, as ONNX Runtime recommends for static quantization
+            prepared_path = os.path.join(workdir, "prepared.onnx")
+            quant_pre_process(model_path, prepared_path)
+            quantize_static(
+                prepared_path, output_path, calibration_reader,
+                quant_format=QuantFormat.QDQ, per_channel=True,
+                activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8
+            )
+    shutil.copyfile(metadata_path(model_path), metadata_path(output_path))
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=list(MODELS), choices=MODELS)
+    parser.add_argument("--modes", nargs="+", default=list(QUANTIZATION_MODES), choices=QUANTIZATION_MODES)
+    parser.add_argument("--calibration-images", help="Directory of meter photos to calibrate on instead of stored images")
+    parser.add_argument("--num-images", type=int, help="Calibration images (default: inference.onnx.calibration.num_images)")
+    args = parser.parse_args()
+
+    config = Config()
+    model_paths = {name: config.find(f"inference.onnx.models.{name}") for name in MODELS}
+
+    frames = []
+    if "static" in args.modes:
+        num_images = args.num_images or config.find("inference.onnx.calibration.num_images", default=200)
+        if args.calibration_images:
+            images = read_image_files(args.calibration_images, num_images)
+        else:
+            _, images, skipped = fetch_images(config, calibration_rows(config, num_images))
+            print(f"Fetched {len(images)} stored images for calibration ({skipped} could not be read)")
+        if not images:
+            parser.error("No calibration images; pass --calibration-images or quantize with --modes dynamic")
+        frames = preprocess(config, images)
+
+    # The colour model is calibrated on digits found by the fp32 detector
+    detector = OnnxOBBDetector(model_paths["individual_numbers"]) if frames and "color_classification" in args.models else None
+
+    for name in args.models:
+        model_path = model_paths[name]
+        for mode in args.modes:
+            reader = None
+            if mode == "static":
+                model = OnnxOBBDetector(model_path) if name == "individual_numbers" else OnnxClassifier(model_path)
+                samples = calibration_samples(name, model, frames, detector)
+                reader = ArrayCalibrationReader(model.input_name, samples)
+                print(f"Calibrating {name} on {len(samples)} inputs")
+            output_path = quantize(model_path, mode, reader)
+            size = os.path.getsize(output_path) / os.path.getsize(model_path)
+            print(f"{name} {mode}: {output_path} ({size:.0%} of fp32 size)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Images of past extractions, read back for the model tools.
+
+Rows come from flowvision_extraction_data through DatabaseService (so
+DATABASE_URL works here too). Images stored in our bucket are read through
+StorageService's boto3 client, using the object key in their stored
+image_url: that URL is a presigned GET URL that has long expired. Other
+image URLs are downloaded over HTTP. Rows whose image cannot be read are
+skipped and counted.
+"""
+import os
+import re
+import glob
+
+import httpx
+from botocore.exceptions import BotoCoreError, ClientError
+
+from conf import queries
+from conf.config import Config
+from service.api.database import DatabaseService
+from service.api.image_service import preprocessing_service
+from service.api.storage_service import StorageService
+from service.vision.image_frame import ImageFrame
+from service.vision.inference_utils import direct_recognize_meter_reading, extract_digit_image
+
+
+def calibration_rows(config: Config, limit: int) -> list:
+    return DatabaseService(config).fetch_all(queries.select_calibration_images, {"limit": limit})
+
+
+def labelled_rows(config: Config, limit: int) -> list:
+    return DatabaseService(config).fetch_all(queries.select_labelled_extractions, {"limit": limit})
+
+
+def true_reading(row: dict) -> str | None:
+    """Digits of the reading confirmed or corrected by feedback, None if unknown."""
+    reading = row["meter_reading"] if row["extracted_reading_accurate"] else row["actual_reading"]
+    if reading is None:
+        return None
+    digits = re.sub(r"\D", "", str(reading))
+    return digits or None
+
+
+def fetch_images(config: Config, rows: list, timeout: float = 30) -> tuple:
+    """
+    Returns:
+        Tuple of the rows whose image could be read, their image bytes and the
+        number of rows skipped
+    """
+    storage_service = StorageService(config)
+    fetched, images, skipped = [], [], 0
+    with httpx.Client(timeout=timeout, follow_redirects=True) as client:
+        for row in rows:
+            object_key = storage_service.object_key_from_url(row["image_url"])
+            try:
+                if object_key is not None:
+                    image = storage_service.read_image(object_key)
+                else:
+                    response = client.get(row["image_url"])
+                    response.raise_for_status()
+                    image = response.content
+            except (ClientError, BotoCoreError, httpx.HTTPError):
+                skipped += 1
+                continue
+            fetched.append(row)
+            images.append(image)
+    return fetched, images, skipped
+
+
+def read_image_files(directory: str, limit: int) -> list:
+    paths = sorted(glob.glob(os.path.join(directory, "*.jpg")) + glob.glob(os.path.join(directory, "*.jpeg")) + glob.glob(os.path.join(directory, "*.png")))
+    images = []
+    for path in paths[:limit]:
+        with open(path, "rb") as file:
+            images.append(file.read())
+    return images
+
+
+def preprocess(config: Config, images: list) -> list:
+    """ImageFrames as the service hands them to the models."""
+    service = preprocessing_service(config)
+    return [service.preprocess_image(image) for image in images]
+
+
+def digit_crops(frame: ImageFrame, detector, count: int = 3) -> list:
+    """BGR crops of the last `count` digits found by `detector`, as the colour stage sees them."""
+    detections = direct_recognize_meter_reading(frame.bgr(), detector)
+    if isinstance(detections, str):
+        return []
+    return [extract_digit_image(frame.bgr(), box) for box in detections.boxes[-count:]]
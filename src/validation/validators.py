@@ -1,30 +1,116 @@
 from error.error import CustomHTTPException, ErrorCode
 from http import HTTPStatus
-import filetype
 
 from conf.config import Config
 from models.models import ImageUploadRequest
 
 
+# Leading bytes of the accepted formats
+MAGIC_BYTES = {
+    "png": b"\x89PNG\r\n\x1a\n",
+    "jpeg": b"\xff\xd8\xff",
+}
+
+# JPEG start-of-frame markers, which carry the image dimensions (not DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+_JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7}
+
+
+def detect_image_type(data: bytes) -> str | None:
+    """Image type ("jpeg" or "png") from the leading bytes, or None if they match neither."""
+    for image_type, magic in MAGIC_BYTES.items():
+        if data.startswith(magic):
+            return image_type
+    return None
+
+
+def image_dimensions(data: bytes, image_type: str) -> tuple | None:
+    """
+    Pixel dimensions from the image header, without decoding the image.
+
+    Args:
+        data: Leading bytes of the image, as many as have been read
+        image_type: "jpeg" or "png"
+
+    Returns:
+        (width, height), or None if `data` ends before the dimensions
+
+    Raises:
+        ValueError: If the header is malformed
+    """
+    if image_type == "png":
+        # The IHDR chunk always comes first: length, type, width, height
+        if len(data) < 24:
+            return None
+        if data[12:16] != b"IHDR":
+            raise ValueError("PNG does not start with an IHDR chunk")
+        return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+
+    # JPEG: walk the marker segments up to the start of frame
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise ValueError("Expected a JPEG marker")
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # Fill byte
+            position += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            position += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ValueError("JPEG has no frame header before its scan data")
+        if marker in _JPEG_SOF_MARKERS:
+            # Length, precision, height, width
+            if position + 9 > len(data):
+                return None
+            return int.from_bytes(data[position + 7:position + 9], "big"), int.from_bytes(data[position + 5:position + 7], "big")
+        length = int.from_bytes(data[position + 2:position + 4], "big")
+        if length < 2:
+            raise ValueError("Invalid JPEG segment length")
+        position += 2 + length
+    return None
+
+
 class ImageValidator:
+    """
+    Streaming validation of uploaded images.
+
+    The upload is read in `upload_validation.chunk_size` chunks into one
+    growing buffer. The file type is checked on the magic bytes of the first
+    chunk and the pixel dimensions on the JPEG frame or PNG IHDR header as soon
+    as it has arrived, so oversized files, other formats and decompression
+    bombs (more than `upload_validation.max_pixels` pixels) are rejected
+    without reading the rest of the upload or decoding anything.
+    """
     accepted_file_types = ['image/jpeg', 'image/jpg', 'image/png', 'jpeg', 'jpg', 'png']
 
     def __init__(self, config: Config):
         self.config = config
         self.file_size_limit = self.config.find("file_size_limit", default=20971520)
+        self.chunk_size = self.config.find("upload_validation.chunk_size", default=1048576)
+        self.max_pixels = self.config.find("upload_validation.max_pixels", default=100000000)
 
     async def validate(self, request: ImageUploadRequest):
         image_content_type = request.image.content_type
         image_size = request.image.size
         image_name = request.image.filename
-        image_bytes = bytes()
+        image_bytes = bytearray()
+        image_type = None
+        dimensions = None
 
         self._validate_image_type(content_type=image_content_type)
         self._validate_image_size(image_size=image_size)
 
-        while content := await request.image.read(1024):
-            image_bytes = image_bytes + content
+        while content := await request.image.read(self.chunk_size):
+            image_bytes += content
             self._validate_image_size(image_size=len(image_bytes))
+            if image_type is None and len(image_bytes) >= max(len(magic) for magic in MAGIC_BYTES.values()):
+                image_type = self._validate_magic_bytes(image_bytes)
+            if image_type is not None and dimensions is None:
+                dimensions = self._validate_dimensions(image_bytes, image_type)
 
         if len(image_bytes) == 0:
             raise CustomHTTPException(
@@ -33,18 +119,18 @@ class ImageValidator:
                 detail="A valid jpg or png image must be provided."
             )
 
-        file_info = filetype.guess(image_bytes)
-        if not file_info:
+        # Files shorter than the longest magic number
+        if image_type is None:
+            image_type = self._validate_magic_bytes(image_bytes)
+            dimensions = self._validate_dimensions(image_bytes, image_type)
+        if dimensions is None:
             raise CustomHTTPException(
-                status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE.value,
-                error_code=ErrorCode.UNSUPPORTED_FILE_TYPE_ERROR.value,
-                detail="Unable to determine file type.",
+                status_code=HTTPStatus.BAD_REQUEST.value,
+                error_code=ErrorCode.INVALID_FILE_ERROR.value,
+                detail=f"Truncated {image_type} image: no image dimensions found."
             )
 
-        detected_content_type = file_info.extension.lower()
-        self._validate_image_type(content_type=detected_content_type)
-
-        return image_bytes, image_content_type, image_name
+        return bytes(image_bytes), image_content_type, image_name
 
     def _validate_image_type(self, content_type: str):
         if (content_type not in self.accepted_file_types):
@@ -61,3 +147,41 @@ class ImageValidator:
                 error_code=ErrorCode.FILE_SIZE_ERROR.value,
                 detail=f"Image File is too large. File must be less than {self.file_size_limit} bytes.",
             )
+
+    def _validate_magic_bytes(self, image_bytes: bytes) -> str:
+        image_type = detect_image_type(image_bytes)
+        if image_type is None:
+            raise CustomHTTPException(
+                status_code=HTTPStatus.UNSUPPORTED_MEDIA_TYPE.value,
+                error_code=ErrorCode.UNSUPPORTED_FILE_TYPE_ERROR.value,
+                detail="Unable to determine file type.",
+            )
+        self._validate_image_type(content_type=image_type)
+        return image_type
+
+    def _validate_dimensions(self, image_bytes: bytes, image_type: str) -> tuple | None:
+        try:
+            dimensions = image_dimensions(image_bytes, image_type)
+        except ValueError as e:
+            raise CustomHTTPException(
+                status_code=HTTPStatus.BAD_REQUEST.value,
+                error_code=ErrorCode.INVALID_FILE_ERROR.value,
+                detail=f"Invalid {image_type} image: {e}"
+            )
+        if dimensions is None:
+            return None
+
+        width, height = dimensions
+        if width == 0 or height == 0:
+            raise CustomHTTPException(
+                status_code=HTTPStatus.BAD_REQUEST.value,
+                error_code=ErrorCode.INVALID_FILE_ERROR.value,
+                detail=f"Invalid {image_type} image: {width}x{height} pixels."
+            )
+        if width * height > self.max_pixels:
+            raise CustomHTTPException(
+                status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE.value,
+                error_code=ErrorCode.IMAGE_DIMENSIONS_ERROR.value,
+                detail=f"Image is too large: {width}x{height} pixels. At most {self.max_pixels} pixels are allowed."
+            )
+        return dimensions